@@ -8,6 +8,7 @@ from product.models import Discount
 from satchmo_store.shop.models import Config
 from satchmo_utils.numbers import trunc_decimal
 from satchmo_utils import add_month
+from satchmo_utils.httppool import http_request
 from six.moves import urllib
 from tax.utils import get_tax_processor
 from xml.dom import minidom
@@ -459,10 +460,8 @@ class PaymentProcessor(BasePaymentProcessor):
             self.log_extra('Posting data to: %s\n%s', data['connection'], redacted)
 
         headers = {'Content-type':'text/xml'}
-        conn = urllib.request.Request(data['connection'], request, headers)
         try:
-            f = urllib.request.urlopen(conn)
-            all_results = f.read()
+            all_results = http_request(data['connection'], data=request, headers=headers).read()
             if isinstance(all_results, bytes):
                 all_results = all_results.decode("utf-8")
         except urllib.error.URLError as ue:
@@ -526,10 +525,8 @@ class PaymentProcessor(BasePaymentProcessor):
             post_data = data['postString'].encode("utf-8")
         else:
             post_data = data['postString']
-        conn = urllib.request.Request(url=data['connection'], data=post_data)
         try:
-            f = urllib.request.urlopen(conn)
-            all_results = f.read()
+            all_results = http_request(data['connection'], data=post_data).read()
             if isinstance(all_results, bytes):
                 all_results = all_results.decode("utf-8")
             self.log_extra('Authorize response: %s', all_results)
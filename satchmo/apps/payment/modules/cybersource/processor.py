@@ -1,5 +1,6 @@
 from django.template import loader
 from payment.modules.base import BasePaymentProcessor, ProcessorResult
+from satchmo_utils.httppool import http_request
 from satchmo_utils.numbers import trunc_decimal
 from django.utils.translation import gettext_lazy as _
 from six.moves import urllib
@@ -130,16 +131,14 @@ class PaymentProcessor(BasePaymentProcessor):
             'card' : self.card,
         }
         request = t.render(c)
-        conn = urllib.request.Request(url=self.connection, data=request)
         try:
-            f = urllib.request.urlopen(conn)
+            all_results = http_request(self.connection, data=request).read()
         except urllib.error.HTTPError as e:
             # we probably didn't authenticate properly
             # make sure the 'v' in your account number is lowercase
             return ProcessorResult(self.key, False, 'Problem parsing results')
 
-        f = urllib.request.urlopen(conn)
-        all_results = f.read()
+
         tree = fromstring(all_results)
         parsed_results = tree.getiterator('{urn:schemas-cybersource-com:transaction-data-1.26}reasonCode')
         try:
@@ -7,6 +7,7 @@ from django.utils.http import urlencode
 from django.utils.translation import gettext_lazy as _
 
 from payment.modules.base import BasePaymentProcessor, ProcessorResult
+from satchmo_utils.httppool import http_request
 
 TEST_CARDS = ["4111111111111111", "5431111111111111", "6011601160116611", "341111111111111", "30205252489926", "3541963594572595", "6799990100000000019"]
 
@@ -196,9 +197,7 @@ class PaymentProcessor(BasePaymentProcessor):
         post_data = urlencode(data)
 
         try:
-            conn = urllib.request.Request(url=self.settings.CONNECTION.value, data=post_data.encode("utf-8"))
-            f = urllib.request.urlopen(conn)
-            all_results = f.read().decode("utf-8")
+            all_results = http_request(self.settings.CONNECTION.value, data=post_data).read().decode("utf-8")
 
             temp = urllib.parse.parse_qs(all_results)
             responses = {}
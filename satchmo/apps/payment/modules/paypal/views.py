@@ -18,8 +18,8 @@ from satchmo_store.shop.models import Cart
 from satchmo_store.shop.models import Order, OrderPayment
 from satchmo_store.contact.models import Contact
 from satchmo_utils.dynamic import lookup_url, lookup_template
+from satchmo_utils.httppool import http_request
 from satchmo_utils.views import bad_or_missing
-from six.moves import urllib
 from sys import exc_info
 from traceback import format_exception
 import logging
@@ -198,17 +198,18 @@ def confirm_ipn_data(query_string, PP_URL):
 
     params = b'cmd=_notify-validate&' + query_string
 
-    req = urllib.request.Request(PP_URL)
-    req.add_header("Content-type", "application/x-www-form-urlencoded")
-    req.add_header("user-agent", "Python-IPN-Verification-Script")
-    fo = urllib.request.urlopen(req, params)
+    headers = {
+        "Content-type": "application/x-www-form-urlencoded",
+        "user-agent": "Python-IPN-Verification-Script",
+    }
+    fo = http_request(PP_URL, data=params, headers=headers)
 
     ret = fo.read()
     if ret.decode() == "VERIFIED":
         log.info("PayPal IPN data verification was successful.")
     else:
         log.info("PayPal IPN data verification failed.")
-        log.debug("HTTP code %s, response text: '%s'" % (fo.code, ret))
+        log.debug("HTTP code %s, response text: '%s'" % (fo.getcode(), ret))
         return False
 
     return True
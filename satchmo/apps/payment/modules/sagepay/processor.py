@@ -10,6 +10,7 @@ will fall back to the defaults for any not specified in your dictionary.
 from django.conf import settings
 from django.utils.translation import gettext_lazy as _
 from payment.modules.base import BasePaymentProcessor, ProcessorResult
+from satchmo_utils.httppool import http_request
 from satchmo_utils.numbers import trunc_decimal
 from django.utils.http import urlencode
 import forms
@@ -153,10 +154,8 @@ class PaymentProcessor(BasePaymentProcessor):
 
             else:
                 self.log_extra("About to post to server: %s?%s", self.url, self.postString)
-                conn = urllib.request.Request(self.url, data=self.postString)
                 try:
-                    f = urllib.request.urlopen(conn)
-                    result = f.read()
+                    result = http_request(self.url, data=self.postString).read()
                     self.log_extra('Process: url=%s\nPacket=%s\nResult=%s', self.url, self.packet, result)
 
                 except urllib.error.URLError as ue:
@@ -61,6 +61,35 @@ config_register_list(
         default=True
     ),
     
+    StringValue(PRODUCT_GROUP,
+        'SEARCH_BACKEND',
+        description=_("Product search backend"),
+        help_text=_("The indexed backend ranks its results and avoids scanning the product table, run satchmo_rebuild_search_index after selecting it."),
+        default='product.search.SimpleSearchBackend',
+        choices=[('product.search.SimpleSearchBackend', _('Simple')),
+                 ('product.search.IndexedSearchBackend', _('Indexed'))]
+    ),
+
+    PositiveIntegerValue(PRODUCT_GROUP,
+        'SEARCH_PAGE_SIZE',
+        description=_("Search results per page"),
+        default=20
+    ),
+
+    PositiveIntegerValue(PRODUCT_GROUP,
+        'SEARCH_COUNT_LIMIT',
+        description=_("Search result count limit"),
+        help_text=_("Stop counting search results at this number and display it as a lower bound, so that broad searches are not counted in full.  Use 0 for exact counts."),
+        default=1000
+    ),
+
+    BooleanValue(PRODUCT_GROUP,
+        'DEFER_PRICE_LOOKUPS',
+        description=_("Defer price lookup updates?"),
+        help_text=_("If yes, product and price changes are journaled and the price lookups are only updated by satchmo_process_pricing, which should be run from a cron job."),
+        default=False
+    ),
+
     BooleanValue(PRODUCT_GROUP,
         'SHOW_NO_PHOTO_IN_CATEGORY',
         description=_("Display Photo Not Available Image in the category page?"),
@@ -492,18 +492,24 @@ class VariationManagerForm(forms.Form):
         #dirty is a comma delimited list of groupid__optionid strings
         dirty = self.cleaned_data['dirty'].split(',')
         if dirty:
+            created = []
             for key in dirty:
                 # this is the keep/create checkbox field
                 try:
                     keep = data["pv__" + key]
                     opts = _get_options_for_key(key, optiondict)
                     if opts:
-                        if keep:
+                        if not keep:
+                            self._delete_variation(opts, request)
+                        elif "pv__" + key in self.existing:
                             self._create_variation(opts, key, data, request)
                         else:
-                            self._delete_variation(opts, request)
+                            # new variations are created together below
+                            created.append((opts, data["name__" + key], data["sku__" + key], data["slug__" + key]))
                 except KeyError:
                     pass
+            if created:
+                self._create_variations(created, request)
 
     def _create_variation(self, opts, key, data, request):
         namekey = "name__" + key
@@ -522,6 +528,12 @@ class VariationManagerForm(forms.Form):
         messages.add_message(request, messages.INFO, 'Created %s' % v)
         return v
 
+    def _create_variations(self, variations, request):
+        created = self.product.configurableproduct.create_variations(variations)
+        log.info('Created %i variations for %s', len(created), self.product.slug)
+        messages.add_message(request, messages.INFO, 'Created %i variations' % len(created))
+        return created
+
     def _delete_variation(self, opts, request):
         variation = self.product.configurableproduct.get_product_from_options(opts)
         if variation:
@@ -0,0 +1,9 @@
+from django_extensions.management.jobs import HourlyJob
+from product.models import ProductPriceLookup
+
+class Job(HourlyJob):
+    help = "Apply journaled product changes to the pricing lookup table."
+
+    def execute(self):
+        while ProductPriceLookup.objects.process_changes(limit=1000)[0]:
+            pass
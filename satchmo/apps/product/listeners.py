@@ -2,7 +2,8 @@ from decimal import Decimal, InvalidOperation
 from django.contrib.sites.models import Site
 from django.db.models import Q
 from livesettings.functions import config_value
-from product.models import Product, Category, Discount
+from product.models import Product, Category, Discount, ProductRanking
+from product.search import get_search_backend
 import logging
 
 log = logging.getLogger('search listener')
@@ -21,31 +22,29 @@ def default_product_search_listener(sender, request=None, category=None, keyword
     if category:
         categories = Category.objects.active(site=site, slug=category)
         if categories:
-            categories = categories[0].get_active_children(include_self=True)
+            # the category first, then its children, without loading them
+            categories = categories[0]._descendants(only_active=True, include_self=True).order_by(
+                'ancestor_links__depth', 'ordering', 'name')
         products = products.filter(category__in=categories)
     else:
         #automatically assumes active categories only
         categories = Category.objects.by_site(site=site)
 
-    log.debug('initial: %s', list(products))
-
-    for keyword in keywords:
-        if not category:
+    keywords = list(keywords)
+    if not category:
+        for keyword in keywords:
             categories = categories.filter(
                 Q(name__icontains=keyword) |
                 Q(meta__icontains=keyword) |
                 Q(description__icontains=keyword))
 
-        products = products.filter(
-            Q(name__icontains=keyword)
-            | Q(short_description__icontains=keyword)
-            | Q(description__icontains=keyword)
-            | Q(meta__icontains=keyword)
-            | Q(sku__iexact=keyword) )
+    backend = get_search_backend()
+    products = backend.search(products, keywords)
 
     results.update({
         'categories': categories,
-        'products': products
+        'products': products,
+        'products_ordering': backend.ordering,
         })
 
 def priceband_search_listener(sender, request=None, category=None, keywords=[], results={}, **kwargs):
@@ -107,3 +106,17 @@ def discount_used_listener(sender, order=None, **kwargs):
             discount.save()
         except Discount.DoesNotExist:
             pass
+
+def ranking_sales_listener(sender, order=None, **kwargs):
+    """Count the units of the order towards the bestsellers.
+
+    satchmo_store.shop.signals.order_success listener set up in shop.listeners.
+    """
+    ProductRanking.objects.add_sales(order)
+
+def ranking_cancel_listener(sender, order=None, **kwargs):
+    """Take the units of the order off the bestsellers.
+
+    satchmo_store.shop.signals.order_cancelled listener set up in shop.listeners.
+    """
+    ProductRanking.objects.remove_sales(order)
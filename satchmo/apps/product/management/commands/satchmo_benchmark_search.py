@@ -0,0 +1,31 @@
+from django.contrib.sites.models import Site
+from django.core.management.base import BaseCommand
+from product.models import Product
+from product.search import IndexedSearchBackend, SimpleSearchBackend
+import time
+
+class Command(BaseCommand):
+    help = "Compares the simple and indexed product search backends on the given keywords."
+
+    def add_arguments(self, parser):
+        parser.add_argument('keywords', nargs='+')
+        parser.add_argument('--repeat', type=int, dest='repeat', default=10,
+            help="Number of searches timed for each backend.")
+        parser.add_argument('--page-size', type=int, dest='page_size', default=20,
+            help="Number of results fetched by each search.")
+
+    def handle(self, *keywords, **options):
+        keywords = keywords or options['keywords']
+        repeat = options.get('repeat', 10)
+        page_size = options.get('page_size', 20)
+        site = Site.objects.get_current()
+
+        for backend in (SimpleSearchBackend(), IndexedSearchBackend()):
+            started = time.time()
+            for i in range(repeat):
+                products = backend.search(Product.objects.active_by_site(site=site), keywords)
+                ct = products.count()
+                page = list(products[:page_size])
+            elapsed = (time.time() - started) / repeat
+            print("%s: %i results, %.2fms per search (count and first %i)" % (
+                backend.__class__.__name__, ct, elapsed * 1000, len(page)))
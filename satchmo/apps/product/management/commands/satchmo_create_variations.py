@@ -0,0 +1,28 @@
+from django.core.management.base import BaseCommand
+from product.modules.configurable.models import ConfigurableProduct
+import time
+
+class Command(BaseCommand):
+    help = "Creates the missing variations of configurable products, for every combination of their options."
+
+    def add_arguments(self, parser):
+        parser.add_argument('slugs', nargs='*',
+            help="Slugs of the configurable products, all of them if none are given.")
+
+    def handle(self, *slugs, **options):
+        verbosity = int(options.get('verbosity', 1))
+        slugs = slugs or options.get('slugs') or []
+
+        products = ConfigurableProduct.objects.select_related('product').order_by('product__slug')
+        if slugs:
+            products = products.filter(product__slug__in=slugs)
+            found = set([cp.product.slug for cp in products])
+            for slug in slugs:
+                if slug not in found:
+                    print("Warning: Could not find configurable product '%s'" % slug)
+
+        for cp in products:
+            started = time.time()
+            created = cp.create_variations()
+            if verbosity > 0:
+                print("Created %i variations for %s in %.2fs" % (len(created), cp.product.slug, time.time() - started))
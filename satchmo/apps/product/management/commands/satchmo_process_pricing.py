@@ -0,0 +1,29 @@
+from django.core.management.base import BaseCommand
+from product.models import ProductPriceLookup
+
+class Command(BaseCommand):
+    help = ("Applies journaled product and price changes to the Satchmo pricing lookup table. "
+            "Only needed when PRODUCT.DEFER_PRICE_LOOKUPS is enabled.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, dest='batch_size', default=1000,
+            help="Number of journal entries processed per pass.")
+
+    def handle(self, **options):
+        verbosity = int(options.get('verbosity', 1))
+        batch_size = options.get('batch_size', 1000)
+
+        entries = created = updated = deleted = 0
+        while True:
+            ct, counts = ProductPriceLookup.objects.process_changes(limit=batch_size)
+            if not ct:
+                break
+            entries += ct
+            created += counts[0]
+            updated += counts[1]
+            deleted += counts[2]
+            if verbosity > 1:
+                print("Processed %i changes: %i created, %i updated, %i deleted" % ((ct,) + counts))
+
+        if verbosity > 0:
+            print("Processed %i changes: %i prices created, %i updated, %i deleted" % (entries, created, updated, deleted))
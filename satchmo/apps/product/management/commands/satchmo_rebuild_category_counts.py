@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+from product.models import CategoryProductCount
+import time
+
+class Command(BaseCommand):
+    help = "Counts the active products of every category again."
+
+    def handle(self, **options):
+        verbosity = int(options.get('verbosity', 1))
+        started = time.time()
+        CategoryProductCount.objects.rebuild()
+        if verbosity > 0:
+            print("Counted %i category rows in %.2fs" % (CategoryProductCount.objects.count(), time.time() - started))
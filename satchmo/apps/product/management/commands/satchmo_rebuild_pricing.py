@@ -1,19 +1,28 @@
 from django.contrib.sites.models import Site
 from django.core.management.base import BaseCommand
 from product.models import Product, ProductPriceLookup
+import time
 
 class Command(BaseCommand):
     help = "Builds Satcho Product pricing lookup tables."
-    args = ['sitename...']
 
     requires_model_validation = True
 
+    def add_arguments(self, parser):
+        parser.add_argument('sitenames', nargs='*')
+        parser.add_argument('--bulk', action='store_true', dest='bulk', default=False,
+            help="Compute the lookups in memory and write them with bulk inserts.")
+        parser.add_argument('--chunk-size', type=int, dest='chunk_size', default=500,
+            help="Number of products per transaction when using --bulk.")
+
     def handle(self, *sitenames, **options):
         verbosity = int(options.get('verbosity', 1))
+        sitenames = sitenames or options.get('sitenames') or []
+        bulk = options.get('bulk', False)
         if len(sitenames) == 0:
             if verbosity>0:
                 print("Rebuilding pricing for all products for all sites")
-                sites = Site.objects.all()
+            sites = Site.objects.all()
         else:
             sites = []
             for sitename in sitenames:
@@ -23,36 +32,47 @@ class Command(BaseCommand):
                     print("Warning: Could not find site '%s'" % sitename)
 
         total = 0
+        started = time.time()
         for site in sites:
             ct = 0
+            site_started = time.time()
             if verbosity > 0:
                 print("Starting product pricing for %s" % site.domain)
 
-            if verbosity > 1:
-                print("Deleting old pricing")
+            if bulk:
+                ct = ProductPriceLookup.objects.bulk_rebuild(site=site, chunk_size=options.get('chunk_size', 500))
 
-            for lookup in ProductPriceLookup.objects.filter(siteid=site.id):
-                lookup.delete()
+            else:
+                if verbosity > 1:
+                    print("Deleting old pricing")
 
-            products = Product.objects.active_by_site(site=site, variations=False)
-            if verbosity > 0:
-                print("Adding %i products" % products.count())
+                for lookup in ProductPriceLookup.objects.filter(siteid=site.id):
+                    lookup.delete()
 
-            for product in products:
-                if verbosity > 1:
-                    print("Processing product: %s" % product.slug)
+                products = Product.objects.active_by_site(site=site, variations=False)
+                if verbosity > 0:
+                    print("Adding %i products" % products.count())
 
-                prices = ProductPriceLookup.objects.smart_create_for_product(product)
-                if verbosity > 1:
-                    print("Created %i prices" % len(prices))
+                for product in products:
+                    if verbosity > 1:
+                        print("Processing product: %s" % product.slug)
+
+                    prices = ProductPriceLookup.objects.smart_create_for_product(product)
+                    if verbosity > 1:
+                        print("Created %i prices" % len(prices))
 
-                ct += len(prices)
+                    ct += len(prices)
 
             if verbosity > 0:
-                print("Added %i total prices for site" % ct)
+                print("Added %i total prices for site (%s)" % (ct, _rate(ct, site_started)))
 
             total += ct
 
         if verbosity > 0:
-            print("Added %i total prices" % total)
+            print("Added %i total prices (%s)" % (total, _rate(total, started)))
 
+def _rate(ct, started):
+    elapsed = time.time() - started
+    if elapsed > 0:
+        return "%.2fs, %.0f rows/sec" % (elapsed, ct / elapsed)
+    return "%.2fs" % elapsed
@@ -0,0 +1,54 @@
+from django.conf import settings
+from django.contrib.sites.models import Site
+from django.core.management.base import BaseCommand
+from django.db.models import Sum
+from product.models import ProductRanking
+from satchmo_store.shop.models import Order, OrderItem
+import time
+
+class Command(BaseCommand):
+    help = "Counts the sales and ratings of the bestseller and highest rated lists again."
+
+    def add_arguments(self, parser):
+        parser.add_argument('sitenames', nargs='*')
+        parser.add_argument('--sales', action='store_true', dest='sales', default=False,
+            help="Only count the units sold.")
+        parser.add_argument('--ratings', action='store_true', dest='ratings', default=False,
+            help="Only count the product ratings.")
+
+    def handle(self, *sitenames, **options):
+        verbosity = int(options.get('verbosity', 1))
+        sitenames = sitenames or options.get('sitenames') or []
+        sales = options.get('sales') or not options.get('ratings')
+        ratings = options.get('ratings') or not options.get('sales')
+        if ratings and 'satchmo_ext.productratings' not in settings.INSTALLED_APPS:
+            ratings = False
+
+        if len(sitenames) == 0:
+            sites = Site.objects.all()
+        else:
+            sites = []
+            for sitename in sitenames:
+                try:
+                    sites.append(Site.objects.get(domain__iexact=sitename))
+                except Site.DoesNotExist:
+                    print("Warning: Could not find site '%s'" % sitename)
+
+        for site in sites:
+            started = time.time()
+            units = totals = orders = None
+            if sales:
+                # orders are counted once they succeed, which gives them a
+                # status, until they are cancelled
+                orders = Order.objects.filter(site=site).exclude(status__in=('', 'Cancelled'))
+                items = OrderItem.objects.filter(order__in=orders) \
+                                         .order_by().values_list('product').annotate(Sum('quantity'))
+                units = dict(items)
+                orders = list(orders.values_list('pk', flat=True))
+            if ratings:
+                from satchmo_ext.productratings.utils import rating_totals
+                totals = rating_totals(site)
+
+            ct = ProductRanking.objects.rebuild(site, units=units, ratings=totals, orders=orders)
+            if verbosity > 0:
+                print("Ranked %i products for %s in %.2fs" % (ct, site.domain, time.time() - started))
@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+from product.search import IndexedSearchBackend
+import time
+
+class Command(BaseCommand):
+    help = "Rebuilds the Satchmo product search index used by the indexed search backend."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, dest='chunk_size', default=500,
+            help="Number of products indexed per transaction.")
+
+    def handle(self, **options):
+        verbosity = int(options.get('verbosity', 1))
+        started = time.time()
+        ct = IndexedSearchBackend().rebuild_index(chunk_size=options.get('chunk_size', 500))
+        if verbosity > 0:
+            print("Indexed %i terms in %.2fs" % (ct, time.time() - started))
@@ -0,0 +1,22 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('product', '0002_auto_20161229_1438'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ProductPriceLookupChange',
+            fields=[
+                ('id', models.AutoField(verbose_name='ID', serialize=False, auto_created=True, primary_key=True)),
+                ('product_id', models.IntegerField(db_index=True)),
+                ('created', models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+    ]
@@ -0,0 +1,50 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def populate_closure(apps, schema_editor):
+    Category = apps.get_model('product', 'Category')
+    CategoryClosure = apps.get_model('product', 'CategoryClosure')
+    parents = dict(Category.objects.values_list('id', 'parent_id'))
+    rows = []
+    for node in parents:
+        current = node
+        depth = 0
+        seen = set()
+        while current is not None and current in parents and current not in seen:
+            seen.add(current)
+            rows.append(CategoryClosure(ancestor_id=current, descendant_id=node, depth=depth))
+            current = parents[current]
+            depth += 1
+    CategoryClosure.objects.bulk_create(rows)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('product', '0003_productpricelookupchange'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CategoryClosure',
+            fields=[
+                ('id', models.AutoField(verbose_name='ID', serialize=False, auto_created=True, primary_key=True)),
+                ('depth', models.IntegerField()),
+                ('ancestor', models.ForeignKey(related_name='descendant_links', on_delete=django.db.models.deletion.CASCADE, to='product.Category')),
+                ('descendant', models.ForeignKey(related_name='ancestor_links', on_delete=django.db.models.deletion.CASCADE, to='product.Category')),
+            ],
+            options={
+                'verbose_name': 'Category Closure',
+                'verbose_name_plural': 'Category Closures',
+            },
+        ),
+        migrations.AlterUniqueTogether(
+            name='categoryclosure',
+            unique_together=set([('ancestor', 'descendant')]),
+        ),
+        migrations.RunPython(populate_closure, migrations.RunPython.noop),
+    ]
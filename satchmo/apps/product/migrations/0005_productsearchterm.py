@@ -0,0 +1,32 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('product', '0004_categoryclosure'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ProductSearchTerm',
+            fields=[
+                ('id', models.AutoField(verbose_name='ID', serialize=False, auto_created=True, primary_key=True)),
+                ('term', models.CharField(max_length=64, verbose_name='Term', db_index=True)),
+                ('weight', models.IntegerField(default=1, verbose_name='Weight')),
+                ('product', models.ForeignKey(related_name='search_terms', on_delete=django.db.models.deletion.CASCADE, to='product.Product')),
+            ],
+            options={
+                'verbose_name': 'Product Search Term',
+                'verbose_name_plural': 'Product Search Terms',
+            },
+        ),
+        migrations.AlterUniqueTogether(
+            name='productsearchterm',
+            unique_together=set([('term', 'product')]),
+        ),
+    ]
@@ -0,0 +1,78 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from decimal import Decimal
+from django.db import migrations, models
+from django.db.models import Sum
+import django.db.models.deletion
+
+
+def count_sales(apps, schema_editor):
+    """Count the units of the orders which succeeded and were not cancelled,
+    the ratings are counted by the productratings app's migration."""
+    Order = apps.get_model('shop', 'Order')
+    OrderItem = apps.get_model('shop', 'OrderItem')
+    ProductRanking = apps.get_model('product', 'ProductRanking')
+    ProductRankingOrder = apps.get_model('product', 'ProductRankingOrder')
+
+    orders = Order.objects.exclude(status__in=('', 'Cancelled'))
+    items = OrderItem.objects.filter(order__in=orders).order_by() \
+                             .values_list('order__site', 'product').annotate(Sum('quantity'))
+    ProductRanking.objects.bulk_create(
+        [ProductRanking(site_id=site_id, product_id=product_id, units_sold=units)
+         for site_id, product_id, units in items if units],
+        batch_size=500)
+    ProductRankingOrder.objects.bulk_create(
+        [ProductRankingOrder(order_id=pk) for pk in orders.values_list('pk', flat=True)],
+        batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('sites', '0001_initial'),
+        ('product', '0005_productsearchterm'),
+        ('shop', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ProductRanking',
+            fields=[
+                ('id', models.AutoField(verbose_name='ID', serialize=False, auto_created=True, primary_key=True)),
+                ('units_sold', models.DecimalField(default=Decimal('0'), verbose_name='Units sold', max_digits=18, decimal_places=6)),
+                ('rating_sum', models.IntegerField(default=0, verbose_name='Rating sum')),
+                ('rating_count', models.IntegerField(default=0, verbose_name='Rating count')),
+                ('rating_average', models.FloatField(default=0, verbose_name='Average rating')),
+                ('product', models.ForeignKey(related_name='rankings', on_delete=django.db.models.deletion.CASCADE, to='product.Product')),
+                ('site', models.ForeignKey(verbose_name='Site', on_delete=django.db.models.deletion.CASCADE, to='sites.Site')),
+            ],
+            options={
+                'verbose_name': 'Product Ranking',
+                'verbose_name_plural': 'Product Rankings',
+            },
+        ),
+        migrations.AlterUniqueTogether(
+            name='productranking',
+            unique_together=set([('site', 'product')]),
+        ),
+        migrations.AddIndex(
+            model_name='productranking',
+            index=models.Index(fields=['site', '-units_sold'], name='product_ranking_sold_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='productranking',
+            index=models.Index(fields=['site', '-rating_average'], name='product_ranking_rated_idx'),
+        ),
+        migrations.CreateModel(
+            name='ProductRankingOrder',
+            fields=[
+                ('order', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, serialize=False, to='shop.Order')),
+            ],
+            options={
+                'verbose_name': 'Ranked Order',
+                'verbose_name_plural': 'Ranked Orders',
+            },
+        ),
+        migrations.RunPython(count_sales, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,92 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def populate_counts(apps, schema_editor):
+    Category = apps.get_model('product', 'Category')
+    CategoryClosure = apps.get_model('product', 'CategoryClosure')
+    CategoryProductCount = apps.get_model('product', 'CategoryProductCount')
+    Product = apps.get_model('product', 'Product')
+    try:
+        ProductVariation = apps.get_model('configurable', 'ProductVariation')
+        parents = dict(ProductVariation.objects.values_list('product_id', 'parent_id'))
+    except LookupError:
+        parents = {}
+    variations = {}
+    for product_id, parent_id in parents.items():
+        variations.setdefault(parent_id, set()).add(product_id)
+
+    inactive = set(Category.objects.filter(is_active=False).values_list('id', flat=True))
+    below = {}
+    for ancestor, descendant, depth in CategoryClosure.objects.values_list('ancestor', 'descendant', 'depth'):
+        below.setdefault(ancestor, []).append((descendant, depth))
+
+    members = {}
+    for product_id, category_id in Product.objects.filter(active=True, category__isnull=False).values_list('id', 'category'):
+        members.setdefault(category_id, set()).add(product_id)
+    sites = {}
+    for product_id, site_id in Product.objects.filter(active=True, site__isnull=False).values_list('id', 'site'):
+        sites.setdefault(product_id, set()).add(site_id)
+
+    def counts(category_ids):
+        products = set()
+        for pk in category_ids:
+            products |= members.get(pk, set())
+        by_site = {}
+        for product_id in products:
+            for site_id in sites.get(product_id, ()):
+                plain, with_variations = by_site.get(site_id, (0, 0))
+                if product_id not in parents:
+                    plain += 1
+                by_site[site_id] = (plain, with_variations + 1 + len(variations.get(product_id, ())))
+        return by_site
+
+    rows = []
+    for pk in Category.objects.values_list('id', flat=True):
+        # branches below an inactive category are left out, as by Category._descendants
+        blocked = set()
+        for descendant, depth in below.get(pk, []):
+            if depth > 0 and descendant in inactive:
+                blocked.update(d for d, dd in below.get(descendant, []))
+        direct = counts([pk])
+        total = counts([d for d, depth in below.get(pk, []) if d not in blocked])
+        for site_id in set(direct) | set(total):
+            rows.append(CategoryProductCount(site_id=site_id, category_id=pk,
+                direct=direct.get(site_id, (0, 0))[0], direct_variations=direct.get(site_id, (0, 0))[1],
+                total=total.get(site_id, (0, 0))[0], total_variations=total.get(site_id, (0, 0))[1]))
+    CategoryProductCount.objects.bulk_create(rows)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('sites', '0001_initial'),
+        ('product', '0006_productranking'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CategoryProductCount',
+            fields=[
+                ('id', models.AutoField(verbose_name='ID', serialize=False, auto_created=True, primary_key=True)),
+                ('direct', models.IntegerField(default=0, verbose_name='Products')),
+                ('direct_variations', models.IntegerField(default=0, verbose_name='Products and variations')),
+                ('total', models.IntegerField(default=0, verbose_name='Products with subcategories')),
+                ('total_variations', models.IntegerField(default=0, verbose_name='Products and variations with subcategories')),
+                ('category', models.ForeignKey(related_name='product_counts', on_delete=django.db.models.deletion.CASCADE, to='product.Category')),
+                ('site', models.ForeignKey(verbose_name='Site', on_delete=django.db.models.deletion.CASCADE, to='sites.Site')),
+            ],
+            options={
+                'verbose_name': 'Category Product Count',
+                'verbose_name_plural': 'Category Product Counts',
+            },
+        ),
+        migrations.AlterUniqueTogether(
+            name='categoryproductcount',
+            unique_together=set([('category', 'site')]),
+        ),
+        migrations.RunPython(populate_counts, migrations.RunPython.noop),
+    ]
@@ -13,8 +13,8 @@ from django.conf import settings
 from django.contrib.sites.models import Site
 from django.core.cache import cache
 from django.core.exceptions import ObjectDoesNotExist
-from django.db import models
-from django.db.models import Q
+from django.db import models, transaction
+from django.db.models import Count, Exists, OuterRef, Q
 from django.utils.encoding import smart_str
 from django.utils.translation import get_language, gettext, gettext_lazy as _
 from django.utils.functional import cached_property
@@ -29,9 +29,9 @@ from livesettings.models import SettingNotSet
 from .prices import get_product_quantity_price, get_product_quantity_adjustments
 from product import active_product_types
 from product.prices import PriceAdjustmentCalc
-from satchmo_utils import get_flat_list
 from satchmo_utils.fields import CurrencyField
 from satchmo_utils.satchmo_thumbnail.field import ImageWithThumbnailField
+from satchmo_utils.singleflight import cache_lookup
 from satchmo_utils.unique_id import slugify
 from . import config   # This import is required to make sure livesettings picks up the config values
 import datetime
@@ -40,6 +40,7 @@ import logging
 import operator
 from . import signals
 import six
+import time
 from six.moves import reduce
 
 log = logging.getLogger('product.models')
@@ -105,8 +106,8 @@ class CategoryManager(models.Manager):
         return self.active(parent__isnull=True, site=site, **kwargs)
 
     def search_by_site(self, keyword, site=None, include_children=False):
-        """Search for categories by keyword.
-        Note, this does not return a queryset."""
+        """Search for categories by keyword, sorted by ordering and name.
+        Children are expanded by the database rather than loaded here."""
 
         if not site:
             site = Site.objects.get_current()
@@ -118,16 +119,87 @@ class CategoryManager(models.Manager):
             site=site)
 
         if include_children:
-            # get all the children of the categories found
-            cats = [cat.get_active_children(include_self=True) for cat in cats]
-
-        # sort properly
-        if cats:
-            fastsort = [(c.ordering, c.name, c) for c in get_flat_list(cats)]
-            fastsort.sort()
-            # extract the cat list
-            cats = zip(*fastsort)[2]
-        return cats
+            # the categories found and their children, from one join of the
+            # closure table, leaving out the links which pass an inactive
+            # category or one without active products, as _descendants does
+            stocked = CategoryProductCount.objects.filter(site=site, direct__gt=0).values('category')
+            links = _open_links(cats, Q(descendant__is_active=False) | ~Q(descendant__in=stocked))
+            cats = self.filter(ancestor_links__in=links).distinct()
+
+        return cats.order_by('ordering', 'name', 'pk')
+
+    def nav_tree(self, site=None, language_code=None):
+        """Get the navigation tree of the active categories for a site, as
+        nested dictionaries of id, slug, url, translated name, active product
+        count and children.  The tree is cached until `clear_nav_tree`."""
+        if not site:
+            site = Site.objects.get_current()
+        if not language_code:
+            language_code = get_language() or settings.LANGUAGE_CODE
+
+        version = cache.get(NAV_TREE_VERSION_KEY)
+        if version is None:
+            version = self.clear_nav_tree()
+
+        cache_key = "cat-tree-%s-%s-%s" % (version, site.id, language_code)
+        tree = cache.get(cache_key)
+        if tree is None:
+            tree = self._build_nav_tree(site, language_code)
+            cache.set(cache_key, tree)
+        return tree
+
+    def clear_nav_tree(self):
+        """Invalidate the cached navigation trees of all sites and languages."""
+        version = datetime.datetime.now().strftime('%Y%m%d%H%M%S%f')
+        cache.set(NAV_TREE_VERSION_KEY, version, None)
+        return version
+
+    def _build_nav_tree(self, site, language_code):
+        rows = {}
+        children = {}
+        for pk, parent_id, slug, name in self.active(ancestor_links__ancestor__in=self.root_categories(site=site)
+                                                     ).values_list('id', 'parent_id', 'slug', 'name'):
+            rows[pk] = (slug, name)
+            children.setdefault(parent_id, []).append(pk)
+
+        names = _translated_category_names(rows.keys(), language_code)
+        counts = dict(CategoryProductCount.objects.filter(site=site, category__in=rows.keys()
+                                                          ).values_list('category', 'direct'))
+
+        def build(pk, parent_slugs):
+            slug, name = rows[pk]
+            return {
+                'id': pk,
+                'slug': slug,
+                'name': names.get(pk, name),
+                'url': reverse('satchmo_category', kwargs={'parent_slugs': parent_slugs, 'slug': slug}),
+                'product_count': counts.get(pk, 0),
+                'children': [build(child, parent_slugs + slug + '/') for child in children.get(pk, [])],
+            }
+        return [build(pk, '') for pk in children.get(None, [])]
+
+
+NAV_TREE_VERSION_KEY = 'cat-tree-version'
+
+
+def _translated_category_names(ids, language_code):
+    """Bulk version of `lookup_translation` for category names: the exact
+    language wins over its short code, which wins over any other variant."""
+    language_code = language_code.lower()
+    short_code = language_code.replace('_', '-').split('-')[0]
+    found = {}
+    for cat_id, code, name in CategoryTranslation.objects.filter(category__in=ids, languagecode__istartswith=short_code
+                                                                 ).order_by('version').values_list('category', 'languagecode', 'name'):
+        code = code.lower()
+        if code == language_code:
+            rank = 0
+        elif code == short_code:
+            rank = 1
+        else:
+            rank = 2
+        if cat_id not in found or rank <= found[cat_id][0]:
+            found[cat_id] = (rank, name)
+    return dict((cat_id, name) for cat_id, (rank, name) in found.items() if name)
 
 
 @python_2_unicode_compatible
@@ -166,6 +238,12 @@ class Category(models.Model):
                 print('Warning: default category image not found', file=sys.stderr)
         return img
 
+    def __init__(self, *args, **kwargs):
+        super(Category, self).__init__(*args, **kwargs)
+        # read from __dict__ so that deferred loads do not trigger a query
+        self._closure_parent_id = self.__dict__.get('parent_id')
+        self._counted_active = self.__dict__.get('is_active')
+
     def active_products(self, variations=False, include_children=False, **kwargs):
         """Variations determines whether or not product variations are included
         in most templates we are not returning all variations, just the parent product.
@@ -175,7 +253,7 @@ class Category(models.Model):
         if not include_children:
             qry = self.product_set.filter(site=site)
         else:
-            cats = self.get_all_children(include_self=True)
+            cats = self._descendants(include_self=True)
             qry = Product.objects.filter(site=site, category__in=cats)
 
         if variations:
@@ -199,16 +277,13 @@ class Category(models.Model):
         return lookup_translation(self, 'name', language_code)
 
     def _recurse_for_parents(self, cat_obj):
-        p_list = []
-        if cat_obj.parent_id:
-            p = cat_obj.parent
-            p_list.append(p)
-            if p != self:
-                more = self._recurse_for_parents(p)
-                p_list.extend(more)
-        if cat_obj == self and p_list:
-            p_list.reverse()
-        return p_list
+        """Return the parents of `cat_obj`, starting from the root category."""
+        if cat_obj.pk is None:
+            if cat_obj.parent_id:
+                return self._recurse_for_parents(cat_obj.parent) + [cat_obj.parent]
+            return []
+        return list(Category.objects.filter(descendant_links__descendant=cat_obj,
+                                             descendant_links__depth__gt=0).order_by('-descendant_links__depth'))
 
     def parents(self):
         return self._recurse_for_parents(self)
@@ -247,20 +322,17 @@ class Category(models.Model):
         return self.get_separator().join(name_list)
 
     def save(self, **kwargs):
-        if self.id:
-            if self.parent and self.parent_id == self.id:
+        if self.id and self.parent_id:
+            if self.parent_id == self.id:
                 raise forms.ValidationError(_("You must not save a category in itself!"))
 
-            for p in self._recurse_for_parents(self):
-                if self.id == p.id:
-                    raise forms.ValidationError(_("You must not save a category in itself!"))
+            if CategoryClosure.objects.filter(ancestor=self, descendant=self.parent_id).exists():
+                raise forms.ValidationError(_("You must not save a category in itself!"))
 
         if not self.slug:
             self.slug = slugify(self.name, instance=self)
         super(Category, self).save(**kwargs)
-        for site in self.site.all().only('id'):
-            cache_key = "cat-%s" % site.id
-            cache.delete(cache_key)
+        Category.objects.clear_nav_tree()
 
     def _flatten(self, L):
         """
@@ -270,15 +342,34 @@ class Category(models.Model):
         if L == []: return L
         return self._flatten(L[0]) + self._flatten(L[1:])
 
+    def _descendants(self, only_active=False, include_self=False):
+        """
+        Query the descendants of this category from the closure table.  Branches
+        below an inactive category are left out, as are, if `only_active`,
+        branches below a category without active products of its own.
+        """
+        blocked = Q(is_active=False)
+        if only_active:
+            site = Site.objects.get_current()
+            stocked = CategoryProductCount.objects.filter(site=site, direct__gt=0).values('category')
+            blocked = blocked | ~Q(id__in=stocked)
+        below = Category.objects.filter(blocked, ancestor_links__ancestor=self, ancestor_links__depth__gt=0)
+
+        if include_self:
+            qry = Category.objects.filter(ancestor_links__ancestor=self)
+        else:
+            qry = Category.objects.filter(ancestor_links__ancestor=self, ancestor_links__depth__gt=0)
+        return qry.exclude(ancestor_links__ancestor__in=below)
+
     def _recurse_for_children(self, node, only_active=False):
-        children = []
-        children.append(node)
-        for child in node.child.active():
-            if child != self:
-                if (not only_active) or child.active_products().count() > 0:
-                    children_list = self._recurse_for_children(child, only_active=only_active)
-                    children.append(children_list)
-        return children
+        """Return the nested list of `node` and its children, from a single query."""
+        children = {}
+        for cat in node._descendants(only_active=only_active):
+            children.setdefault(cat.parent_id, []).append(cat)
+
+        def nest(cat):
+            return [cat] + [nest(child) for child in children.get(cat.id, [])]
+        return nest(node)
 
     def get_active_children(self, include_self=False):
         """
@@ -305,6 +396,208 @@ class Category(models.Model):
         # unique_together = ('site', 'slug')
 
 
+def _closure_rows(parents, nodes=None):
+    """Compute (ancestor, descendant, depth) rows for `nodes` (default: all),
+    given a dictionary of category id -> parent id."""
+    rows = []
+    for node in (nodes if nodes is not None else parents.keys()):
+        current = node
+        depth = 0
+        seen = set()
+        while current is not None and current in parents and current not in seen:
+            seen.add(current)
+            rows.append((current, node, depth))
+            current = parents[current]
+            depth += 1
+    return rows
+
+
+class CategoryClosureManager(models.Manager):
+
+    def rebuild(self):
+        """Rebuild the closure of the whole category tree."""
+        parents = dict(Category.objects.values_list('id', 'parent_id'))
+        with transaction.atomic():
+            self.all().delete()
+            self.bulk_create([CategoryClosure(ancestor_id=a, descendant_id=d, depth=depth)
+                              for a, d, depth in _closure_rows(parents)])
+
+    def rebuild_subtree(self, category):
+        """Rebuild the closure rows of `category` and everything below it, after
+        it was added or moved.  The tree is walked through `parent`, so that
+        categories loaded out of order, such as from fixtures, end up linked."""
+        parents = {category.pk: category.parent_id}
+        parent_id = category.parent_id
+        while parent_id is not None and parent_id not in parents:
+            row = list(Category.objects.filter(pk=parent_id).values_list('parent_id', flat=True))
+            if not row:
+                parents[category.pk] = None
+                break
+            parents[parent_id] = row[0]
+            parent_id = row[0]
+
+        subtree = [category.pk]
+        frontier = [category.pk]
+        while frontier:
+            children = Category.objects.filter(parent__in=frontier).exclude(pk__in=subtree).values_list('id', 'parent_id')
+            frontier = []
+            for pk, parent_id in children:
+                parents[pk] = parent_id
+                frontier.append(pk)
+            subtree.extend(frontier)
+
+        with transaction.atomic():
+            self.filter(descendant__in=subtree).delete()
+            self.bulk_create([CategoryClosure(ancestor_id=a, descendant_id=d, depth=depth)
+                              for a, d, depth in _closure_rows(parents, subtree)])
+
+
+class CategoryClosure(models.Model):
+    """
+    Every ancestor/descendant pair of the category tree, including each category
+    paired with itself at depth 0, so that parents and children are found
+    with a single indexed query.
+    """
+    ancestor = models.ForeignKey(Category, related_name='descendant_links', on_delete=models.CASCADE)
+    descendant = models.ForeignKey(Category, related_name='ancestor_links', on_delete=models.CASCADE)
+    depth = models.IntegerField()
+
+    objects = CategoryClosureManager()
+
+    class Meta:
+        unique_together = (('ancestor', 'descendant'),)
+        verbose_name = _("Category Closure")
+        verbose_name_plural = _("Category Closures")
+
+
+def _open_links(ancestors, blocked):
+    """The pks of the closure links from `ancestors` down, leaving out the
+    links which pass a category matching `blocked`, a Q on CategoryClosure's
+    descendant, below the ancestor."""
+    passed = CategoryClosure.objects.filter(
+        blocked, ancestor=OuterRef('ancestor'), depth__gt=0,
+        descendant__descendant_links__descendant=OuterRef('descendant'))
+    return CategoryClosure.objects.filter(ancestor__in=ancestors) \
+                                  .annotate(blocked=Exists(passed)).filter(blocked=False).values('pk')
+
+
+def category_closure_save_listener(sender, instance=None, created=False, raw=False, **kwargs):
+    old_parent_id = instance._closure_parent_id
+    moved = created or raw or instance.parent_id != old_parent_id
+    if moved:
+        CategoryClosure.objects.rebuild_subtree(instance)
+    if moved or instance.is_active != instance._counted_active:
+        # the totals of the categories above it, before and after, changed
+        CategoryProductCount.objects.refresh([instance.pk, old_parent_id])
+    instance._closure_parent_id = instance.parent_id
+    instance._counted_active = instance.is_active
+
+
+def category_closure_pre_delete_listener(sender, instance=None, **kwargs):
+    instance._closure_children = list(instance.child.all())
+
+
+def category_closure_post_delete_listener(sender, instance=None, **kwargs):
+    # the children were detached by on_delete=SET_NULL
+    for child in getattr(instance, '_closure_children', []):
+        child.parent_id = None
+        CategoryClosure.objects.rebuild_subtree(child)
+    CategoryProductCount.objects.refresh([instance.parent_id])
+
+
+models.signals.post_save.connect(category_closure_save_listener, sender=Category)
+models.signals.pre_delete.connect(category_closure_pre_delete_listener, sender=Category)
+models.signals.post_delete.connect(category_closure_post_delete_listener, sender=Category)
+
+
+class CategoryProductCountManager(models.Manager):
+
+    def _counts(self, products, category_field):
+        """The (products without variations, products with their variations)
+        of the active `products`, by category and site."""
+        counts = {}
+        for category_id, site_id, count, plain, variations in products.filter(active=True) \
+                .order_by().values_list(category_field, 'site').annotate(
+                    Count('id', distinct=True),
+                    Count('id', distinct=True, filter=Q(productvariation__parent__isnull=True)),
+                    Count('configurableproduct__productvariation', distinct=True)):
+            if site_id is not None:
+                counts[(category_id, site_id)] = (plain, count + variations)
+        return counts
+
+    def refresh(self, category_ids):
+        """Count the active products of the categories, and of all the
+        categories above them, again."""
+        category_ids = [pk for pk in category_ids if pk is not None]
+        ids = set(CategoryClosure.objects.filter(descendant__in=category_ids).values_list('ancestor', flat=True))
+        if not ids:
+            return
+        site_ids = list(Site.objects.values_list('id', flat=True))
+
+        with transaction.atomic():
+            # the rows are made if missing and locked, so that refreshes of
+            # the same categories wait for each other rather than both
+            # inserting the rows
+            self.bulk_create([CategoryProductCount(category_id=pk, site_id=site_id)
+                              for pk in ids for site_id in site_ids], ignore_conflicts=True)
+            rows = list(self.select_for_update().filter(category__in=ids).order_by('pk'))
+
+            direct = self._counts(Product.objects.filter(category__in=ids), 'category')
+            # the products of the categories below each one, leaving out the
+            # branches below inactive categories, as _descendants does
+            links = _open_links(ids, Q(descendant__is_active=False))
+            total = self._counts(Product.objects.filter(category__ancestor_links__in=links),
+                                 'category__ancestor_links__ancestor')
+
+            for row in rows:
+                key = (row.category_id, row.site_id)
+                row.direct, row.direct_variations = direct.get(key, (0, 0))
+                row.total, row.total_variations = total.get(key, (0, 0))
+            self.bulk_update(rows, ['direct', 'direct_variations', 'total', 'total_variations'], batch_size=500)
+        Category.objects.clear_nav_tree()
+
+    def refresh_products(self, product_ids):
+        """Count the categories of the products again."""
+        through = Product.category.through
+        self.refresh(set(through.objects.filter(product__in=product_ids).values_list('category', flat=True)))
+
+    def rebuild(self):
+        """Count the products of every category again."""
+        with transaction.atomic():
+            self.exclude(category__in=Category.objects.all()).delete()
+            self.refresh(Category.objects.values_list('id', flat=True))
+
+    def product_count(self, category, variations=False, include_children=True, site=None):
+        """The number of active products in the category, as `active_products(...).count()`."""
+        if site is None:
+            site = Site.objects.get_current()
+        field = include_children and 'total' or 'direct'
+        if variations:
+            field += '_variations'
+        return self.filter(site=site, category_id=category.pk).values_list(field, flat=True).first() or 0
+
+
+class CategoryProductCount(models.Model):
+    """
+    The number of active products in a category on a site, on its own and
+    with the categories below it, and without or with the variations of
+    configurable products.  Kept current by product and category listeners.
+    """
+    site = models.ForeignKey(Site, verbose_name=_('Site'), on_delete=models.CASCADE)
+    category = models.ForeignKey(Category, related_name='product_counts', on_delete=models.CASCADE)
+    direct = models.IntegerField(_("Products"), default=0)
+    direct_variations = models.IntegerField(_("Products and variations"), default=0)
+    total = models.IntegerField(_("Products with subcategories"), default=0)
+    total_variations = models.IntegerField(_("Products and variations with subcategories"), default=0)
+
+    objects = CategoryProductCountManager()
+
+    class Meta:
+        unique_together = (('category', 'site'),)
+        verbose_name = _("Category Product Count")
+        verbose_name_plural = _("Category Product Counts")
+
+
 @python_2_unicode_compatible
 class CategoryTranslation(models.Model):
     """A specific language translation for a `Category`.  This is intended for all descriptions which are not the
@@ -434,23 +727,20 @@ class DiscountManager(models.Manager):
     def get_sale(self):
         """Get the current 'sale' discount."""
         today = datetime.date.today()
-        sale = None
         site = Site.objects.get_current()
-        try:
-            sale = keyedcache.cache_get('discount', 'sale', site, today)
-        except keyedcache.NotCachedError as nce:
+
+        def find_sale():
             discs = self.filter(automatic=True,
                                 active=True,
                                 site=site,
                                 startDate__lte=today,
                                 endDate__gt=today).order_by('-percentage')
             try:
-                sale = discs[0]
+                return discs[0]
             except IndexError:
-                pass
-
-            keyedcache.cache_set(nce.key, value=sale)
+                return None
 
+        sale = cache_lookup(('discount', 'sale', site, today), find_sale)
         if sale is None:
             raise Discount.DoesNotExist
         else:
@@ -903,7 +1193,12 @@ class Product(models.Model):
     def main_image(self):
         img = False
         try:
-            img = self.productimage_set.order_by('sort')[0]
+            prefetched = getattr(self, '_prefetched_objects_cache', {}).get('productimage_set', None)
+            if prefetched is not None:
+                # the images were loaded with a batch of products, such as for a feed
+                img = sorted(prefetched, key=lambda image: image.sort)[0]
+            else:
+                img = self.productimage_set.order_by('sort')[0]
         except IndexError:
             # try to get a main image by looking at the parent if this has one
             p = self.get_subtype_with_attr('parent', 'product')
@@ -955,6 +1250,8 @@ class Product(models.Model):
 
         if subtype and subtype is not self:
             price = subtype.unit_price
+        elif (Decimal('1'), True) in self._qty_price_cache:
+            price = self._qty_price_cache[(Decimal('1'), True)]
         else:
             price = get_product_quantity_price(self, Decimal('1'))
 
@@ -970,6 +1267,9 @@ class Product(models.Model):
         the specified qty.  Otherwise, return the unit_price
         returns price as a Decimal
         """
+        if (qty, include_discount) in self._qty_price_cache:
+            return self._qty_price_cache[(qty, include_discount)]
+
         subtype = self.get_subtype_with_attr('get_qty_price')
         if subtype and subtype is not self:
             price = subtype.get_qty_price(qty, include_discount=include_discount)
@@ -988,6 +1288,15 @@ class Product(models.Model):
 
         return price
 
+    @cached_property
+    def _qty_price_cache(self):
+        return {}
+
+    def set_qty_price_cache(self, qty, include_discount, price):
+        """Remember a price resolved elsewhere, such as by `product.prices.bulk_quantity_prices`,
+        so that `get_qty_price` and `unit_price` don't have to look it up again."""
+        self._qty_price_cache[(qty, include_discount)] = price
+
     def get_qty_price_list(self):
         """Return a list of tuples (qty, price)"""
         prices = Price.objects.filter(
@@ -1032,6 +1341,10 @@ class Product(models.Model):
         verbose_name_plural = _("Products")
         # unique_together = (('site', 'sku'),('site','slug'))
 
+    def __init__(self, *args, **kwargs):
+        super(Product, self).__init__(*args, **kwargs)
+        self._nav_active = self.__dict__.get('active', True)
+
     def save(self, **kwargs):
         if not self.pk:
             self.date_added = datetime.date.today()
@@ -1042,7 +1355,10 @@ class Product(models.Model):
         if not self.sku:
             self.sku = self.slug
         super(Product, self).save(**kwargs)
-        ProductPriceLookup.objects.smart_create_for_product(self)
+        ProductPriceLookup.objects.refresh_for_product(self)
+        if self.active != self._nav_active:
+            CategoryProductCount.objects.refresh_products([self.pk])
+            self._nav_active = self.active
 
     def get_subtypes(self):
         # If we've already computed it once, let's not do it again.
@@ -1232,6 +1548,23 @@ class ProductTranslation(models.Model):
 #     members = models.ManyToManyField(Product, related_name='parent_productgroup_set')
 
 
+def _current_prices():
+    return Price.objects.exclude(expires__isnull=False, expires__lt=datetime.date.today())
+
+
+def _lookup_values(obj):
+    """The fields of a `ProductPriceLookup` compared when syncing, rounded as stored."""
+    places = Decimal('0.000001')
+    return (obj.parentid, obj.key, Decimal(obj.price).quantize(places), bool(obj.active),
+            bool(obj.discountable), Decimal(obj.items_in_stock).quantize(places))
+
+
+def _subtype_relations():
+    """Names of the reverse one-to-one relations from `Product` to its active subtypes."""
+    relations = set([f.name for f in Product._meta.get_fields() if f.one_to_one and f.auto_created])
+    return [subtype.lower() for module, subtype in active_product_types() if subtype.lower() in relations]
+
+
 class ProductPriceLookupManager(models.Manager):
 
     def by_product(self, product):
@@ -1298,10 +1631,13 @@ class ProductPriceLookupManager(models.Manager):
         for obj in self.filter(productslug=product.slug, siteid__in=list(product.site.all().values_list('pk', flat=True))):
             obj.delete()
 
-    def rebuild_all(self, site=None):
+    def rebuild_all(self, site=None, bulk=False):
         if not site:
             site = Site.objects.get_current()
 
+        if bulk:
+            return self.bulk_rebuild(site=site)
+
         for lookup in self.filter(siteid=site.id):
             lookup.delete()
 
@@ -1311,6 +1647,206 @@ class ProductPriceLookupManager(models.Manager):
             prices = self.smart_create_for_product(p)
             ct += len(prices)
         log.info('ProductPriceLookup built %i prices', ct)
+        return ct
+
+    def bulk_rebuild(self, site=None, chunk_size=500):
+        """Rebuild all lookups for a site using set-based queries.
+
+        Old rows are removed with a single delete, then the lookups are
+        computed in memory from prefetched prices, sites and variations and
+        written with ``bulk_create``, one transaction per chunk of products.
+        Returns the number of lookup rows created.
+        """
+        if not site:
+            site = Site.objects.get_current()
+
+        with transaction.atomic():
+            self.filter(siteid=site.id).delete()
+
+        product_ids = list(Product.objects.active_by_site(site=site, variations=False)
+                           .order_by('pk').values_list('pk', flat=True))
+        log.debug('ProductPriceLookup bulk rebuilding %i products', len(product_ids))
+
+        ct = 0
+        for start in range(0, len(product_ids), chunk_size):
+            chunk = self._bulk_product_query(product_ids[start:start + chunk_size])
+            objs = []
+            for product in chunk:
+                objs.extend(self._bulk_lookups_for_product(product, siteid=site.id))
+            with transaction.atomic():
+                self.bulk_create(objs, batch_size=chunk_size)
+            ct += len(objs)
+
+        log.info('ProductPriceLookup bulk built %i prices', ct)
+        return ct
+
+    def refresh_for_product(self, product):
+        """Bring the lookups of a changed product up to date.
+
+        If PRODUCT.DEFER_PRICE_LOOKUPS is set, the change is only journaled,
+        to be applied later by `process_changes`.
+        """
+        if config_value_safe('PRODUCT', 'DEFER_PRICE_LOOKUPS', False):
+            ProductPriceLookupChange.objects.create(product_id=product.pk)
+        else:
+            self.sync_products([product.pk])
+
+    def process_changes(self, limit=None):
+        """Drain the change journal, syncing the lookups of every journaled product.
+        Returns the number of journal entries processed and a tuple of
+        (created, updated, deleted) lookup counts.
+        """
+        changes = ProductPriceLookupChange.objects.order_by('pk')
+        if limit:
+            changes = changes[:limit]
+        entries = list(changes.values_list('pk', 'product_id'))
+        if not entries:
+            return 0, (0, 0, 0)
+
+        counts = self.sync_products(set([product_id for pk, product_id in entries]))
+        ProductPriceLookupChange.objects.filter(pk__in=[pk for pk, product_id in entries]).delete()
+        log.debug('ProductPriceLookup processed %i changes: %s', len(entries), counts)
+        return len(entries), counts
+
+    def sync_products(self, product_ids):
+        """Recompute the lookups of the given products and write only the rows
+        which differ from the stored ones.
+
+        A configurable product is recomputed with all its active variations, a
+        variation on its own.  Returns a tuple of (created, updated, deleted).
+        """
+        product_ids = set(product_ids)
+        subtypes = _subtype_relations()
+        variation_parents = {}
+        if 'configurableproduct' in subtypes:
+            from product.modules.configurable.models import ProductVariation
+            variation_parents = dict(ProductVariation.objects.filter(
+                product__in=product_ids).values_list('product_id', 'parent_id'))
+
+        parent_ids = product_ids - set(variation_parents.keys())
+        # variations of a parent which is synced anyway need no separate pass
+        variation_ids = [pk for pk, parent_id in variation_parents.items() if parent_id not in parent_ids]
+
+        slugs = set()
+        objs = []
+        for product in self._bulk_product_query(parent_ids):
+            slugs.add(product.slug)
+            if 'ConfigurableProduct' in product.get_subtypes():
+                slugs.update([pv.product.slug for pv in product.configurableproduct.productvariation_set.all()])
+            objs.extend(self._bulk_lookups_for_product(product))
+
+        if variation_ids:
+            for pv in self._bulk_variation_query(variation_ids):
+                slugs.add(pv.product.slug)
+                parent_pricelist = self._product_price_list(pv.parent.product)
+                objs.extend(self._variation_lookups(pv, parent_pricelist))
+
+        return self._apply_lookups(objs, slugs)
+
+    def _apply_lookups(self, objs, slugs):
+        """Diff the wanted lookups against the stored rows for `slugs`, and
+        insert, update or delete only what changed."""
+        def natural_key(obj):
+            return (obj.siteid, obj.productslug, obj.quantity)
+
+        existing = {}
+        for obj in self.filter(productslug__in=slugs).order_by('price', 'pk'):
+            existing.setdefault(natural_key(obj), []).append(obj)
+
+        wanted = {}
+        for obj in objs:
+            wanted.setdefault(natural_key(obj), []).append(obj)
+
+        created, updated, deleted = [], [], []
+        for key, group in wanted.items():
+            stored = existing.pop(key, [])
+            group.sort(key=lambda obj: obj.price)
+            for ix, obj in enumerate(group):
+                if ix >= len(stored):
+                    created.append(obj)
+                elif _lookup_values(obj) != _lookup_values(stored[ix]):
+                    obj.pk = stored[ix].pk
+                    updated.append(obj)
+            deleted.extend([obj.pk for obj in stored[len(group):]])
+
+        for stored in existing.values():
+            deleted.extend([obj.pk for obj in stored])
+
+        with transaction.atomic():
+            if deleted:
+                self.filter(pk__in=deleted).delete()
+            if updated:
+                self.bulk_update(updated, ['parentid', 'key', 'price', 'active', 'discountable', 'items_in_stock'])
+            if created:
+                self.bulk_create(created)
+
+        return len(created), len(updated), len(deleted)
+
+    def _bulk_product_query(self, product_ids):
+        """Load a chunk of products with everything needed to build their lookups."""
+        subtypes = _subtype_relations()
+        products = Product.objects.filter(pk__in=product_ids).select_related(*subtypes).prefetch_related(
+            'site', models.Prefetch('price_set', queryset=_current_prices()))
+
+        if 'configurableproduct' in subtypes:
+            from product.modules.configurable.models import ProductVariation
+            variations = ProductVariation.objects.filter(product__active=True).select_related(
+                'product', *['product__%s' % name for name in subtypes if name != 'productvariation']).prefetch_related(
+                'options', 'product__site', models.Prefetch('product__price_set', queryset=_current_prices()))
+            products = products.prefetch_related(
+                models.Prefetch('configurableproduct__productvariation_set', queryset=variations))
+        return products
+
+    def _bulk_variation_query(self, variation_ids):
+        """Load variations, with their parent product prices, to build their lookups."""
+        from product.modules.configurable.models import ProductVariation
+        subtypes = _subtype_relations()
+        return ProductVariation.objects.filter(product__in=variation_ids).select_related(
+            'product', 'parent__product', *['product__%s' % name for name in subtypes if name != 'productvariation']
+            ).prefetch_related('options', 'product__site',
+                               models.Prefetch('product__price_set', queryset=_current_prices()),
+                               models.Prefetch('parent__product__price_set', queryset=_current_prices()))
+
+    def _bulk_lookups_for_product(self, product, siteid=None):
+        """Build the unsaved lookups for a prefetched product, mirroring `smart_create_for_product`."""
+        pricelist = self._product_price_list(product)
+        objs = self._bulk_lookups(product, pricelist, siteid=siteid)
+
+        if 'ConfigurableProduct' in product.get_subtypes():
+            for pv in product.configurableproduct.productvariation_set.all():
+                objs.extend(self._variation_lookups(pv, pricelist, siteid=siteid))
+        return objs
+
+    def _product_price_list(self, product):
+        return [(price.quantity, price.adjustments(product).final_price())
+                for price in product.price_set.all()]
+
+    def _variation_lookups(self, pv, parent_pricelist, siteid=None):
+        variant = pv.product
+        pricelist = self._product_price_list(variant)
+        if not pricelist:
+            options = pv.options.all()
+            delta = sum([Decimal(opt.price_change) for opt in options if opt.price_change], Decimal("0.00"))
+            pricelist = [(qty, price + delta) for qty, price in parent_pricelist]
+        key = "::".join([smart_str(opt.value) for opt in
+                         sorted(pv.options.all(), key=operator.attrgetter('option_group_id'))])
+        return self._bulk_lookups(variant, pricelist, siteid=siteid, parentid=pv.parent_id, key=key)
+
+    def _bulk_lookups(self, product, pricelist, siteid=None, parentid=None, key=None):
+        siteids = [site.pk for site in product.site.all()]
+        if siteid is not None:
+            siteids = [pk for pk in siteids if pk == siteid]
+        discountable = product.is_discountable
+        return [ProductPriceLookup(productslug=product.slug,
+                                   parentid=parentid,
+                                   siteid=pk,
+                                   active=product.active,
+                                   price=price,
+                                   quantity=qty,
+                                   key=key,
+                                   discountable=discountable,
+                                   items_in_stock=product.items_in_stock)
+                for qty, price in pricelist for pk in siteids]
 
     def smart_create_for_product(self, product):
         subtypes = product.get_subtypes()
@@ -1360,6 +1896,15 @@ class ProductPriceLookup(models.Model):
         return self.price
 
 
+class ProductPriceLookupChange(models.Model):
+    """
+    Journal of products whose `ProductPriceLookup` rows are out of date,
+    drained by `ProductPriceLookupManager.process_changes`.
+    """
+    product_id = models.IntegerField(db_index=True)
+    created = models.DateTimeField(auto_now_add=True)
+
+
 # Support the user's setting of custom expressions in the settings.py file
 try:
     user_validations = settings.SATCHMO_SETTINGS.get('ATTRIBUTE_VALIDATIONS')
@@ -1431,6 +1976,178 @@ class ProductAttribute(models.Model):
         return self.option.name
 
 
+@python_2_unicode_compatible
+class ProductSearchTerm(models.Model):
+    """
+    An entry of the product search index: a term found in the text of a
+    product and the weight it has there.  Maintained by `product.search`.
+    """
+    product = models.ForeignKey(Product, related_name='search_terms', on_delete=models.CASCADE)
+    term = models.CharField(_("Term"), max_length=64, db_index=True)
+    weight = models.IntegerField(_("Weight"), default=1)
+
+    class Meta:
+        verbose_name = _("Product Search Term")
+        verbose_name_plural = _("Product Search Terms")
+        unique_together = (('term', 'product'),)
+
+    def __str__(self):
+        return self.term
+
+
+RANKING_VERSION_KEY = 'product-ranking-version-%s'
+
+
+class ProductRankingManager(models.Manager):
+
+    def version(self, site_id):
+        """Changes whenever the counters of the site change, so that the
+        cached bestseller and highest rated lists keyed on it are dropped."""
+        key = RANKING_VERSION_KEY % site_id
+        version = cache.get(key)
+        if version is None:
+            cache.add(key, time.time(), None)
+            version = cache.get(key)
+        return version
+
+    def _changed(self, site_id):
+        cache.set(RANKING_VERSION_KEY % site_id, time.time(), None)
+
+    def _rows(self, site_id, product_ids):
+        """Make sure the site has a ranking row for each of the products."""
+        self.bulk_create([ProductRanking(site_id=site_id, product_id=pk) for pk in product_ids],
+                         ignore_conflicts=True)
+
+    def _order_units(self, order):
+        units = {}
+        for product_id, quantity in order.orderitem_set.values_list('product_id', 'quantity'):
+            units[product_id] = units.get(product_id, Decimal('0')) + quantity
+        return units
+
+    def add_sales(self, order):
+        """Count the units of a successful order towards the bestsellers of its site, once."""
+        with transaction.atomic():
+            _counted, created = ProductRankingOrder.objects.get_or_create(order_id=order.pk)
+            if not created:
+                return
+            units = self._order_units(order)
+            self._rows(order.site_id, units)
+            for product_id, quantity in units.items():
+                self.filter(site_id=order.site_id, product_id=product_id).update(
+                    units_sold=models.F('units_sold') + quantity)
+        self._changed(order.site_id)
+
+    def remove_sales(self, order):
+        """Take the units of a cancelled order off the bestsellers, if they were counted."""
+        with transaction.atomic():
+            removed, _deleted = ProductRankingOrder.objects.filter(order_id=order.pk).delete()
+            if not removed:
+                return
+            for product_id, quantity in self._order_units(order).items():
+                self.filter(site_id=order.site_id, product_id=product_id).update(
+                    units_sold=models.F('units_sold') - quantity)
+        self._changed(order.site_id)
+
+    def set_rating(self, site_id, product_id, rating_sum, rating_count):
+        """Store the totals of the public ratings of a product on a site."""
+        if rating_count:
+            self._rows(site_id, [product_id])
+        average = rating_count and float(rating_sum) / rating_count or 0
+        self.filter(site_id=site_id, product_id=product_id).update(
+            rating_sum=rating_sum, rating_count=rating_count, rating_average=average)
+        self._changed(site_id)
+
+    def rebuild(self, site, units=None, ratings=None, orders=None):
+        """
+        Replace the counters of a site, with `units` mapping product ids to the
+        units sold, and `ratings` mapping them to (rating sum, rating count).
+        Counters which are not given are left as they are.  `orders` are the
+        ids of the orders counted in `units`.
+        """
+        fields = []
+        if units is not None:
+            fields.append('units_sold')
+        if ratings is not None:
+            fields.extend(('rating_sum', 'rating_count', 'rating_average'))
+        if not fields:
+            return 0
+
+        with transaction.atomic():
+            self._rows(site.pk, set(units or ()) | set(ratings or ()))
+            rows = []
+            for row in self.filter(site=site):
+                if units is not None:
+                    row.units_sold = units.get(row.product_id, 0)
+                if ratings is not None:
+                    row.rating_sum, row.rating_count = ratings.get(row.product_id, (0, 0))
+                    row.rating_average = row.rating_count and float(row.rating_sum) / row.rating_count or 0
+                rows.append(row)
+            self.bulk_update(rows, fields, batch_size=500)
+            if units is not None:
+                ProductRankingOrder.objects.filter(order__site=site).delete()
+                ProductRankingOrder.objects.bulk_create(
+                    [ProductRankingOrder(order_id=pk) for pk in orders or ()], batch_size=500)
+            removed, _deleted = self.filter(site=site, units_sold=0, rating_count=0).delete()
+        self._changed(site.pk)
+        return len(rows) - removed
+
+    def _top(self, site, count, ordering, **kwargs):
+        if site is None:
+            site = Site.objects.get_current()
+        rankings = self.filter(site=site, product__active=True, product__site=site, **kwargs) \
+                       .select_related('product').order_by(ordering, 'product_id')
+        if count:
+            rankings = rankings[:count]
+        return [ranking.product for ranking in rankings]
+
+    def bestsellers(self, count=0, site=None):
+        """The active products of the site which sold the most units, all of them if count is 0."""
+        return self._top(site, count, '-units_sold', units_sold__gt=0)
+
+    def highest_rated(self, count=0, site=None):
+        """The active products of the site with the highest average rating, all of them if count is 0."""
+        return self._top(site, count, '-rating_average', rating_count__gt=0)
+
+
+class ProductRanking(models.Model):
+    """
+    The sales and rating counters of a product on a site, which the
+    bestseller and highest rated lists are read from.  Sales are added when
+    an order succeeds and taken off when it is cancelled, ratings are set by
+    the productratings app.  Both can be counted again with the
+    satchmo_rebuild_rankings command.
+    """
+    site = models.ForeignKey(Site, verbose_name=_('Site'), on_delete=models.CASCADE)
+    product = models.ForeignKey(Product, related_name='rankings', on_delete=models.CASCADE)
+    units_sold = models.DecimalField(_("Units sold"), max_digits=18, decimal_places=6, default=Decimal('0'))
+    rating_sum = models.IntegerField(_("Rating sum"), default=0)
+    rating_count = models.IntegerField(_("Rating count"), default=0)
+    rating_average = models.FloatField(_("Average rating"), default=0)
+
+    objects = ProductRankingManager()
+
+    class Meta:
+        verbose_name = _("Product Ranking")
+        verbose_name_plural = _("Product Rankings")
+        unique_together = (('site', 'product'),)
+        indexes = [
+            models.Index(fields=['site', '-units_sold'], name='product_ranking_sold_idx'),
+            models.Index(fields=['site', '-rating_average'], name='product_ranking_rated_idx'),
+        ]
+
+
+class ProductRankingOrder(models.Model):
+    """
+    An order whose units are counted in the rankings, so that they are added
+    once however often the order succeeds, and taken off when it is cancelled.
+    """
+    order = models.OneToOneField('shop.Order', primary_key=True, on_delete=models.CASCADE)
+
+    class Meta:
+        verbose_name = _("Ranked Order")
+        verbose_name_plural = _("Ranked Orders")
+
+
 @python_2_unicode_compatible
 class CategoryAttribute(models.Model):
     """
@@ -1508,7 +2225,7 @@ class Price(models.Model):
             return  # Duplicate Price
 
         super(Price, self).save(**kwargs)
-        ProductPriceLookup.objects.smart_create_for_product(self.product)
+        ProductPriceLookup.objects.refresh_for_product(self.product)
 
     class Meta:
         ordering = ['expires', '-quantity']
@@ -1616,3 +2333,46 @@ def split_option_unique_id(uid):
 
     parts = uid.split('-')
     return (parts[0], '-'.join(parts[1:]))
+
+
+def category_nav_listener(sender, **kwargs):
+    if kwargs.get('action', 'post_').startswith('post_'):
+        Category.objects.clear_nav_tree()
+
+
+models.signals.post_save.connect(category_nav_listener, sender=CategoryTranslation)
+models.signals.post_delete.connect(category_nav_listener, sender=CategoryTranslation)
+
+
+def product_count_pre_delete_listener(sender, instance=None, **kwargs):
+    instance._counted_categories = list(instance.category.values_list('id', flat=True))
+
+
+def product_count_post_delete_listener(sender, instance=None, **kwargs):
+    CategoryProductCount.objects.refresh(getattr(instance, '_counted_categories', []))
+
+
+def product_category_count_listener(sender, instance=None, action='', reverse=False, pk_set=None, **kwargs):
+    if reverse:
+        # a category had products added or removed
+        if action.startswith('post_'):
+            CategoryProductCount.objects.refresh([instance.pk])
+    elif action == 'pre_clear':
+        instance._counted_categories = list(instance.category.values_list('id', flat=True))
+    elif action == 'post_clear':
+        CategoryProductCount.objects.refresh(getattr(instance, '_counted_categories', []))
+    elif action.startswith('post_'):
+        CategoryProductCount.objects.refresh(pk_set or [])
+
+
+def product_site_count_listener(sender, instance=None, action='', reverse=False, pk_set=None, **kwargs):
+    if action.startswith('post_'):
+        if reverse:
+            CategoryProductCount.objects.refresh_products(pk_set or [])
+        else:
+            CategoryProductCount.objects.refresh_products([instance.pk])
+
+models.signals.pre_delete.connect(product_count_pre_delete_listener, sender=Product)
+models.signals.post_delete.connect(product_count_post_delete_listener, sender=Product)
+models.signals.m2m_changed.connect(product_category_count_listener, sender=Product.category.through)
+models.signals.m2m_changed.connect(product_site_count_listener, sender=Product.site.through)
@@ -6,12 +6,13 @@ from six import python_2_unicode_compatible
 from decimal import Decimal
 
 from django import forms
-from django.db import models
+from django.db import models, transaction
 from django.utils.translation import gettext_lazy as _
 from django.utils.encoding import smart_str
-from product.models import Option, Product, ProductPriceLookup, OptionGroup, Price, make_option_unique_id
+from product.models import CategoryProductCount, Option, Product, ProductPriceLookup, OptionGroup, Price, make_option_unique_id
 from product.prices import get_product_quantity_price, get_product_quantity_adjustments
 from satchmo_utils import cross_list
+from satchmo_utils.tablecache import TableCache
 from satchmo_utils.unique_id import slugify
 from . import config  # livesettings options
 
@@ -58,6 +59,83 @@ def get_all_options(obj, ids_only=False):
     return results
 
 
+class VariationMatrix(object):
+    """
+    The option groups and variations of a configurable product, loaded with
+    four queries and kept in `variation_matrices` until one of them is
+    changed.
+
+    - groups: the option group ids, in display order
+    - options: the option unique ids of each group, in display order
+    - variations: the product id of the variation for each sorted tuple of
+      option unique ids
+    - available: a bitset for each group of the options used by an active
+      variation with one option of every group, bit i stands for
+      options[group][i]
+    """
+
+    def __init__(self, product_id):
+        self.groups = list(OptionGroup.objects.filter(configurableproduct=product_id).values_list('id', flat=True))
+        self.options = dict((group, []) for group in self.groups)
+        self._positions = {}
+        for group, value in Option.objects.filter(option_group__in=self.groups).values_list('option_group_id', 'value'):
+            uid = make_option_unique_id(group, value)
+            self._positions[uid] = (self.groups.index(group), len(self.options[group]))
+            self.options[group].append(uid)
+
+        active = dict(ProductVariation.objects.filter(parent=product_id).order_by('pk').values_list('pk', 'product__active'))
+        options = dict((pk, []) for pk in active)
+        through = ProductVariation.options.through.objects.filter(productvariation__parent=product_id)
+        for pk, group, value in through.values_list('productvariation_id', 'option__option_group_id', 'option__value'):
+            options[pk].append(make_option_unique_id(group, value))
+
+        self.variations = {}
+        self.available = dict.fromkeys(self.groups, 0)
+        self._valid = []
+        for pk in sorted(active):
+            key = sorted_tuple(options[pk])
+            if key in self.variations:
+                # a duplicate, the first one is used
+                continue
+            self.variations[key] = pk
+            combination = self._combination(key)
+            if active[pk] and combination is not None:
+                self._valid.append(combination)
+                for uid in key:
+                    group, bit = self._positions[uid]
+                    self.available[self.groups[group]] |= 1 << bit
+        self._valid.sort()
+
+    def _combination(self, key):
+        """The positions of the options in the key, in group order, or None
+        unless the key has one option of every group."""
+        if len(key) != len(self.groups) or not all(uid in self._positions for uid in key):
+            return None
+        positions = sorted(self._positions[uid] for uid in key)
+        if [group for group, bit in positions] != list(range(len(self.groups))):
+            return None
+        return tuple(bit for group, bit in positions)
+
+    def get(self, options):
+        """The product id of the variation with the sorted tuple of option
+        unique ids, or None."""
+        return self.variations.get(options, None)
+
+    def valid_options(self):
+        """The option unique ids of every active variation, as
+        ConfigurableProduct.get_valid_options returns them."""
+        return [[self.options[group][bit] for group, bit in zip(self.groups, combination)]
+                for combination in self._valid]
+
+    def available_options(self):
+        """The unique ids of the options used by active variations."""
+        return [uid for group in self.groups
+                for bit, uid in enumerate(self.options[group])
+                if self.available[group] & (1 << bit)]
+
+variation_matrices = TableCache('configurable-variations', VariationMatrix)
+
+
 @python_2_unicode_compatible
 class ConfigurableProduct(models.Model):
     """
@@ -98,19 +176,103 @@ class ConfigurableProduct(models.Model):
         Returns unique_ids from get_all_options(), but filters out Options that this
         ConfigurableProduct doesn't have a ProductVariation for.
         """
-        variations = self.productvariation_set.filter(product__active='1')
-        active_options = [v.unique_option_ids for v in variations]
-        all_options = get_all_options(self, ids_only=True)
-        return [opt for opt in all_options if self._unique_ids_from_options(opt) in active_options]
+        return self.variation_matrix.valid_options()
+
+    def _get_variation_matrix(self):
+        return variation_matrices.get(self.pk)
+
+    variation_matrix = property(_get_variation_matrix)
 
     def create_all_variations(self):
         """
         Get a list of all the optiongroups applied to this object
         Create all combinations of the options and create variations
         """
-        # Create a new ProductVariation for each combination.
-        for options in self.get_all_options():
-            self.create_variation(options)
+        return self.create_variations()
+
+    def create_variations(self, variations=None):
+        """
+        Create the missing variations in bulk.  `variations` is a list of
+        (options, name, sku, slug) tuples, every combination of the options
+        when None.  Existing variations are left alone.
+
+        The slugs already taken are read in one query, the products,
+        variations, site and option links are inserted with bulk_create, and
+        the price lookups are built once at the end.  Returns the new
+        variant products.
+        """
+        if variations is None:
+            variations = [(options, "", "", "") for options in self.get_all_options()]
+
+        matrix = VariationMatrix(self.pk)
+        existing = set(matrix.variations)
+        wanted = []
+        for options, name, sku, slug in variations:
+            key = self._unique_ids_from_options(options)
+            if key in existing:
+                continue
+            existing.add(key)
+            if slug:
+                slug = slugify(slug)
+            else:
+                slug = slugify('%s_%s' % (self.product.slug, '_'.join([opt.value for opt in options])))
+            wanted.append((options, name, sku, slug))
+        if not wanted:
+            return []
+
+        # the slugs of existing products which could clash, and the ones
+        # made unique from them below
+        roots = set([slug.startswith(self.product.slug) and self.product.slug or slug
+                     for options, name, sku, slug in wanted])
+        clashing = models.Q()
+        for root in roots:
+            clashing |= models.Q(slug__startswith=root)
+        taken = set(Product.objects.filter(clashing).values_list('slug', flat=True))
+
+        group_order = dict((group, ix) for ix, group in enumerate(matrix.groups))
+        today = datetime.date.today()
+        variants = []
+        for options, name, sku, slug in wanted:
+            while slug in taken:
+                slug = '_'.join((slug, six.text_type(self.product.id)))
+            taken.add(slug)
+            if not name:
+                # as ProductVariation._set_name does
+                names = [opt.name for opt in sorted(options,
+                         key=lambda opt: group_order.get(opt.option_group_id, len(group_order)))]
+                name = self.product.name
+                if names:
+                    name = '%s (%s)' % (name, '/'.join(names))
+            variants.append(Product(items_in_stock=0, name=name, slug=slug, sku=sku or slug, date_added=today))
+
+        sites = list(self.product.site.values_list('id', flat=True))
+        with transaction.atomic():
+            Product.objects.bulk_create(variants)
+            # not every database returns the primary keys of inserted rows
+            ids = dict(Product.objects.filter(slug__in=[variant.slug for variant in variants]).values_list('slug', 'id'))
+            for variant in variants:
+                variant.pk = ids[variant.slug]
+
+            ProductVariation.objects.bulk_create([ProductVariation(product=variant, parent=self) for variant in variants])
+            Product.site.through.objects.bulk_create([Product.site.through(product_id=variant.pk, site_id=site_id)
+                                                      for variant in variants for site_id in sites])
+            OptionLink = ProductVariation.options.through
+            OptionLink.objects.bulk_create([OptionLink(productvariation_id=variant.pk, option_id=option_id)
+                                            for variant, (options, name, sku, slug) in zip(variants, wanted)
+                                            for option_id in set([opt.pk for opt in options])])
+
+        # bulk_create sends no signals, so do what the listeners would
+        variation_matrices.clear()
+        CategoryProductCount.objects.refresh_products([self.pk])
+        ProductPriceLookup.objects.refresh_for_product(self.product)
+        from product.search import get_search_backend
+        backend = get_search_backend()
+        if getattr(backend, 'uses_index', False):
+            backend.index_products(Product.objects.filter(pk__in=[variant.pk for variant in variants]).prefetch_related(
+                'translations', 'productattribute_set'))
+
+        log.info("Created %i variations for [%s]", len(variants), self.product.slug)
+        return variants
 
     def create_variation(self, options, name="", sku="", slug=""):
         """Create a productvariation with the specified options.
@@ -196,17 +358,18 @@ class ConfigurableProduct(models.Model):
         Returns the product that matches or None
         """
         options = self._unique_ids_from_options(options)
-        pv = None
         if hasattr(self, '_variation_cache'):
             pv = self._variation_cache.get(options, None)
-        else:
-            for member in self.productvariation_set.all():
-                if member.unique_option_ids == options:
-                    pv = member
-                    break
-        if pv:
-            return pv.product
-        return None
+            if pv:
+                return pv.product
+            return None
+        product_id = self.variation_matrix.get(options)
+        if product_id is None:
+            return None
+        try:
+            return Product.objects.get(pk=product_id)
+        except Product.DoesNotExist:
+            return None
 
     def get_variations_for_options(self, options):
         """
@@ -257,7 +420,7 @@ class ConfigurableProduct(models.Model):
             self.create_subs = False
             super(ConfigurableProduct, self).save(**kwargs)
 
-        ProductPriceLookup.objects.smart_create_for_product(self.product)
+        ProductPriceLookup.objects.refresh_for_product(self.product)
 
     def get_absolute_url(self):
         return self.product.get_absolute_url()
@@ -460,7 +623,7 @@ class ProductVariation(models.Model):
             self.name = ""
 
         super(ProductVariation, self).save(**kwargs)
-        ProductPriceLookup.objects.smart_create_for_product(self.product)
+        ProductPriceLookup.objects.refresh_for_product(self.product)
 
     def _set_name(self, name):
         if not name:
@@ -498,3 +661,25 @@ class ProductVariation(models.Model):
 
     def __str__(self):
         return self.product.slug
+
+
+def variation_count_listener(sender, instance=None, **kwargs):
+    """The categories of the parent product count its variations."""
+    CategoryProductCount.objects.refresh_products([instance.parent_id])
+
+models.signals.post_save.connect(variation_count_listener, sender=ProductVariation)
+models.signals.post_delete.connect(variation_count_listener, sender=ProductVariation)
+
+
+def variation_active_listener(sender, instance=None, **kwargs):
+    """Whether a variation is active is kept in its parent's matrix."""
+    if hasattr(instance, 'productvariation'):
+        variation_matrices.discard(instance.productvariation.parent_id)
+
+models.signals.post_save.connect(variation_matrices.clear, sender=ProductVariation)
+models.signals.post_delete.connect(variation_matrices.clear, sender=ProductVariation)
+models.signals.m2m_changed.connect(variation_matrices.clear, sender=ProductVariation.options.through)
+models.signals.m2m_changed.connect(variation_matrices.clear, sender=ConfigurableProduct.option_group.through)
+models.signals.post_save.connect(variation_matrices.clear, sender=Option)
+models.signals.post_delete.connect(variation_matrices.clear, sender=Option)
+models.signals.post_save.connect(variation_active_listener, sender=Product)
@@ -2,8 +2,8 @@ from decimal import Decimal
 from django.contrib.sites.models import Site
 from django.test import TestCase
 from django.utils import timezone
-from product.models import Option, OptionGroup, Product, Price
-from product.modules.configurable.models import ConfigurableProduct, ProductVariation
+from product.models import Option, OptionGroup, Product, Price, ProductPriceLookup
+from product.modules.configurable.models import ConfigurableProduct, ProductVariation, get_all_options, sorted_tuple, variation_matrices
 import keyedcache
 from product.utils import serialize_options, productvariation_details
 
@@ -116,6 +116,31 @@ class OptionGroupTest(TestCase):
         django_config.save()
         self.assertEqual(ProductVariation.objects.filter(parent=django_config).count(), 4)
 
+    def testCreateVariations(self):
+        """Create all the variations of a product in bulk."""
+        django_shirt = Product.objects.create(slug="django-shirt", name="Django shirt")
+        django_shirt.site.add(self.site)
+        shirt_price = Price.objects.create(product=django_shirt, price="10.5")
+        django_config = ConfigurableProduct.objects.create(product=django_shirt)
+        django_config.option_group.add(self.sizes, self.colors)
+        clash_shirt = Product.objects.create(slug="django-shirt_small_black",
+            name="Django Shirt (Black/Small)")
+
+        self.assertEqual(len(django_config.create_variations()), 4)
+        self.assertEqual(django_config.create_variations(), [])
+        self.assertEqual(ProductVariation.objects.filter(parent=django_config).count(), 4)
+
+        large_white = django_config.get_product_from_options([self.option_large, self.option_white])
+        self.assertEqual(large_white.name, "Django shirt (Large/White)")
+        self.assertEqual(large_white.sku, large_white.slug)
+        self.assertEqual(list(large_white.site.all()), [self.site])
+        self.assertEqual(large_white.productvariation.unit_price, Decimal("16.50"))
+        self.assertEqual(ProductPriceLookup.objects.filter(productslug=large_white.slug).count(), 1)
+
+        small_black = django_config.get_product_from_options([self.option_small, self.option_black])
+        self.assertNotEqual(small_black, clash_shirt)
+        self.assertEqual(small_black.slug, "django-shirt_small_black_%i" % django_shirt.id)
+
 
 class ProductTest(TestCase):
     """Test Product functions"""
@@ -200,6 +225,30 @@ class ConfigurableProductTest(TestCase):
             dj_rocks.get_variations_for_options([])],
             [6, 7, 8, 9, 10, 11, 12, 13, 14])
 
+    def test_variation_matrix(self):
+        dj_rocks = ConfigurableProduct.objects.get(product__slug="dj-rocks")
+        active = [v.unique_option_ids for v in dj_rocks.productvariation_set.filter(product__active=True)]
+        expected = [opts for opts in get_all_options(dj_rocks, ids_only=True)
+                    if sorted_tuple(opts) in active]
+        self.assertEqual(dj_rocks.get_valid_options(), expected)
+
+        small_black = Product.objects.get(pk=6)
+        key = small_black.productvariation.unique_option_ids
+        self.assertEqual(dj_rocks.get_product_from_options(key), small_black)
+
+        # saving a product which is no variation keeps the matrix
+        matrix = variation_matrices.get(dj_rocks.pk)
+        dj_rocks.product.save()
+        self.assertIs(variation_matrices.get(dj_rocks.pk), matrix)
+
+        # switching the variation off takes it out of the valid options
+        small_black.active = False
+        small_black.save()
+        valid = [sorted_tuple(opts) for opts in dj_rocks.get_valid_options()]
+        self.assertNotIn(key, valid)
+        self.assertEqual(len(valid), len(expected) - 1)
+        self.assertEqual(dj_rocks.get_product_from_options(key), small_black)
+
 
 if __name__ == "__main__":
     import doctest
@@ -34,6 +34,178 @@ def get_product_quantity_price(product, qty=Decimal('1'), delta=Decimal("0.00"),
 
     return adjustments.final_price()+delta
 
+def bulk_quantity_prices(products, qty=Decimal('1'), include_discount=True):
+    """
+    Resolves `Product.get_qty_price(qty)` for many products at once.
+
+    The base prices of all products, and of the parents of any variations, are
+    found with a single query, and the price adjustments are sent in one
+    `satchmo_price_query_batch` signal before the per-price
+    `satchmo_price_query` signals.  Each product is primed with its result, so
+    that later calls to `get_qty_price` and `unit_price` need no queries.
+
+    Returns a dictionary of product id -> price.
+    """
+    from django.db.models import prefetch_related_objects
+    from product import signals
+    from product.models import Price, _subtype_relations
+
+    products = list(products)
+    if not products:
+        return {}
+
+    relations = _subtype_relations()
+    prefetch_related_objects(products, *relations)
+
+    plain = []
+    variations = []
+    others = []
+    for product in products:
+        subtype = product.get_subtype_with_attr('get_qty_price')
+        if subtype is None or subtype is product:
+            plain.append(product)
+        elif subtype._get_subtype() == 'ProductVariation':
+            variations.append(product)
+        else:
+            others.append(product)
+
+    if variations:
+        prefetch_related_objects(variations, 'productvariation__options', 'productvariation__parent__product')
+        parents = [product.productvariation.parent.product for product in variations]
+        prefetch_related_objects(parents, *relations)
+    else:
+        parents = []
+
+    # The price with the quantity closest to the one specified without going over,
+    # taking the cheapest one first, exactly as `get_product_quantity_adjustments` does.
+    best = {}
+    candidates = Price.objects.filter(
+        product__in=set([p.pk for p in plain + variations + parents]),
+        quantity__lte=qty).exclude(
+        expires__isnull=False,
+        expires__lt=datetime.date.today()).order_by('price', '-quantity', 'expires')
+    for price in candidates:
+        best.setdefault(price.product_id, price)
+
+    def resolve(product, parent=None):
+        """Returns the (price, product) pair whose adjustments price the product."""
+        price = best.get(product.pk)
+        if price is None and parent is not None:
+            return best.get(parent.pk), parent
+        return price, product
+
+    calcs = {}
+    if include_discount:
+        for product in plain:
+            _add_calc(calcs, *resolve(product))
+        for product in variations:
+            _add_calc(calcs, *resolve(product, product.productvariation.parent.product))
+
+        adjustments = list(calcs.values())
+        signals.satchmo_price_query_batch.send(Price, adjustments=adjustments)
+        for adjust in adjustments:
+            signals.satchmo_price_query.send(adjust.price, adjustment=adjust, slug=adjust.product.slug,
+                                             discountable=adjust.product.is_discountable, batch=True)
+
+    def adjusted(price, product):
+        if price is None:
+            return PriceAdjustmentCalc(None)
+        if include_discount:
+            return calcs[(price.pk, product.pk)]
+        return PriceAdjustmentCalc(price, product)
+
+    results = {}
+    for product in plain:
+        adjustment = adjusted(*resolve(product))
+        if include_discount:
+            price = adjustment.final_price()
+        elif adjustment.price is not None:
+            price = adjustment.price.price
+        else:
+            price = None
+        if not price:
+            price = product._get_fullPrice()
+        results[product.pk] = price
+
+    for product in variations:
+        variation = product.productvariation
+        delta = Decimal("0.00")
+        for option in variation.options.all():
+            if option.price_change:
+                delta += Decimal(option.price_change)
+        adjustment = adjusted(*resolve(product, variation.parent.product))
+        if include_discount:
+            # a price set on the variation itself is used as-is
+            if best.get(product.pk) is not None:
+                delta = Decimal("0.00")
+            price = adjustment.final_price() + delta
+        elif adjustment.price is not None:
+            price = adjustment.price.price + delta
+        else:
+            price = None
+        results[product.pk] = price
+
+    for product in others:
+        results[product.pk] = product.get_qty_price(qty, include_discount=include_discount)
+
+    for product in products:
+        product.set_qty_price_cache(qty, include_discount, results[product.pk])
+
+    return results
+
+def bulk_quantity_adjustments(items):
+    """
+    Gets the adjustments of many products at once, as
+    `get_product_quantity_adjustments` does for one, from a list of
+    (product, qty) pairs.
+
+    The candidate prices are found with a single query, and the adjustments
+    are sent in one `satchmo_price_query_batch` signal before the per-price
+    `satchmo_price_query` signals.
+
+    Returns a dictionary of (product id, qty) -> PriceAdjustmentCalc.
+    """
+    from product import signals
+    from product.models import Price
+
+    items = list(items)
+    if not items:
+        return {}
+
+    products = dict((product.pk, product) for product, qty in items)
+    candidates = {}
+    for price in Price.objects.filter(
+        product__in=products.keys(),
+        quantity__lte=max([qty for product, qty in items])).exclude(
+        expires__isnull=False,
+        expires__lt=datetime.date.today()).order_by('price', '-quantity', 'expires'):
+        candidates.setdefault(price.product_id, []).append(price)
+
+    calcs = {}
+    found = {}
+    for product, qty in items:
+        for price in candidates.get(product.pk, []):
+            if price.quantity <= qty:
+                _add_calc(calcs, price, product)
+                found[(product.pk, qty)] = calcs[(price.pk, product.pk)]
+                break
+
+    adjustments = list(calcs.values())
+    if adjustments:
+        signals.satchmo_price_query_batch.send(Price, adjustments=adjustments)
+        for adjust in adjustments:
+            signals.satchmo_price_query.send(adjust.price, adjustment=adjust, slug=adjust.product.slug,
+                                             discountable=adjust.product.is_discountable, batch=True)
+
+    results = {}
+    for product, qty in items:
+        results[(product.pk, qty)] = found.get((product.pk, qty)) or PriceAdjustmentCalc(None)
+    return results
+
+def _add_calc(calcs, price, product):
+    if price is not None and (price.pk, product.pk) not in calcs:
+        calcs[(price.pk, product.pk)] = PriceAdjustmentCalc(price, product)
+
 # -------------------------------------------
 # helper objects - not Django model objects
 
@@ -0,0 +1,177 @@
+"""Product search backends.
+
+The backend used by the default search listener is set by the
+PRODUCT.SEARCH_BACKEND setting, as the dotted path of a class with a
+`search(products, keywords)` method returning the matching products, sorted
+by the field names in its `ordering`, which end with a unique field so that
+the results can be paginated by keyset.  Backends with `uses_index` set are kept
+current through `index_product_listener` and rebuilt by
+satchmo_rebuild_search_index.
+"""
+from django.db import models, transaction
+from django.db.models import OuterRef, Q, Subquery, Sum
+from django.utils.html import strip_tags
+from livesettings.functions import config_value
+from product.models import Product, ProductAttribute, ProductSearchTerm, ProductTranslation
+from satchmo_utils import load_module
+import logging
+import re
+
+log = logging.getLogger('product.search')
+
+_TERM_RE = re.compile(r'\w+', re.UNICODE)
+TERM_LENGTH = ProductSearchTerm._meta.get_field('term').max_length
+
+
+def get_search_backend():
+    path = config_value('PRODUCT', 'SEARCH_BACKEND')
+    modulename, classname = path.rsplit('.', 1)
+    return getattr(load_module(modulename), classname)()
+
+
+def tokenize(text):
+    """Split text, which may contain HTML, into lower case search terms."""
+    if not text:
+        return []
+    return [term[:TERM_LENGTH] for term in _TERM_RE.findall(strip_tags(text).lower()) if len(term) > 1]
+
+
+class SimpleSearchBackend(object):
+    """Match every keyword against the product text columns with `icontains`."""
+    uses_index = False
+    ordering = ('ordering', 'name', 'pk')
+
+    def search(self, products, keywords):
+        for keyword in keywords:
+            products = products.filter(
+                Q(name__icontains=keyword)
+                | Q(short_description__icontains=keyword)
+                | Q(description__icontains=keyword)
+                | Q(meta__icontains=keyword)
+                | Q(sku__iexact=keyword) )
+        return products.order_by(*self.ordering)
+
+
+class IndexedSearchBackend(object):
+    """
+    Search the ProductSearchTerm index.  Every keyword must prefix a term of
+    the product, and results are ranked by the total weight of the matching
+    terms.  The result is a lazy queryset, which can be paginated as is.
+    """
+    uses_index = True
+    ordering = ('-search_rank', 'ordering', 'name', 'pk')
+
+    # weight of a term by the field it was found in
+    weights = (
+        ('name', 10),
+        ('sku', 10),
+        ('meta', 3),
+        ('short_description', 2),
+        ('description', 1),
+    )
+    attribute_weight = 2
+
+    def search(self, products, keywords):
+        terms = []
+        for keyword in keywords:
+            terms.extend(tokenize(keyword))
+        if not terms:
+            return products.annotate(search_rank=models.Value(0, output_field=models.IntegerField())).order_by(
+                *self.ordering)
+
+        matching = Q()
+        for term in terms:
+            products = products.filter(id__in=ProductSearchTerm.objects.filter(term__startswith=term).values('product'))
+            matching |= Q(term__startswith=term)
+
+        rank = ProductSearchTerm.objects.filter(matching, product=OuterRef('pk')).values('product').annotate(
+            rank=Sum('weight')).values('rank')
+        return products.annotate(search_rank=Subquery(rank, output_field=models.IntegerField())).order_by(
+            *self.ordering)
+
+    def product_terms(self, product):
+        """Get the dictionary of term -> weight for a product.  Translations and
+        attributes are read through `all()`, so they can be prefetched."""
+        found = {}
+
+        def add(text, weight):
+            for term in tokenize(text):
+                found[term] = found.get(term, 0) + weight
+
+        translations = [translation for translation in product.translations.all() if translation.active]
+        for field, weight in self.weights:
+            add(getattr(product, field), weight)
+            for translation in translations:
+                add(getattr(translation, field, None), weight)
+        if product.sku:
+            # so that a keyword matching the whole sku still finds it
+            sku = product.sku.lower()[:TERM_LENGTH]
+            found[sku] = found.get(sku, 0) + dict(self.weights)['sku']
+
+        for attribute in product.productattribute_set.all():
+            add(attribute.value, self.attribute_weight)
+        return found
+
+    def _write_terms(self, products):
+        rows = []
+        for product in products:
+            rows.extend([ProductSearchTerm(product=product, term=term, weight=weight)
+                         for term, weight in self.product_terms(product).items()])
+        with transaction.atomic():
+            ProductSearchTerm.objects.filter(product__in=[product.pk for product in products]).delete()
+            ProductSearchTerm.objects.bulk_create(rows)
+        return len(rows)
+
+    def index_product(self, product):
+        """Refresh the index entries of a single product."""
+        return self._write_terms([product])
+
+    def index_products(self, products):
+        """Refresh the index entries of several products, which should have
+        their translations and attributes prefetched."""
+        return self._write_terms(list(products))
+
+    def rebuild_index(self, chunk_size=500):
+        """Rebuild the index of all products, `chunk_size` products at a time.
+        Returns the number of terms written."""
+        ids = list(Product.objects.order_by('pk').values_list('pk', flat=True))
+        ct = 0
+        for start in range(0, len(ids), chunk_size):
+            products = list(Product.objects.filter(pk__in=ids[start:start + chunk_size]).prefetch_related(
+                'translations', 'productattribute_set'))
+            ct += self._write_terms(products)
+        ProductSearchTerm.objects.exclude(product__in=Product.objects.all()).delete()
+        return ct
+
+
+def _index_if_exists(backend, product_id):
+    product = Product.objects.filter(pk=product_id).first()
+    if product is not None:
+        backend.index_product(product)
+
+
+def index_product_listener(sender, instance=None, raw=False, signal=None, **kwargs):
+    """Keep the search index current when a product, its translations or its
+    attributes change."""
+    if raw:
+        return
+    backend = get_search_backend()
+    if not getattr(backend, 'uses_index', False):
+        return
+    if isinstance(instance, Product):
+        backend.index_product(instance)
+    elif signal is models.signals.post_delete:
+        # its product may be getting deleted too, with its row still there
+        # now, so it is indexed once the deletion is committed, if it is
+        # still there then
+        product_id = instance.product_id
+        transaction.on_commit(lambda: _index_if_exists(backend, product_id))
+    else:
+        backend.index_product(instance.product)
+
+
+def start_index_listening():
+    models.signals.post_save.connect(index_product_listener, sender=Product)
+    for model in (ProductTranslation, ProductAttribute):
+        models.signals.post_save.connect(index_product_listener, sender=model)
+        models.signals.post_delete.connect(index_product_listener, sender=model)
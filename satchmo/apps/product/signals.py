@@ -71,6 +71,20 @@ index_prerender = django.dispatch.Signal()
 #: .. Note:: *price* is the same as *sender*
 satchmo_price_query = django.dispatch.Signal()
 
+#: Sent once by ``product.prices.bulk_quantity_prices`` with the price
+#: adjustments of many products, before ``satchmo_price_query`` is sent for
+#: each of them with the extra argument *batch* set to ``True``.
+#:
+#: Listeners which can resolve their adjustments for many products in a few
+#: queries should do so here, and ignore ``satchmo_price_query`` calls where
+#: *batch* is ``True``.
+#:
+#: :param sender: ``product.models.Price``
+#:
+#: :param adjustments: A list of ``product.prices.PriceAdjustmentCalc``
+#:   objects, one per distinct price and product.
+satchmo_price_query_batch = django.dispatch.Signal()
+
 #: Sent when a downloadable product is successful.
 #:
 #: :param sender: The product that was successfully ordered.
@@ -2,10 +2,11 @@ from django import template
 from django.template import Node, Variable
 from django.template import TemplateSyntaxError
 from livesettings.functions import config_value
-from product.models import Product
+from product.models import CategoryProductCount, Product
+from product.prices import bulk_quantity_prices
 from product.queries import bestsellers
+from satchmo_utils.singleflight import cache_lookup
 from satchmo_utils.templatetags import get_filter_args
-import keyedcache
 
 register = template.Library()
 
@@ -17,7 +18,9 @@ def best_selling_products_list(count):
     except ValueError:
         ct = config_value('PRODUCT','NUM_PAGINATED')
 
-    return bestsellers(ct)
+    products = list(bestsellers(ct))
+    bulk_quantity_prices(products)
+    return products
 
 @register.filter
 def recent_products_list(count):
@@ -27,8 +30,9 @@ def recent_products_list(count):
     except ValueError:
         ct = config_value('PRODUCT','NUM_PAGINATED')
 
-    query = Product.objects.recent_by_site()
-    return query[:ct]
+    products = list(Product.objects.recent_by_site()[:ct])
+    bulk_quantity_prices(products)
+    return products
 
 def is_producttype(product, ptype):
     """Returns True if product is ptype"""
@@ -47,16 +51,10 @@ def product_count(category, args=''):
     """
     args, kwargs = get_filter_args(args, boolargs=('variations'))
     variations = kwargs.get('variations', False)
-    try:
-        ct = keyedcache.cache_get('product_count', category, variations)
-    except keyedcache.NotCachedError:
-        if not category:
-            ct = Product.objects.active_by_site(variations=variations).count()
-        else:
-            ct = category.active_products(include_children=True, variations=variations).count()
-
-        keyedcache.cache_set('product_count', category, args, value=ct)
-    return ct
+    if category:
+        return CategoryProductCount.objects.product_count(category, variations=variations)
+    return cache_lookup(('product_count', None, variations),
+                        lambda: Product.objects.active_by_site(variations=variations).count())
 
 register.filter('product_count', product_count)
 
@@ -90,7 +88,8 @@ class FeaturedListNode(Node):
 
     def render(self, context):
 
-        prods = Product.objects.featured_by_site()
+        prods = list(Product.objects.featured_by_site())
+        bulk_quantity_prices(prods)
         context[self.var] = prods
 
         context.push()
@@ -139,8 +138,8 @@ def product_sort_by_price(products):
     """
 
     if products:
-        fast = [(product.unit_price, product) for product in products]
-        fast.sort()
-        return zip(*fast)[1]
+        products = list(products)
+        bulk_quantity_prices(products)
+        return sorted(products, key=lambda product: product.unit_price)
 
 register.filter('product_sort_by_price', product_sort_by_price)
@@ -16,10 +16,12 @@ except ImportError:
 
 import keyedcache
 import six
+from livesettings.functions import config_get
 
 from product.forms import ProductExportForm
-from product.models import Category, Discount, Option, OptionGroup, Product, Price
-from product.prices import get_product_quantity_adjustments, PriceAdjustment, PriceAdjustmentCalc
+from product.models import AttributeOption, Category, CategoryClosure, CategoryProductCount, CategoryTranslation, Discount, Option, OptionGroup, Product, Price, ProductAttribute, ProductPriceLookup, ProductPriceLookupChange, ProductRanking, ProductSearchTerm, ProductTranslation
+from product.search import IndexedSearchBackend, SimpleSearchBackend
+from product.prices import bulk_quantity_prices, get_product_quantity_adjustments, PriceAdjustment, PriceAdjustmentCalc
 from . import signals
 
 
@@ -108,6 +110,68 @@ class CategoryTest(TestCase):
         })
         self.assertEqual(self.womens_jewelry.get_absolute_url(), exp_url)
 
+    def test_closure_follows_moves(self):
+        rings = Category.objects.create(slug="rings", name="Rings", parent=self.pet_jewelry)
+        self.assertEqual(rings._recurse_for_parents(rings), [self.pet_jewelry])
+
+        self.pet_jewelry.parent = self.womens_jewelry
+        self.pet_jewelry.save()
+        rings = Category.objects.get(pk=rings.pk)
+        self.assertEqual(rings._recurse_for_parents(rings), [self.womens_jewelry, self.pet_jewelry])
+        self.assertEqual(self.womens_jewelry.get_all_children(), [self.pet_jewelry, rings])
+        self.assertEqual(CategoryClosure.objects.get(ancestor=self.womens_jewelry, descendant=rings).depth, 2)
+
+        self.pet_jewelry.delete()
+        rings = Category.objects.get(pk=rings.pk)
+        self.assertEqual(rings._recurse_for_parents(rings), [])
+        self.assertEqual(self.womens_jewelry.get_all_children(), [])
+
+    def test_search_with_children(self):
+        self.pet_jewelry.parent = self.womens_jewelry
+        self.pet_jewelry.save()
+        Category.objects.create(slug="rings", name="Rings", parent=self.pet_jewelry)
+        hidden = Category.objects.create(slug="hidden", name="Hidden", parent=self.womens_jewelry, is_active=False)
+        Category.objects.create(slug="below", name="Below", parent=hidden)
+        CategoryProductCount.objects.rebuild()
+
+        expected = set()
+        for cat in Category.objects.search_by_site("jewelry"):
+            expected.update(cat._descendants(only_active=True, include_self=True).values_list('pk', flat=True))
+        with self.assertNumQueries(1):
+            found = [cat.pk for cat in Category.objects.search_by_site("jewelry", include_children=True)]
+        self.assertEqual(sorted(found), sorted(expected))
+        self.assertTrue(self.womens_jewelry.pk in found)
+        self.assertFalse(hidden.pk in found)
+
+    def test_nav_tree(self):
+        self.pet_jewelry.parent = self.womens_jewelry
+        self.pet_jewelry.save()
+        CategoryTranslation.objects.create(category=self.pet_jewelry, languagecode='fr', name="Bijoux")
+
+        tree = Category.objects.nav_tree(language_code='en')
+        self.assertEqual([node['slug'] for node in tree], ['womens-jewelry'])
+        child = tree[0]['children'][0]
+        self.assertEqual(child['id'], self.pet_jewelry.id)
+        self.assertEqual(child['url'], self.pet_jewelry.get_absolute_url())
+        self.assertEqual(Category.objects.nav_tree(language_code='fr')[0]['children'][0]['name'], "Bijoux")
+
+        with self.assertNumQueries(0):
+            Category.objects.nav_tree(site=self.site, language_code='en')
+
+        self.pet_jewelry.name = "Pet Bling"
+        self.pet_jewelry.save()
+        tree = Category.objects.nav_tree(language_code='en')
+        self.assertEqual(tree[0]['children'][0]['name'], "Pet Bling")
+
+    def test_all_children_order(self):
+        b = Category.objects.create(slug="b", name="B", parent=self.womens_jewelry, ordering=2)
+        a = Category.objects.create(slug="a", name="A", parent=self.womens_jewelry, ordering=1)
+        a1 = Category.objects.create(slug="a1", name="A1", parent=a)
+        hidden = Category.objects.create(slug="hidden", name="Hidden", parent=b, is_active=False)
+        Category.objects.create(slug="under-hidden", name="Under hidden", parent=hidden)
+        self.assertEqual(self.womens_jewelry.get_all_children(include_self=True),
+                         [self.womens_jewelry, a, a1, b])
+
 #    def test_infinite_loop(self):
 #        """Check that Category methods still work on a Category whose parents list contains an infinite loop."""
 #        # Create two Categories that are each other's parents. First make sure that
@@ -503,6 +567,203 @@ class ProductTest(TestCase):
         self.assertEqual(p.smart_attr('height'), None)
         self.assertEqual(sb.smart_attr('height'), None)
 
+class BulkPriceLookupTest(TestCase):
+    fixtures = ['products.yaml']
+
+    def tearDown(self):
+        keyedcache.cache_delete()
+
+    def _lookups(self):
+        return sorted(ProductPriceLookup.objects.values_list(
+            'siteid', 'productslug', 'parentid', 'key', 'quantity', 'price',
+            'active', 'discountable', 'items_in_stock'))
+
+    def test_bulk_matches_smart_create(self):
+        ProductPriceLookup.objects.rebuild_all()
+        expected = self._lookups()
+        self.assertTrue(expected)
+
+        ct = ProductPriceLookup.objects.rebuild_all(bulk=True)
+        self.assertEqual(ct, len(expected))
+        self.assertEqual(self._lookups(), expected)
+
+    def test_bulk_small_chunks(self):
+        ProductPriceLookup.objects.rebuild_all()
+        expected = self._lookups()
+
+        ProductPriceLookup.objects.bulk_rebuild(chunk_size=1)
+        self.assertEqual(self._lookups(), expected)
+
+class ProductSearchTest(TestCase):
+    fixtures = ['products.yaml']
+
+    def setUp(self):
+        config_get('PRODUCT', 'SEARCH_BACKEND').update('product.search.IndexedSearchBackend')
+        self.backend = IndexedSearchBackend()
+        self.backend.rebuild_index()
+        self.products = Product.objects.filter(slug__in=['dj-rocks', 'PY-Rocks', 'robot-attack'])
+
+    def tearDown(self):
+        config_get('PRODUCT', 'SEARCH_BACKEND').update('product.search.SimpleSearchBackend')
+        keyedcache.cache_delete()
+
+    def slugs(self, backend, keywords):
+        return [product.slug for product in backend.search(self.products, keywords)]
+
+    def test_matches_simple_backend(self):
+        for keywords in (['rocks'], ['python', 'shirt'], ['PY-Rocks'], ['nothing']):
+            self.assertEqual(sorted(self.slugs(self.backend, keywords)),
+                             sorted(self.slugs(SimpleSearchBackend(), keywords)))
+
+    def test_ranked_and_incremental(self):
+        self.assertEqual(self.slugs(self.backend, ['robot']), ['robot-attack'])
+
+        product = Product.objects.get(slug='PY-Rocks')
+        product.meta = "Robots wear it too"
+        product.save()
+        self.assertEqual(self.slugs(self.backend, ['robot']), ['robot-attack', 'PY-Rocks'])
+
+    def test_delete_with_translations_and_attributes(self):
+        product = Product.objects.get(slug='PY-Rocks')
+        option = AttributeOption.objects.create(description='Fabric', name='fabric', validation='product.utils.validation_simple')
+        ProductAttribute.objects.create(product=product, option=option, value='Organic cotton')
+        ProductTranslation.objects.create(product=product, languagecode='fr', name='Chemise python')
+        self.assertTrue(ProductSearchTerm.objects.filter(product=product, term='cotton').exists())
+
+        pk = product.pk
+        with self.captureOnCommitCallbacks(execute=True):
+            product.delete()
+        self.assertFalse(ProductSearchTerm.objects.filter(product=pk).exists())
+
+    def test_delete_translation(self):
+        product = Product.objects.get(slug='PY-Rocks')
+        translation = ProductTranslation.objects.create(product=product, languagecode='fr', name='Chemise python')
+        self.assertTrue(ProductSearchTerm.objects.filter(product=product, term='chemise').exists())
+
+        with self.captureOnCommitCallbacks(execute=True):
+            translation.delete()
+        self.assertFalse(ProductSearchTerm.objects.filter(product=product, term='chemise').exists())
+        self.assertTrue(ProductSearchTerm.objects.filter(product=product, term='python').exists())
+
+
+class PriceLookupSyncTest(TestCase):
+    fixtures = ['products.yaml']
+
+    def setUp(self):
+        ProductPriceLookup.objects.rebuild_all()
+
+    def tearDown(self):
+        config_get('PRODUCT', 'DEFER_PRICE_LOOKUPS').update(False)
+        keyedcache.cache_delete()
+
+    def test_unchanged_rows_untouched(self):
+        product = Product.objects.get(slug="dj-rocks")
+        before = dict(ProductPriceLookup.objects.values_list('pk', 'price'))
+        created, updated, deleted = ProductPriceLookup.objects.sync_products([product.pk])
+        self.assertEqual((created, updated, deleted), (0, 0, 0))
+        self.assertEqual(dict(ProductPriceLookup.objects.values_list('pk', 'price')), before)
+
+    def test_price_change_updates_rows(self):
+        product = Product.objects.get(slug="PY-Rocks")
+        lookup = ProductPriceLookup.objects.get(productslug="PY-Rocks", quantity=1)
+        price = product.price_set.get(quantity=1)
+        price.price = Decimal("12.00")
+        price.save()
+
+        changed = ProductPriceLookup.objects.get(productslug="PY-Rocks", quantity=1)
+        self.assertEqual(changed.pk, lookup.pk)
+        self.assertEqual(changed.price, Decimal("12.00"))
+
+    def test_deferred_changes(self):
+        config_get('PRODUCT', 'DEFER_PRICE_LOOKUPS').update(True)
+        product = Product.objects.get(slug="PY-Rocks")
+        Price.objects.create(product=product, quantity=Decimal('10'), price=Decimal("10.00"))
+        self.assertFalse(ProductPriceLookup.objects.filter(productslug="PY-Rocks", quantity=10).exists())
+        self.assertEqual(ProductPriceLookupChange.objects.count(), 1)
+
+        ct, counts = ProductPriceLookup.objects.process_changes()
+        self.assertEqual(ct, 1)
+        self.assertEqual(counts, (1, 0, 0))
+        self.assertEqual(ProductPriceLookupChange.objects.count(), 0)
+        self.assertTrue(ProductPriceLookup.objects.filter(productslug="PY-Rocks", quantity=10).exists())
+
+class CategoryProductCountTest(TestCase):
+    fixtures = ['products.yaml']
+
+    def tearDown(self):
+        keyedcache.cache_delete()
+
+    def assertCountsMatch(self):
+        for category in Category.objects.all():
+            for include_children in (False, True):
+                for variations in (False, True):
+                    self.assertEqual(
+                        CategoryProductCount.objects.product_count(category, variations=variations,
+                                                                   include_children=include_children),
+                        category.active_products(variations=variations, include_children=include_children).count(),
+                        "%s include_children=%s variations=%s" % (category.slug, include_children, variations))
+
+    def test_counts_follow_changes(self):
+        self.assertCountsMatch()
+
+        product = Product.objects.get(slug='dj-rocks')
+        product.active = False
+        product.save()
+        self.assertCountsMatch()
+
+        category = Category.objects.filter(product__isnull=False).order_by('pk')[0]
+        product = category.product_set.all()[0]
+        product.category.remove(category)
+        self.assertCountsMatch()
+
+        moved = Category.objects.filter(parent__isnull=False).order_by('pk')[0]
+        moved.parent = Category.objects.filter(parent__isnull=True).exclude(pk=moved.parent_id).order_by('pk')[0]
+        moved.save()
+        self.assertCountsMatch()
+
+        moved.is_active = False
+        moved.save()
+        self.assertCountsMatch()
+
+    def test_refresh_updates_rows(self):
+        category = Category.objects.filter(product__isnull=False).order_by('pk')[0]
+        rows = set(CategoryProductCount.objects.filter(category=category).values_list('pk', flat=True))
+        self.assertTrue(rows)
+        # the rows are updated in place, rather than deleted and inserted
+        # again, which concurrent refreshes did at the same time
+        CategoryProductCount.objects.refresh([category.pk])
+        self.assertEqual(set(CategoryProductCount.objects.filter(category=category).values_list('pk', flat=True)), rows)
+        self.assertCountsMatch()
+
+    def test_rebuild(self):
+        CategoryProductCount.objects.all().delete()
+        CategoryProductCount.objects.rebuild()
+        self.assertCountsMatch()
+
+
+class ProductRankingTest(TestCase):
+    fixtures = ['products.yaml']
+
+    def slugs(self, products):
+        return [product.slug for product in products]
+
+    def test_rebuild_and_lists(self):
+        site = Site.objects.get_current()
+        dj, py, robot = [Product.objects.get(slug=slug) for slug in ('dj-rocks', 'PY-Rocks', 'robot-attack')]
+        ProductRanking.objects.rebuild(site, units={dj.pk: Decimal('2'), py.pk: Decimal('5')},
+                                       ratings={dj.pk: (5, 1), robot.pk: (7, 2)})
+        self.assertEqual(self.slugs(ProductRanking.objects.bestsellers(5)), ['PY-Rocks', 'dj-rocks'])
+        self.assertEqual(self.slugs(ProductRanking.objects.bestsellers(1)), ['PY-Rocks'])
+        self.assertEqual(self.slugs(ProductRanking.objects.highest_rated(5)), ['dj-rocks', 'robot-attack'])
+
+        ProductRanking.objects.rebuild(site, units={})
+        self.assertEqual(ProductRanking.objects.bestsellers(5), [])
+        self.assertEqual(ProductRanking.objects.filter(site=site).count(), 2)
+
+        ProductRanking.objects.set_rating(site.pk, dj.pk, 0, 0)
+        self.assertEqual(self.slugs(ProductRanking.objects.highest_rated(5)), ['robot-attack'])
+
+
 class PriceAdjustmentTest(TestCase):
     fixtures = ['products.yaml']
 
@@ -535,6 +796,40 @@ class PriceAdjustmentTest(TestCase):
         self.assertEqual(a.amount, Decimal(5))
         signals.satchmo_price_query.disconnect(five_off)
 
+class BulkQuantityPricesTest(TestCase):
+    fixtures = ['products.yaml']
+
+    def tearDown(self):
+        keyedcache.cache_delete()
+
+    def assert_parity(self, qty, include_discount=True):
+        expected = dict([(p.pk, p.get_qty_price(qty, include_discount=include_discount))
+                         for p in Product.objects.all()])
+        products = list(Product.objects.all())
+        prices = bulk_quantity_prices(products, qty, include_discount=include_discount)
+        self.assertEqual(prices, expected)
+        for product in products:
+            self.assertEqual(product.get_qty_price(qty, include_discount=include_discount), expected[product.pk])
+
+    def test_parity(self):
+        self.assert_parity(Decimal('1'))
+        self.assert_parity(Decimal('1'), include_discount=False)
+        self.assert_parity(Decimal('10'))
+
+    def test_parity_with_adjustments(self):
+        signals.satchmo_price_query.connect(five_off)
+        try:
+            self.assert_parity(Decimal('1'))
+        finally:
+            signals.satchmo_price_query.disconnect(five_off)
+
+    def test_primed_prices(self):
+        product = Product.objects.get(slug="dj-rocks")
+        bulk_quantity_prices([product])
+        with self.assertNumQueries(0):
+            self.assertEqual(product.unit_price, Decimal('20.00'))
+            self.assertEqual(product.get_qty_price(Decimal('1')), Decimal('20.00'))
+
 def five_off(sender, adjustment=None, **kwargs):
     adjustment += PriceAdjustment('half', 'Half', amount=Decimal(5))
 
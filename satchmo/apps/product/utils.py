@@ -8,6 +8,7 @@ from livesettings.functions import config_value
 from l10n.utils import moneyfmt
 from product.models import Option, ProductPriceLookup, OptionGroup, Discount, Product, split_option_unique_id
 from product.modules.configurable.models import sorted_tuple
+from product.prices import bulk_quantity_prices
 from satchmo_utils.numbers import round_decimal
 import datetime
 import logging
@@ -124,13 +125,17 @@ def productvariation_details(product, include_tax, user, create=False):
 
     return details
 
-def rebuild_pricing():
+def rebuild_pricing(bulk=False):
     site = Site.objects.get_current()
+    products = Product.objects.active_by_site(site=site, variations=False)
+
+    if bulk:
+        pricect = ProductPriceLookup.objects.bulk_rebuild(site=site)
+        return products.count(), pricect
+
     for lookup in ProductPriceLookup.objects.filter(siteid=site.id):
         lookup.delete()
 
-    products = Product.objects.active_by_site(site=site, variations=False)
-
     productct = products.count()
     pricect = 0
 
@@ -166,7 +171,12 @@ def serialize_options(product, selected_options=()):
     white/small, but you have no white/large - the customer will still see
     the options white and large.
     """
-    all_options = product.get_valid_options()
+    matrix = getattr(product, 'variation_matrix', None)
+    if matrix is not None:
+        # configurable products know the options of their active variations
+        all_options = [matrix.available_options()]
+    else:
+        all_options = product.get_valid_options()
     group_sortmap = OptionGroup.objects.get_sortmap()
 
     # first get all objects
@@ -309,10 +319,15 @@ def find_product_template(product, producttypes=None):
 def optionids_from_post(configurableproduct, POST):
     """Reads through the POST dictionary and tries to match keys to possible `OptionGroup` ids
     from the passed `ConfigurableProduct`"""
+    matrix = getattr(configurableproduct, 'variation_matrix', None)
+    if matrix is not None:
+        group_ids = matrix.groups
+    else:
+        group_ids = configurableproduct.option_group.values_list('id', flat=True)
     chosen_options = []
-    for opt_grp in configurableproduct.option_group.all():
-        if str(opt_grp.id) in POST:
-            chosen_options.append('%s-%s' % (opt_grp.id, POST[str(opt_grp.id)]))
+    for group_id in group_ids:
+        if str(group_id) in POST:
+            chosen_options.append('%s-%s' % (group_id, POST[str(group_id)]))
     return sorted_tuple(chosen_options)
     
 def display_featured(queryset=None, num_to_display=None, random_display=None):
@@ -331,7 +346,9 @@ def display_featured(queryset=None, num_to_display=None, random_display=None):
         queryset = queryset.order_by('?')
     
     if num_to_display and num_to_display < queryset.count():
-        return queryset[:num_to_display]
+        queryset = queryset[:num_to_display]
 
-    return queryset
+    products = list(queryset)
+    bulk_quantity_prices(products)
+    return products
     
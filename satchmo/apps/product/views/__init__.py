@@ -9,6 +9,7 @@ from django.views.generic import ListView, DetailView
 from l10n.utils import moneyfmt
 from livesettings.functions import config_value
 from product.models import Category, Product
+from product.prices import bulk_quantity_prices
 from product.modules.configurable.models import ConfigurableProduct
 from product.signals import index_prerender
 from product.utils import find_best_auto_discount, display_featured, find_product_template, optionids_from_post
@@ -54,6 +55,7 @@ class CategoryView(DetailView):
     def get_context_data(self, **kwargs):
         context = super(CategoryView, self).get_context_data(**kwargs)
         products = list(self.get_products())
+        bulk_quantity_prices(products)
         context['child_categories'] = self.object.get_all_children()
         context['sale'] = find_best_auto_discount(products)
         context['products'] = products
@@ -0,0 +1,9 @@
+from satchmo_store.shop.satchmo_settings import add_setting_defaults
+
+product_feeds_settings_defaults = {
+    # seconds after which a file built by satchmo_build_feeds is ignored,
+    # because the cron job which builds it has stopped
+    'PRODUCT_FEED_MAX_AGE' : 60*60*24*2,
+    }
+
+add_setting_defaults(product_feeds_settings_defaults)
@@ -0,0 +1,115 @@
+"""
+Renders the product feeds a chunk of products at a time.
+
+A feed template such as product_feeds/googlebase_atom.xml is made of three
+parts, product_feeds/googlebase_atom_head.xml, _entry.xml and _foot.xml.
+The head and foot are rendered once, and the entry for each product, so the
+feed can be streamed to the client or written to a file as it is rendered.
+"""
+from django.contrib.sites.models import Site
+from django.template import TemplateDoesNotExist
+from django.template.loader import get_template
+from django.utils import timezone
+from payment.config import credit_choices
+from product.models import Category, Product, _subtype_relations
+from satchmo_store.shop.models import Config
+from satchmo_store.shop.satchmo_settings import get_satchmo_setting
+from satchmo_utils.keyset import iterate_keyset
+import os
+import time
+try:
+    from django.core.urlresolvers import reverse
+except ImportError:
+    from django.urls import reverse
+
+
+def feed_products(category=None):
+    """The products listed in a feed: the active products of the shop or of
+    the category, leaving out configurable products, whose variations are
+    listed instead."""
+    if category:
+        products = category.active_products()
+    else:
+        products = Product.objects.active_by_site()
+
+    subtypes = _subtype_relations()
+    if 'configurableproduct' in subtypes:
+        products = products.filter(configurableproduct__isnull=True)
+
+    related = ['productimage_set', 'productattribute_set', 'category'] + subtypes
+    if 'productvariation' in subtypes:
+        related += ['productvariation__options__option_group', 'productvariation__parent__product']
+    return products.prefetch_related(*related)
+
+
+def feed_context(category=None):
+    """Everything but the products which the feed templates show."""
+    shop_config = Config.objects.get_current()
+
+    params = {}
+    view = 'satchmo_atom_feed'
+    if category:
+        params['category'] = category.slug
+        view = 'satchmo_atom_category_feed'
+
+    return {
+        'category': category,
+        'url': shop_config.base_url + reverse(view, None, params),
+        'shop': shop_config,
+        'payments': [c[1] for c in credit_choices(None, True)],
+        'date': timezone.now(),
+    }
+
+
+def feed_parts(template):
+    """The head, entry and foot templates of a feed template, or None if it
+    is not split into parts."""
+    base, ext = os.path.splitext(template)
+    try:
+        return [get_template('%s_%s%s' % (base, part, ext)) for part in ('head', 'entry', 'foot')]
+    except TemplateDoesNotExist:
+        return None
+
+
+def render_feed(parts, context, products, chunk_size=500):
+    """Yield the feed as it is rendered, one chunk of products at a time."""
+    head, entry, foot = parts
+    yield head.render(context)
+    for chunk in iterate_keyset(products, chunk_size=chunk_size):
+        entries = []
+        for product in chunk:
+            context['product'] = product
+            entries.append(entry.render(context))
+        yield ''.join(entries)
+    context.pop('product', None)
+    yield foot.render(context)
+
+
+def feed_file(template, category=None):
+    """The path of the gzipped file built for a feed of the current site by
+    satchmo_build_feeds, in SATCHMO_SETTINGS['PRODUCT_FEED_DIR'], or None if
+    the setting is not set."""
+    feed_dir = get_satchmo_setting('PRODUCT_FEED_DIR')
+    if not feed_dir:
+        return None
+    base, ext = os.path.splitext(os.path.basename(template))
+    base = '%s-site%i' % (base, Site.objects.get_current().id)
+    if category:
+        base = '%s-%s' % (base, category)
+    return os.path.join(feed_dir, '%s%s.gz' % (base, ext))
+
+
+def prebuilt_feed_file(template, category=None):
+    """The path of the feed's built file, or None if there is none or it is
+    older than SATCHMO_SETTINGS['PRODUCT_FEED_MAX_AGE'] seconds."""
+    path = feed_file(template, category)
+    if not path:
+        return None
+    try:
+        mtime = os.path.getmtime(path)
+    except OSError:
+        return None
+    max_age = get_satchmo_setting('PRODUCT_FEED_MAX_AGE')
+    if max_age and time.time() - mtime > max_age:
+        return None
+    return path
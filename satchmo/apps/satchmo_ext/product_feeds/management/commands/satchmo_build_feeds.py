@@ -0,0 +1,52 @@
+from django.core.management.base import BaseCommand, CommandError
+from product.models import Category
+from satchmo_ext.product_feeds.feeds import feed_context, feed_file, feed_parts, feed_products, render_feed
+import gzip
+import os
+import time
+
+FEED_TEMPLATES = ("product_feeds/googlebase_atom.xml", "product_feeds/product_feed.csv")
+
+class Command(BaseCommand):
+    help = ("Builds gzipped product feed files in SATCHMO_SETTINGS['PRODUCT_FEED_DIR'], which the feed "
+        "views send instead of rendering the feed.  Run it from a cron job, more often than "
+        "SATCHMO_SETTINGS['PRODUCT_FEED_MAX_AGE'] after which the views ignore the files.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--categories', action='store_true', dest='categories', default=False,
+            help="Also build the feed of each active category.")
+        parser.add_argument('--chunk-size', type=int, dest='chunk_size', default=500,
+            help="Number of products loaded per query.")
+
+    def handle(self, **options):
+        verbosity = int(options.get('verbosity', 1))
+        if feed_file(FEED_TEMPLATES[0]) is None:
+            raise CommandError("Set SATCHMO_SETTINGS['PRODUCT_FEED_DIR'] to the directory for the feed files.")
+
+        feeds = [(template, None) for template in FEED_TEMPLATES]
+        if options['categories']:
+            feeds += [(FEED_TEMPLATES[0], category) for category in Category.objects.active()]
+
+        for template, category in feeds:
+            started = time.time()
+            slug = category and category.slug or None
+            path = feed_file(template, slug)
+            feed_dir = os.path.dirname(path)
+            if not os.path.isdir(feed_dir):
+                os.makedirs(feed_dir)
+
+            # written next to the old file and moved over it, so that the
+            # views never send a partly written feed
+            partial = '%s.%i.tmp' % (path, os.getpid())
+            try:
+                with gzip.open(partial, 'wb') as out:
+                    for text in render_feed(feed_parts(template), feed_context(category),
+                            feed_products(category), chunk_size=options['chunk_size']):
+                        out.write(text.encode('utf-8'))
+                os.replace(partial, path)
+            finally:
+                if os.path.exists(partial):
+                    os.remove(partial)
+
+            if verbosity > 0:
+                print("Built %s in %.2fs" % (path, time.time() - started))
@@ -1,12 +1,18 @@
 from django.conf import settings
 from django.test import TestCase
+from django.test.utils import override_settings
 try:
     from django.core.urlresolvers import reverse
 except ImportError:
     from django.urls import reverse
     
 from product.models import Product
+from satchmo_ext.product_feeds.feeds import feed_file
+import gzip
 import keyedcache
+import os
+import shutil
+import tempfile
 
 domain = 'http://example.com'
 
@@ -28,3 +34,39 @@ class GoogleBaseTest(TestCase):
         producturl = product.get_absolute_url()
         self.assertContains(response,
             "<link href=\"%s%s\" />" % (domain, producturl), count=1, status_code=200)
+
+    def test_feed_streamed(self):
+        """The feed is streamed, with the variations of configurable products in place of the parents"""
+        url = reverse('satchmo_atom_feed')
+        response = self.client.get(url)
+        self.assertTrue(response.streaming)
+        self.assertContains(response, "<title>Django Rocks shirt (Large/Black)</title>", count=1)
+        self.assertNotContains(response, "<title>Django Rocks shirt</title>")
+        self.assertContains(response, "</feed>", count=1)
+
+    def test_feed_file(self):
+        """A built feed file is sent while it is recent, decompressed for clients which do not accept gzip"""
+        feed_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, feed_dir)
+        url = reverse('satchmo_atom_feed')
+        with override_settings(SATCHMO_SETTINGS=dict(getattr(settings, 'SATCHMO_SETTINGS', {}), PRODUCT_FEED_DIR=feed_dir)):
+            path = feed_file("product_feeds/googlebase_atom.xml")
+            self.assertTrue(os.path.basename(path).startswith("googlebase_atom-site"))
+            with gzip.open(path, 'wb') as out:
+                out.write(b"<feed>built</feed>")
+
+            response = self.client.get(url, HTTP_ACCEPT_ENCODING='gzip')
+            self.assertEqual(response['Content-Encoding'], 'gzip')
+            self.assertEqual(int(response['Content-Length']), os.path.getsize(path))
+
+            response = self.client.get(url)
+            self.assertTrue(response.streaming)
+            self.assertFalse(response.has_header('Content-Length'))
+            self.assertEqual(b''.join(response.streaming_content), b"<feed>built</feed>")
+
+            # left over by a cron job which stopped
+            old = os.path.getmtime(path) - 60*60*24*3
+            os.utime(path, (old, old))
+            response = self.client.get(url)
+            self.assertContains(response, "</feed>", count=1)
+            self.assertNotContains(response, "built")
@@ -1,16 +1,12 @@
 from django.contrib.auth.decorators import user_passes_test
-from django.http import Http404
-from django.shortcuts import get_object_or_404, render_to_response
-from django.utils import timezone
+from django.http import FileResponse, Http404, StreamingHttpResponse
+from django.shortcuts import render_to_response
+from django.utils.cache import patch_vary_headers
 from django.utils.translation import gettext_lazy as _
-try:
-    from django.core.urlresolvers import reverse
-except ImportError:
-    from django.urls import reverse
-    
-from payment.config import credit_choices
-from product.models import Product, Category
-from satchmo_store.shop.models import Config
+
+from product.models import Category
+from satchmo_ext.product_feeds.feeds import feed_context, feed_parts, feed_products, prebuilt_feed_file, render_feed
+import gzip
 
 
 @user_passes_test(lambda u: u.is_authenticated and u.is_staff, login_url='/accounts/login/')
@@ -19,38 +15,44 @@ def admin_product_feed(request, category=None, template="product_feeds/product_f
     """
     return product_feed(request, category=category, template=template, content_type=content_type)
 
+def _decompressed(path, chunk_size=64 * 1024):
+    """Yield the content of a gzipped file."""
+    with gzip.open(path, 'rb') as feed:
+        for chunk in iter(lambda: feed.read(chunk_size), b''):
+            yield chunk
+
 def product_feed(request, category=None, template="product_feeds/googlebase_atom.xml", content_type="application/atom+xml"):
     """Build a feed of all active products.
+
+    The file built by satchmo_build_feeds is sent if there is a recent one,
+    otherwise the feed is streamed as it is rendered.
     """
 
-    shop_config = Config.objects.get_current()
     if category:
         try:
             cat = Category.objects.active().get(slug=category)
-            products = cat.active_products()
         except Category.DoesNotExist:
             raise Http404(_("Bad Category: %s" % category))
     else:
         cat = None
-        products = Product.objects.active_by_site()
-        
-    products = filter(lambda product:"ConfigurableProduct" not in product.get_subtypes(), products)
-    
-    params = {}
-    view = 'satchmo_atom_feed'
-    if category:
-        params['category'] = category
-        view = 'satchmo_atom_category_feed'
-    
-    url = shop_config.base_url + reverse(view, None, params)
-    
-    payment_choices = [c[1] for c in credit_choices(None, True)]
-    
-    return render_to_response(template, {
-        'products' : products,
-        'category' : cat,
-        'url' : url,
-        'shop' : shop_config,
-        'payments' : payment_choices,
-        'date' : timezone.now(),
-    }, content_type=content_type)
+
+    path = prebuilt_feed_file(template, category)
+    if path:
+        if 'gzip' in request.META.get('HTTP_ACCEPT_ENCODING', ''):
+            response = FileResponse(open(path, 'rb'), content_type=content_type)
+            response['Content-Encoding'] = 'gzip'
+        else:
+            # the length of the decompressed feed is not known
+            response = StreamingHttpResponse(_decompressed(path), content_type=content_type)
+        patch_vary_headers(response, ('Accept-Encoding',))
+        return response
+
+    context = feed_context(cat)
+    products = feed_products(cat)
+    parts = feed_parts(template)
+    if parts is None:
+        # a custom feed template which is not split into parts
+        context['products'] = products
+        return render_to_response(template, context, content_type=content_type)
+
+    return StreamingHttpResponse(render_feed(parts, context, products), content_type=content_type)
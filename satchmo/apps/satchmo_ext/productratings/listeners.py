@@ -1,6 +1,7 @@
 """Utility functions used by signals to attach Ratings to Comments"""
 import logging
 
+from django.contrib.contenttypes.models import ContentType
 from django.contrib.sites.models import Site
 from django.utils.encoding import smart_str
 from django.conf import settings
@@ -14,9 +15,10 @@ except ImportError:
     from django_comments.models import Comment
 
 from livesettings.functions import config_value
-from product.models import Product
+from product.models import Product, ProductRanking
 from satchmo_utils import url_join
 from .models import ProductRating
+from .utils import rating_totals
 
 
 log = logging.getLogger('productratings')
@@ -78,3 +80,23 @@ def check_with_akismet(comment=None, request=None, **kwargs):
                 log.warn("Akismet key '%s' not accepted by akismet service.", akismet_key)
         else:
             log.info("Akismet enabled, but no key found.  Please put in your admin settings.")
+
+def update_rating_ranking(comment):
+    """Count the ratings of the product a comment is on again, for the highest rated list."""
+    if comment.content_type_id != ContentType.objects.get_for_model(Product).pk:
+        return
+    try:
+        product_id = int(comment.object_pk)
+    except ValueError:
+        return
+    rating_sum, rating_count = rating_totals(comment.site, [product_id]).get(product_id, (0, 0))
+    ProductRanking.objects.set_rating(comment.site_id, product_id, rating_sum, rating_count)
+
+def rating_ranking_listener(comment=None, **kwargs):
+    """comment_was_posted listener, connected after the ones which save or reject the rating."""
+    update_rating_ranking(comment)
+
+def comment_changed_listener(sender, instance=None, created=False, raw=False, **kwargs):
+    """Comment post_save and post_delete listener, for moderated and removed ratings."""
+    if not created and not raw:
+        update_rating_ranking(instance)
@@ -0,0 +1,45 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations
+from django.db.models import Count, Sum
+
+
+def count_ratings(apps, schema_editor):
+    """Fill in the rating counters of the rankings from the public ratings."""
+    Product = apps.get_model('product', 'Product')
+    ProductRanking = apps.get_model('product', 'ProductRanking')
+    ProductRating = apps.get_model('productratings', 'ProductRating')
+
+    ratings = ProductRating.objects.filter(comment__content_type__app_label='product',
+                                           comment__content_type__model='product',
+                                           comment__is_public=True, rating__gt=0)
+    totals = {}
+    for site_id, pk, rating_sum, rating_count in ratings.order_by() \
+            .values_list('comment__site', 'comment__object_pk').annotate(Sum('rating'), Count('rating')):
+        try:
+            totals[(site_id, int(pk))] = (rating_sum, rating_count)
+        except ValueError:
+            pass
+
+    products = set(Product.objects.filter(pk__in=set(pk for site_id, pk in totals))
+                                  .values_list('pk', flat=True))
+    for (site_id, product_id), (rating_sum, rating_count) in totals.items():
+        if product_id in products:
+            ProductRanking.objects.update_or_create(site_id=site_id, product_id=product_id, defaults={
+                'rating_sum': rating_sum,
+                'rating_count': rating_count,
+                'rating_average': float(rating_sum) / rating_count,
+            })
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('productratings', '0001_initial'),
+        ('product', '0006_productranking'),
+    ]
+
+    operations = [
+        migrations.RunPython(count_ratings, migrations.RunPython.noop),
+    ]
@@ -43,6 +43,10 @@ collect_urls.connect(add_product_urls, sender=product)
 collect_urls.connect(add_comment_urls, sender=satchmo_store)
 
 from .listeners import save_rating, one_rating_per_product, check_with_akismet
+from .listeners import rating_ranking_listener, comment_changed_listener
 comment_was_posted.connect(save_rating, sender=Comment)
 comment_was_posted.connect(one_rating_per_product, sender=Comment)
 comment_was_posted.connect(check_with_akismet, sender=Comment)
+comment_was_posted.connect(rating_ranking_listener, sender=Comment)
+models.signals.post_save.connect(comment_changed_listener, sender=Comment)
+models.signals.post_delete.connect(comment_changed_listener, sender=Comment)
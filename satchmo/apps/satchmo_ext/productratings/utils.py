@@ -5,7 +5,7 @@ try:
 except ImportError:
     from django_comments.models import Comment
 from django.contrib.sites.models import Site
-from django.db.models import Avg
+from django.db.models import Avg, Count, Sum
 from django.utils.translation import gettext_lazy as _
 from .models import ProductRating
 import logging
@@ -40,4 +40,20 @@ def get_product_rating_string(product, site=None):
         rating = _('Not Rated')
         
     return rating
-    
+
+def rating_totals(site, product_ids=None):
+    """
+    The (rating sum, rating count) of the public ratings on the site, keyed
+    by product id, for all rated products or only the given ones.
+    """
+    ratings = ProductRating.objects.rated_products().filter(comment__site__id=site.pk)
+    if product_ids is not None:
+        ratings = ratings.filter(comment__object_pk__in=[str(pk) for pk in product_ids])
+    totals = {}
+    for pk, rating_sum, rating_count in ratings.order_by().values_list('comment__object_pk') \
+                                              .annotate(Sum('rating'), Count('rating')):
+        try:
+            totals[int(pk)] = (rating_sum, rating_count)
+        except ValueError:
+            pass
+    return totals
@@ -8,6 +8,7 @@ from django.utils.translation import gettext_lazy as _
 from product import signals
 from product.models import Product
 from product.prices import PriceAdjustment, PriceAdjustmentCalc
+from satchmo_store.shop.models import clear_cart_summaries
 from satchmo_utils.fields import CurrencyField
 from threaded_multihost import threadlocals
 import datetime
@@ -125,51 +126,101 @@ def tiered_price_listener(signal, adjustment=None, **kwargs):
     Requires threaded_multihost.ThreadLocalMiddleware to be installed so
     that it can determine the current user."""
 
+    if kwargs.get('batch', False):
+        # already handled by tiered_price_batch_listener
+        return
+
     if 'discountable' in kwargs:
         discountable = kwargs['discountable']
     else:
         discountable = adjustment.product.is_discountable
 
     if discountable:
+        tiers = _current_tiers()
+        if tiers:
+            _apply_best_tier(adjustment, tiers,
+                lambda tier, product, qty: TieredPrice.objects.by_product_qty(tier, product, qty).price)
+
+def tiered_price_batch_listener(signal, adjustments=None, **kwargs):
+    """Listens for satchmo_price_query_batch signals, and applies tiered prices to
+    all the adjustments, looking up the tiered prices of every product in one query."""
+
+    adjustments = [adjustment for adjustment in adjustments if adjustment.product.is_discountable]
+    if not adjustments:
+        return
+
+    tiers = _current_tiers()
+    if not tiers:
+        return
+
+    parents = {}
+    for adjustment in adjustments:
         product = adjustment.product
-        user = threadlocals.get_current_user()
-        if user and not user.is_anonymous:
-            try:
-                tiers = PricingTier.objects.by_user(user)
-                log.debug('got tiers: %s', tiers)
-                best = None
-                besttier = None
-                currentprice = adjustment.final_price()
-                qty = adjustment.price.quantity
-                for tier in tiers:
-                    candidate = None
-                    try:
-                        tp = TieredPrice.objects.by_product_qty(tier, product, qty)
-                        log.debug("Found a Tiered Price for %s qty %d = %s", product.slug, qty, tp.price)
-                        candidate = tp.price
-                    except TieredPrice.DoesNotExist:
-                        pcnt = tier.discount_percent
-                        if pcnt is not None and pcnt != 0:
-                            candidate = currentprice * (100-pcnt)/100
-
-                    if best is None or (candidate and candidate < best):
-                        best = candidate
-                        besttier = tier
-
-                        log.debug('best = %s', best)
-
-                if best is not None:
-                    delta = currentprice - best
-                    adjustment += PriceAdjustment(
-                        'tieredpricing',
-                        _('Tiered Pricing for %(tier)s' % { 'tier': besttier.group.name}),
-                        delta)
-
-            except PricingTier.DoesNotExist:
-                pass
+        if 'ProductVariation' in product.get_subtypes():
+            parents[product.pk] = product.productvariation.parent.product_id
+
+    tiered = {}
+    product_ids = set([adjustment.product.pk for adjustment in adjustments]) | set(parents.values())
+    for tp in TieredPrice.objects.filter(product__in=product_ids, pricingtier__in=tiers) \
+            .exclude(expires__isnull=False, expires__lt=datetime.date.today()).order_by('-quantity'):
+        tiered.setdefault((tp.pricingtier_id, tp.product_id), []).append(tp)
+
+    def find_price(tier, product, qty):
+        for product_id in (product.pk, parents.get(product.pk)):
+            for tp in tiered.get((tier.pk, product_id), []):
+                if tp.quantity <= qty:
+                    log.debug("Found a Tiered Price for %s qty %d = %s", product.slug, qty, tp.price)
+                    return tp.price
+        raise TieredPrice.DoesNotExist
+
+    for adjustment in adjustments:
+        _apply_best_tier(adjustment, tiers, find_price)
+
+def _current_tiers():
+    """The pricing tiers of the current user, or None."""
+    user = threadlocals.get_current_user()
+    if user and not user.is_anonymous:
+        try:
+            tiers = PricingTier.objects.by_user(user)
+            log.debug('got tiers: %s', tiers)
+            return tiers
+        except PricingTier.DoesNotExist:
+            pass
+    return None
+
+def _apply_best_tier(adjustment, tiers, find_price):
+    """Add the adjustment for the best of `tiers`, using `find_price(tier, product, qty)`
+    to look up explicit tiered prices."""
+    product = adjustment.product
+    best = None
+    besttier = None
+    currentprice = adjustment.final_price()
+    qty = adjustment.price.quantity
+    for tier in tiers:
+        candidate = None
+        try:
+            candidate = find_price(tier, product, qty)
+        except TieredPrice.DoesNotExist:
+            pcnt = tier.discount_percent
+            if pcnt is not None and pcnt != 0:
+                candidate = currentprice * (100-pcnt)/100
+
+        if best is None or (candidate and candidate < best):
+            best = candidate
+            besttier = tier
+
+            log.debug('best = %s', best)
+
+    if best is not None:
+        delta = currentprice - best
+        adjustment += PriceAdjustment(
+            'tieredpricing',
+            _('Tiered Pricing for %(tier)s' % { 'tier': besttier.group.name}),
+            delta)
 
 # dispatch_uid prevents applying the same discount multiple times if the module is imported repeatedly.
 signals.satchmo_price_query.connect(tiered_price_listener, dispatch_uid='tieredpricing.models.tiered_price_listener')
+signals.satchmo_price_query_batch.connect(tiered_price_batch_listener, dispatch_uid='tieredpricing.models.tiered_price_batch_listener')
 
 def pricingtier_group_change_listener(action=None, reverse=None, instance=None, **kwargs):
     """Listens for changes of m2m relation between auth.User/Group and resets related threadlocals cached object"""
@@ -186,3 +237,9 @@ def pricingtier_group_change_listener(action=None, reverse=None, instance=None,
                 threadlocals.set_thread_variable(key, None)
 
 models.signals.m2m_changed.connect(pricingtier_group_change_listener, sender=User.groups.through)
+
+# cached cart totals depend on the tiers and on who is in them
+for model in (PricingTier, TieredPrice):
+    models.signals.post_save.connect(clear_cart_summaries, sender=model)
+    models.signals.post_delete.connect(clear_cart_summaries, sender=model)
+models.signals.m2m_changed.connect(clear_cart_summaries, sender=User.groups.through)
@@ -5,6 +5,7 @@ http://www.b-list.org/weblog/2006/06/14/django-tips-template-context-processors
 It is used to add some common variables to all the templates
 """
 from django.conf import settings as site_settings
+from django.utils.functional import SimpleLazyObject
 from product.models import Category, Discount
 from satchmo_store.shop import get_satchmo_setting
 from satchmo_store.shop.models import Config, Cart
@@ -16,7 +17,9 @@ log = logging.getLogger('shop_context')
 
 def settings(request):
     shop_config = Config.objects.get_current()
-    cart = Cart.objects.from_request(request)
+    # the cart is only loaded if a template uses it, the header uses the summary
+    cart = SimpleLazyObject(lambda: Cart.objects.from_request(request))
+    cart_count, cart_total = Cart.objects.summary_from_request(request)
 
     all_categories = Category.objects.by_site()
 
@@ -31,7 +34,8 @@ def settings(request):
         'shop_name': shop_config.store_name,
         'media_url': current_media_url(request),
         'STATIC_URL': current_static_url(request),
-        'cart_count': cart.numItems,
+        'cart_count': cart_count,
+        'cart_total': cart_total,
         'cart': cart,
         'categories': all_categories,
         'is_secure' : request_is_secure(request),
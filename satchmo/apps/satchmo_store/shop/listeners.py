@@ -1,7 +1,9 @@
 from livesettings.functions import config_value
 from payment.listeners import capture_on_ship_listener
 from product.models import Product
-from product.listeners import default_product_search_listener, discount_used_listener
+from product.listeners import default_product_search_listener, discount_used_listener, ranking_cancel_listener, \
+    ranking_sales_listener
+from product.search import start_index_listening
 from satchmo_store.contact import signals as contact_signals
 from satchmo_store.mail import send_html_email
 from satchmo_store.shop import signals
@@ -66,8 +68,11 @@ def start_default_listening():
     signals.order_success.connect(decrease_inventory_on_sale)
     signals.order_success.connect(order_success_listener, sender=None)
     signals.order_success.connect(discount_used_listener, sender=None)
+    signals.order_success.connect(ranking_sales_listener, sender=None)
+    signals.order_cancelled.connect(ranking_cancel_listener, sender=None)
     signals.satchmo_cart_changed.connect(remove_order_on_cart_update, sender=None)
     application_search.connect(default_product_search_listener, sender=Product)
+    start_index_listening()
     signals.satchmo_order_status_changed.connect(capture_on_ship_listener)
     signals.satchmo_order_status_changed.connect(notify_on_ship_listener)
     signals.satchmo_cart_add_verify.connect(veto_out_of_stock)
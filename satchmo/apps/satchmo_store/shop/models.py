@@ -8,6 +8,7 @@ from decimal import Decimal, ROUND_CEILING
 
 from django.contrib.sites.models import Site
 from django.conf import settings
+from django.core.cache import cache
 from django.db import models
 from django.utils.encoding import force_str
 from django.utils.safestring import mark_safe
@@ -24,18 +25,22 @@ from six.moves import reduce
 from l10n.models import Country
 from l10n.utils import moneyfmt
 from livesettings.functions import ConfigurationSettings, config_value
-from product.models import Discount, Product, Price, get_product_quantity_adjustments
-from product.prices import PriceAdjustmentCalc, PriceAdjustment
+from product.models import Discount, Product, Price, get_product_quantity_adjustments, _subtype_relations
+from product.prices import PriceAdjustmentCalc, PriceAdjustment, bulk_quantity_adjustments, bulk_quantity_prices
+from satchmo_store.contact import CUSTOMER_ID
 from satchmo_store.contact.models import Contact
 from satchmo_utils.fields import CurrencyField
 from satchmo_utils.numbers import trunc_decimal
+from satchmo_utils.singleflight import cache_lookup, cache_store
 import shipping.fields
 import payment.config
 # from satchmo_utils.iterchoices import iterchoices_db
 from tax.utils import get_tax_processor
+import datetime
 import keyedcache
 import logging
 import operator
+import time
 from . import signals
 
 log = logging.getLogger('satchmo_store.shop.models')
@@ -70,14 +75,10 @@ class ConfigManager(models.Manager):
         site = site.id
 
         try:
-            shop_config = keyedcache.cache_get("Config", site)
-        except keyedcache.NotCachedError as nce:
-            try:
-                shop_config = self.get(site__id__exact=site)
-                keyedcache.cache_set(nce.key, value=shop_config)
-            except Config.DoesNotExist:
-                log.warning("No Shop Config found, using test shop config for site=%s.", site)
-                shop_config = NullConfig()
+            shop_config = cache_lookup(("Config", site), lambda: self.get(site__id__exact=site))
+        except Config.DoesNotExist:
+            log.warning("No Shop Config found, using test shop config for site=%s.", site)
+            shop_config = NullConfig()
 
         return shop_config
 
@@ -171,7 +172,7 @@ class Config(models.Model):
             log.warn("%s: has no country set", self)
 
         super(Config, self).save(**kwargs)
-        keyedcache.cache_set("Config", self.site.id, value=self)
+        cache_store(("Config", self.site.id), self)
 
 
 class NullCart(object):
@@ -182,6 +183,7 @@ class NullCart(object):
     total = Decimal("0")
     numItems = 0
     is_shippable = False
+    summary = (0, Decimal("0"))
 
     def add_item(self, *args, **kwargs):
         pass
@@ -226,6 +228,11 @@ class OrderCart(NullCart):
 
     total = property(_total)
 
+    def _summary(self):
+        return (self.numItems, self.total)
+
+    summary = property(_summary)
+
     def _get_undiscounted_total(self):
         if self._order.sub_total is None:
             self._order.force_recalculate_total(save=True)
@@ -243,18 +250,47 @@ class OrderCart(NullCart):
         return iter(self.cartitem_set.all())
 
 
+CART_SUMMARY_TIMEOUT = 5 * 60
+CART_PRICING_VERSION_KEY = 'cart-pricing-version'
+
+
+def cart_summary_key(cart_id):
+    return 'cart-summary-%s' % cart_id
+
+
+def cart_pricing_context(user, version):
+    """What the total of a cart depends on besides its items: the user, whose
+    pricing tier may apply, the day, on which sales start and end, and the
+    version changed by `clear_cart_summaries` when prices change."""
+    user_id = None
+    if user is not None and user.is_authenticated:
+        user_id = user.pk
+    return (user_id, datetime.date.today(), version)
+
+
+def clear_cart_summaries(**kwargs):
+    """Drop every cached cart summary, can be connected to model signals directly."""
+    cache.set(CART_PRICING_VERSION_KEY, time.time(), None)
+
+
 class CartManager(models.Manager):
 
     def from_request(self, request, create=False, return_nullcart=True):
-        """Get the current cart from the request"""
-        cart = None
-        try:
-            contact = Contact.objects.from_request(request, create=False)
-        except Contact.DoesNotExist:
-            contact = None
+        """Get the current cart from the request.
 
-        if 'cart' in request.session:
-            cartid = request.session['cart']
+        The cart is remembered on the request, so repeated calls in the same
+        request cost nothing, and the contact is only looked up when there is
+        no cart in the session.
+        """
+        cartid = request.session.get('cart', None)
+        remembered = getattr(request, '_satchmo_cart', None)
+        if remembered is not None and remembered[0] == cartid:
+            cart = remembered[1]
+            if not (create and type(cart) is NullCart):
+                return cart
+
+        cart = None
+        if cartid is not None:
             if cartid == "order":
                 log.debug("Getting Order Cart from request")
                 try:
@@ -270,14 +306,21 @@ class CartManager(models.Manager):
                     log.debug('Removing invalid cart from session')
                     del request.session['cart']
 
-        if (not cart or isinstance(cart, NullCart)) and not isinstance(cart, OrderCart) and contact is not None:
-            carts = Cart.objects.filter(customer=contact).order_by("-date_time_created")
-            if carts.count() > 0:
-                cart = carts[0]
+        if cart is None:
+            # the latest cart of the customer, in a single query
+            if request.user.is_authenticated:
+                cart = Cart.objects.filter(customer__user=request.user.id).order_by("-date_time_created").first()
+            elif request.session.get(CUSTOMER_ID):
+                cart = Cart.objects.filter(customer=request.session[CUSTOMER_ID]).order_by("-date_time_created").first()
+            if cart is not None:
                 request.session['cart'] = cart.id
 
-        if not cart:
+        if cart is None:
             if create:
+                try:
+                    contact = Contact.objects.from_request(request, create=False)
+                except Contact.DoesNotExist:
+                    contact = None
                 site = Site.objects.get_current()
                 if contact is None:
                     cart = Cart(site=site)
@@ -292,9 +335,92 @@ class CartManager(models.Manager):
             else:
                 raise Cart.DoesNotExist()
 
+        request._satchmo_cart = (request.session.get('cart', None), cart)
         # log.debug("Cart: %s", cart)
         return cart
 
+    def summary_from_request(self, request):
+        """Get the (item count, total) of the current cart, for display on
+        every page.  Served from the cache when possible, so that most pages
+        do not touch the cart tables at all.  A cached summary is used only
+        for the user and pricing it was computed with, see
+        `cart_pricing_context`."""
+        cartid = request.session.get('cart', None)
+        if cartid is None and not request.user.is_authenticated and not request.session.get(CUSTOMER_ID):
+            return NullCart.summary
+
+        keys = [CART_PRICING_VERSION_KEY]
+        key = None
+        if cartid is not None and cartid != "order":
+            key = cart_summary_key(cartid)
+            keys.append(key)
+        found = cache.get_many(keys)
+        context = cart_pricing_context(request.user, found.get(CART_PRICING_VERSION_KEY, None))
+        entry = key and found.get(key, None)
+        if entry and entry[0] == context and not hasattr(request, '_satchmo_cart'):
+            return entry[1]
+
+        cart = self.from_request(request)
+        summary = cart.summary
+        if isinstance(cart, Cart) and cart.pk:
+            cache.set(cart_summary_key(cart.pk), (context, summary), CART_SUMMARY_TIMEOUT)
+        return summary
+
+
+class CartPricing(object):
+    """
+    A pricing snapshot of a cart.  The items, their details, products and
+    subtypes are loaded with a fixed number of queries, the product prices
+    are resolved in bulk and the line totals are computed once.  Kept by the
+    cart until it, or one of its items, changes.
+    """
+
+    def __init__(self, cart):
+        self.cart = cart
+        self.items = list(cart.cartitem_set.select_related('product').prefetch_related('details'))
+        models.prefetch_related_objects([item.product for item in self.items], *_subtype_relations())
+        self.num_items = sum([item.quantity for item in self.items], 0)
+        self.is_shippable = False
+        for item in self.items:
+            if item.is_shippable:
+                self.is_shippable = True
+                break
+        self._totals = None
+
+    def _item_qty(self, item):
+        if config_value('SHOP', 'CART_QTY'):
+            return self.num_items
+        return item.quantity
+
+    def _get_totals(self):
+        if self._totals is None:
+            by_qty = {}
+            for item in self.items:
+                by_qty.setdefault(self._item_qty(item), []).append(item.product)
+            for qty, products in by_qty.items():
+                bulk_quantity_prices(products, qty, include_discount=True)
+                bulk_quantity_prices(products, qty, include_discount=False)
+
+            total = undiscounted_total = Decimal("0")
+            for item in self.items:
+                qty = self._item_qty(item)
+                item._unit_prices = (item._get_line_unitprice(qty=qty),
+                                     item._get_line_unitprice(include_discount=False, qty=qty))
+                total += item.line_total
+                undiscounted_total += item.undiscounted_line_total
+            self._totals = (total, undiscounted_total)
+        return self._totals
+
+    def _get_total(self):
+        return self._get_totals()[0]
+
+    total = property(_get_total)
+
+    def _get_undiscounted_total(self):
+        return self._get_totals()[1]
+
+    undiscounted_total = property(_get_undiscounted_total)
+
 
 @python_2_unicode_compatible
 class Cart(models.Model):
@@ -314,11 +440,30 @@ class Cart(models.Model):
         verbose_name = _("Shopping Cart")
         verbose_name_plural = _("Shopping Carts")
 
+    def _get_pricing(self):
+        pricing = self.__dict__.get('_pricing')
+        if pricing is None:
+            pricing = self._pricing = CartPricing(self)
+        return pricing
+
+    pricing = property(_get_pricing)
+
+    def invalidate_pricing(self):
+        """Drop the pricing snapshot and cached summary, after the items have changed."""
+        self.__dict__.pop('_pricing', None)
+        if self.pk:
+            cache.delete(cart_summary_key(self.pk))
+
+    def _get_summary(self):
+        """The (item count, total) of the cart.  CartManager.summary_from_request
+        caches it for CART_SUMMARY_TIMEOUT seconds, or until the items or
+        prices change."""
+        return (self.numItems, self.total)
+
+    summary = property(_get_summary)
+
     def _get_count(self):
-        itemCount = 0
-        for item in self.cartitem_set.all():
-            itemCount += item.quantity
-        return (itemCount)
+        return self.pricing.num_items
     numItems = property(_get_count)
 
     def _get_discount(self):
@@ -327,13 +472,9 @@ class Cart(models.Model):
     discount = property(_get_discount)
 
     def _get_total(self, include_discount=True):
-        total = Decimal("0")
-        for item in self.cartitem_set.all():
-            if include_discount:
-                total += item.line_total
-            else:
-                total += item.undiscounted_line_total
-        return(total)
+        if include_discount:
+            return self.pricing.total
+        return self.pricing.undiscounted_total
     total = property(_get_total)
 
     def _get_undiscounted_total(self):
@@ -342,9 +483,11 @@ class Cart(models.Model):
     undiscounted_total = property(_get_undiscounted_total)
 
     def __iter__(self):
-        return iter(self.cartitem_set.all())
+        return iter(self.pricing.items)
 
     def __len__(self):
+        if '_pricing' in self.__dict__:
+            return len(self._pricing.items)
         return self.cartitem_set.count()
 
     def __bool__(self):
@@ -360,7 +503,7 @@ class Cart(models.Model):
         return True
 
     def _is_empty(self):
-        return self.cartitem_set.count() == 0
+        return len(self) == 0
     is_empty = property(_is_empty)
 
     def __str__(self):
@@ -415,6 +558,7 @@ class Cart(models.Model):
             for data in details:
                 item_to_modify.add_detail(data)
 
+        self.invalidate_pricing()
         return item_to_modify
 
     def remove_item(self, chosen_item_id, number_removed):
@@ -424,6 +568,7 @@ class Cart(models.Model):
             item_to_modify.delete()
         else:
             item_to_modify.save()
+        self.invalidate_pricing()
 
     def merge_carts(self, src_cart):
         """
@@ -433,11 +578,13 @@ class Cart(models.Model):
         for item in src_cart.cartitem_set.all():
             self.add_item(item.product, item.quantity, item.details.all())
             item.delete()
+        src_cart.invalidate_pricing()
         self.save()
 
     def empty(self):
         for item in self.cartitem_set.all():
             item.delete()
+        self.invalidate_pricing()
         self.save()
 
     def save(self, **kwargs):
@@ -452,17 +599,14 @@ class Cart(models.Model):
 
     def _get_shippable(self):
         """Return whether the cart contains shippable items."""
-        for cartitem in self.cartitem_set.all():
-            if cartitem.is_shippable:
-                return True
-        return False
+        return self.pricing.is_shippable
     is_shippable = property(_get_shippable)
 
     def get_shipment_list(self):
         """Return a list of shippable products, where each item is split into
         multiple elements, one for each quantity."""
         items = []
-        for cartitem in self.cartitem_set.all():
+        for cartitem in self:
             if cartitem.is_shippable:
                 p = cartitem.product
                 q = int(cartitem.quantity.quantize(Decimal('0'), ROUND_CEILING))
@@ -475,7 +619,7 @@ class Cart(models.Model):
         Returna list of shippable products, with it's quantity
         """
         items = []
-        for cartitem in self.cartitem_set.all():
+        for cartitem in self:
             if cartitem.is_shippable:
                 p = cartitem.product
                 q = int(cartitem.quantity.quantize(Decimal('0'), ROUND_CEILING))
@@ -508,13 +652,35 @@ class CartItem(models.Model):
         money_format = force_str(moneyfmt(self.line_total))
         return '%s - %s %s' % (self.quantity, self.product.name, money_format)
 
-    def _get_line_unitprice(self, include_discount=True):
-        # Get the qty discount price as the unit price for the line.
+    def save(self, **kwargs):
+        self.__dict__.pop('_unit_prices', None)
+        super(CartItem, self).save(**kwargs)
+        self._invalidate_cart_pricing()
 
-        if config_value('SHOP', 'CART_QTY'):
-            qty = self.cart.numItems
+    def delete(self, **kwargs):
+        result = super(CartItem, self).delete(**kwargs)
+        self._invalidate_cart_pricing()
+        return result
+
+    def _invalidate_cart_pricing(self):
+        if CartItem.cart.is_cached(self):
+            self.cart.invalidate_pricing()
         else:
-            qty = self.quantity
+            cache.delete(cart_summary_key(self.cart_id))
+
+    def _get_line_unitprice(self, include_discount=True, qty=None):
+        # Get the qty discount price as the unit price for the line.
+
+        if qty is None:
+            # priced by the cart snapshot, see `CartPricing`
+            prices = self.__dict__.get('_unit_prices')
+            if prices is not None:
+                return prices[0 if include_discount else 1]
+
+            if config_value('SHOP', 'CART_QTY'):
+                qty = self.cart.numItems
+            else:
+                qty = self.quantity
 
         self.qty_price = self.get_qty_price(qty, include_discount=include_discount)
 
@@ -964,11 +1130,24 @@ class Order(models.Model):
         itemprices = []
         fullprices = []
 
+        # all line items, their details and products are loaded once, and
+        # priced with a single query
+        lineitems = list(self.orderitem_set.select_related('product', 'product__taxClass').prefetch_related('orderitemdetail_set'))
+        models.prefetch_related_objects([lineitem.product for lineitem in lineitems], *_subtype_relations())
+
         qty_override = config_value('SHOP', 'CART_QTY')
         if qty_override:
-            itemct = self.numItems
+            itemct = sum([lineitem.quantity for lineitem in lineitems], 0)
+
+        def line_qty(lineitem):
+            if qty_override:
+                return itemct
+            return lineitem.quantity
 
-        for lineitem in self.orderitem_set.all():
+        adjustments = bulk_quantity_adjustments([(lineitem.product, line_qty(lineitem)) for lineitem in lineitems])
+        taxer = get_tax_processor(order=self)
+
+        for lineitem in lineitems:
             lid = lineitem.id
             if lid in discounts:
                 lineitem.discount = discounts[lid]
@@ -977,12 +1156,7 @@ class Order(models.Model):
             else:
                 lineitem.discount = zero
             # now double check against other discounts, such as tiered discounts
-            if qty_override:
-                qty = itemct
-            else:
-                qty = lineitem.quantity
-
-            adjustment = get_product_quantity_adjustments(lineitem.product, qty=qty)
+            adjustment = adjustments[(lineitem.product.pk, line_qty(lineitem))]
 
             if adjustment and adjustment.price:
                 baseprice = adjustment.price.price
@@ -1002,12 +1176,17 @@ class Order(models.Model):
                     lineitem.line_item_price = baseprice * lineitem.quantity
                     log.debug('Adjusting lineitem unit price for %s. Full price=%s, discount=%s.  Final price for qty %d is %s',
                               lineitem.product.slug, baseprice, unitdiscount, lineitem.quantity, fullydiscounted)
-            if save:
-                lineitem.save()
-
             itemprices.append(lineitem.sub_total)
             fullprices.append(lineitem.line_item_price)
 
+        if save and lineitems:
+            # the tax of every line is resolved in one pass
+            taxable = [lineitem for lineitem in lineitems if lineitem.product.taxable]
+            for lineitem, tax in zip(taxable, taxer.by_orderitems(taxable)):
+                lineitem.unit_tax = taxer.by_price(lineitem.product.taxClass, lineitem.unit_price)
+                lineitem.tax = tax
+            OrderItem.objects.bulk_update(lineitems, ['unit_price', 'unit_tax', 'line_item_price', 'tax', 'discount'])
+
         if itemprices:
             item_sub_total = reduce(operator.add, itemprices)
         else:
@@ -1034,17 +1213,14 @@ class Order(models.Model):
 
         self.discount = total_discount
 
-        taxProcessor = get_tax_processor(self)
-        totaltax, taxrates = taxProcessor.process()
+        totaltax, taxrates = taxer.process()
         self.tax = totaltax
 
-        # clear old taxes
-        for taxdetl in self.taxes.all():
-            taxdetl.delete()
-
-        for taxdesc, taxamt in taxrates.items():
-            taxdetl = OrderTaxDetail(order=self, tax=taxamt, description=taxdesc, method=taxProcessor.method)
-            taxdetl.save()
+        # replace the old taxes
+        self.taxes.all().delete()
+        OrderTaxDetail.objects.bulk_create([
+            OrderTaxDetail(order=self, tax=taxamt, description=taxdesc, method=taxer.method)
+            for taxdesc, taxamt in taxrates.items()])
 
         log.debug("Order #%i, recalc: sub_total=%s, shipping=%s, discount=%s, tax=%s",
                   self.id,
@@ -1242,9 +1418,10 @@ class OrderItem(models.Model):
         self.update_tax()
         super(OrderItem, self).save(**kwargs)
 
-    def update_tax(self):
+    def update_tax(self, processor=None):
         taxclass = self.product.taxClass
-        processor = get_tax_processor(order=self.order)
+        if processor is None:
+            processor = get_tax_processor(order=self.order)
 
         if self.product.taxable:
             self.unit_tax = processor.by_price(taxclass, self.unit_price)
@@ -1447,6 +1624,11 @@ class OrderTaxDetail(models.Model):
             return "Tax: %s" % self.tax
 
 
+# a cached cart total is out of date once prices or sales change
+for model in (Price, Discount):
+    models.signals.post_save.connect(clear_cart_summaries, sender=model)
+    models.signals.post_delete.connect(clear_cart_summaries, sender=model)
+
 from . import config
 
 from . import listeners
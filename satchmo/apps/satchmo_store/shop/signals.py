@@ -217,8 +217,9 @@ satchmo_cart_details_query=django.dispatch.Signal()
 #:   :media_url: The current media url, taking into account SSL
 #:   :STATIC_URL: The current static url, taking into account SSL
 #:   :cart_count: The number of items in the cart
+#:   :cart_total: The total of the cart
 #:   :cart: An instance of ``satchmo_store.shop.models.Cart`` representing the
-#:     current cart
+#:     current cart, loaded when first used
 #:   :categories: A ``QuerySet`` of all the ``product.models.Category`` objects
 #:     for the current site.
 #:   :is_secure: A boolean representing weather or not SSL is enabled
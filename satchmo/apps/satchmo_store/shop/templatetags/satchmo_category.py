@@ -1,10 +1,8 @@
-from django.core.cache import cache
-from django.contrib.sites.models import Site
 from django.template import Library, Node, Variable
 from django.template import TemplateSyntaxError, VariableDoesNotExist
 from product.models import Category, CategoryAttribute
 from satchmo_utils.templatetags import get_filter_args
-from django.utils.translation import get_language
+from django.utils.encoding import python_2_unicode_compatible
 
 import logging
 import re
@@ -19,19 +17,21 @@ except ImportError:
 register = Library()
 
 def recurse_for_children(current_node, parent_node, active_cat, show_empty=True):
-    child_count = current_node.child.active().count()
+    """Render a node of the cached navigation tree, see `CategoryManager.nav_tree`."""
+    children = current_node['children']
 
-    if show_empty or child_count > 0 or current_node.product_set.count() > 0:
-        li_id = 'category-%s' % current_node.id
+    if show_empty or children or current_node['product_count'] > 0:
+        li_id = 'category-%s' % current_node['id']
         li_attrs = {'id': li_id }
         temp_parent = SubElement(parent_node, 'li', li_attrs)
-        attrs = {'href': current_node.get_absolute_url()}
+        attrs = {'href': current_node['url']}
+        if current_node['id'] == active_cat:
+            attrs['class'] = 'current'
         link = SubElement(temp_parent, 'a', attrs)
-        link.text = current_node.translated_name()
+        link.text = current_node['name']
 
-        if child_count > 0:
+        if children:
             new_parent = SubElement(temp_parent, 'ul')
-            children = current_node.child.active()
             for child in children:
                 recurse_for_children(child, new_parent, active_cat)
 
@@ -55,34 +55,59 @@ def category_tree(id=None):
                 </ul>
         </ul>
     """
-    active_cat = None
-    if id:
-        try:
-            active_cat = Category.objects.active().get(id=id)
-        except Category.DoesNotExist:
-            active_cat = None
-    # We call the category on every page so we will cache
-    # The actual structure to save db hits
-    lang = get_language()
-    current_site = Site.objects.get_current()
-    cache_key = "cat-%s-%s" % (current_site.id, lang)
-    existing_tree = cache.get(cache_key, None)
-    if existing_tree is None:
-        root = Element("ul")
-        for cats in Category.objects.root_categories():
-            recurse_for_children(cats, root, active_cat)
-        existing_tree = root
-        cache.set(cache_key, existing_tree)
-    # If we have an active cat, search through and identify it
-    # This search is less expensive than the multiple db calls
-    if active_cat:
-        active_cat_id = "category-%s" % active_cat.id
-        for li in existing_tree.iter("li"):
-            if li.attrib["id"] == active_cat_id:
-                link = li.find("a")
-                link.attrib["class"] = "current"
-                break
-    return tostring(existing_tree, 'utf-8').decode()
+    # We call the category on every page, so render it from the cached
+    # navigation tree rather than the database
+    try:
+        active_cat = int(id)
+    except (TypeError, ValueError):
+        active_cat = None
+
+    root = Element("ul")
+    for node in Category.objects.nav_tree():
+        recurse_for_children(node, root, active_cat)
+    return tostring(root, 'utf-8').decode()
+
+@python_2_unicode_compatible
+class NavCategory(object):
+    """A category of the cached navigation tree.  Attributes which are not
+    in the tree are read from the Category, which is then loaded once."""
+
+    def __init__(self, node):
+        self.id = self.pk = node['id']
+        self.slug = node['slug']
+        self.name = node['name']
+        self.url = node['url']
+        self.product_count = node['product_count']
+        self.children = [NavCategory(child) for child in node['children']]
+
+    def get_absolute_url(self):
+        return self.url
+
+    def translated_name(self, language_code=None):
+        if language_code:
+            return self.category.translated_name(language_code)
+        return self.name
+
+    def __getattr__(self, name):
+        if name.startswith('__'):
+            raise AttributeError(name)
+        if name == 'category':
+            self.category = Category.objects.get(pk=self.id)
+            return self.category
+        return getattr(self.category, name)
+
+    def __str__(self):
+        return self.name
+
+def _find_nav_node(nodes, slug):
+    slug = slug.lower()
+    for node in nodes:
+        if node['slug'].lower() == slug:
+            return node
+        found = _find_nav_node(node['children'], slug)
+        if found:
+            return found
+    return None
 
 class CategoryListNode(Node):
     """Template Node tag which pushes the category list into the context"""
@@ -92,19 +117,22 @@ class CategoryListNode(Node):
         self.nodelist = nodelist
 
     def render(self, context):
+        tree = Category.objects.nav_tree()
 
         if self.slug:
             try:
-                cat = Category.objects.active().get(slug__iexact=self.slug.resolve(context))
-                cats = cat.child.all()
-            except (Category.DoesNotExist, VariableDoesNotExist):
+                slug = self.slug.resolve(context)
+            except VariableDoesNotExist:
+                slug = None
+            node = slug and _find_nav_node(tree, slug)
+            if node:
+                cats = [NavCategory(child) for child in node['children']]
+            else:
                 log.warn("No category found for slug: %s", self.slug)
                 cats = []
 
         else:
-            cats = Category.objects.root_categories()
-
-        context[self.var] = cats
+            cats = [NavCategory(node) for node in tree]
 
         context.push()
         context[self.var] = cats
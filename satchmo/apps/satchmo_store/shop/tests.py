@@ -3,11 +3,12 @@ from django.conf import settings
 from django.contrib.auth.models import User
 from django.contrib.sites.models import Site
 from django.core import mail
+from django.core.cache import cache
+from django.db import connection
 from django.test import TestCase
 from django.test.client import Client
+from django.test.utils import CaptureQueriesContext
 from django.utils.encoding import smart_str
-from django.utils.translation import get_language
-from django.core.cache import cache
 try:
     from django.core.urlresolvers import reverse
 except ImportError:
@@ -18,14 +19,18 @@ from l10n.models import Country
 from l10n.utils import moneyfmt
 from livesettings.functions import config_get
 from payment import active_gateways
-from product.models import Product
+from product.models import Category, Price, Product, ProductRanking
+from product.prices import PriceAdjustment, PriceAdjustmentCalc, get_product_quantity_adjustments
+from product.queries import bestsellers
 from product.utils import rebuild_pricing, find_auto_discounts
 from satchmo_store.contact import CUSTOMER_ID
 from satchmo_store.contact.models import *
 from satchmo_store.shop import get_satchmo_setting, signals
 from satchmo_store.shop.exceptions import CartAddProhibited
 from satchmo_store.shop.models import *
+from satchmo_utils.numbers import trunc_decimal
 from satchmo_utils.templatetags import get_filter_args
+from tax.utils import get_tax_processor
 
 import keyedcache
 
@@ -73,9 +78,7 @@ class ShopTest(TestCase):
         self.client = Client()
         self.US = Country.objects.get(iso2_code__iexact = "US")
         rebuild_pricing()
-        current_site = Site.objects.get_current()
-        cache_key = "cat-%s-%s" % (current_site.id, get_language())
-        cache.delete(cache_key)
+        Category.objects.clear_nav_tree()
         self.old_language_code = settings.LANGUAGE_CODE
         settings.LANGUAGE_CODE = 'en-us'
 
@@ -151,6 +154,45 @@ class ShopTest(TestCase):
         response = self.client.get(prefix+'/cart/')
         self.assertContains(response, "Django Rocks shirt (Large/Blue)", count=1, status_code=200)
 
+    def test_cart_summary(self):
+        """
+        The cart summary shown on every page is cached until the cart changes
+        """
+        self.test_cart_adding()
+        cartid = self.client.session['cart']
+        response = self.client.get(prefix+'/')
+        self.assertEqual(response.context['cart_count'], Decimal('2'))
+        context, (count, total) = cache.get(cart_summary_key(cartid))
+        self.assertEqual(count, Decimal('2'))
+
+        cart = Cart.objects.get(pk=cartid)
+        item = cart.cartitem_set.all()[0]
+        item.quantity = 3
+        item.save()
+        self.assertEqual(cache.get(cart_summary_key(cartid)), None)
+
+        response = self.client.get(prefix+'/')
+        self.assertEqual(response.context['cart_count'], Decimal('3'))
+        self.assertEqual(response.context['cart_total'], total / 2 * 3)
+
+        # and until prices change
+        for price in Price.objects.filter(product__slug='dj-rocks'):
+            price.price += Decimal('1.00')
+            price.save()
+        response = self.client.get(prefix+'/')
+        self.assertNotEqual(response.context['cart_total'], total / 2 * 3)
+
+    def test_cart_from_request_remembered(self):
+        """
+        Looking up the cart twice in one request only queries once
+        """
+        self.test_cart_adding()
+        request = self.client.get(prefix+'/').wsgi_request
+        request.__dict__.pop('_satchmo_cart', None)
+        cart = Cart.objects.from_request(request)
+        with self.assertNumQueries(0):
+            self.assertTrue(Cart.objects.from_request(request) is cart)
+
     def test_cart_adding_errors_nonexistent(self):
         """
         Test proper error reporting when attempting to add items to the cart.
@@ -515,6 +557,29 @@ class ShopTest(TestCase):
         self.assertContains(response, "Django Rocks shirt", count=10)
         self.assertContains(response, "Python Rocks shirt", count=1)
 
+    def test_search_pages(self):
+        """
+        Walk the search results a page at a time
+        """
+        config_get('PRODUCT', 'SEARCH_PAGE_SIZE').update(4)
+        config_get('PRODUCT', 'SEARCH_COUNT_LIMIT').update(5)
+        try:
+            response = self.client.get(prefix+'/search/', {'keywords':'shirt'})
+            self.assertTrue(response.context['page'].count_is_estimate)
+            seen = []
+            while True:
+                page = response.context['page']
+                self.assertTrue(len(page.object_list) <= 4)
+                seen.extend([product.slug for product in page.object_list])
+                if not page.next_url:
+                    break
+                response = self.client.get(prefix+'/search/' + page.next_url)
+            self.assertEqual(len(seen), 11)
+            self.assertEqual(len(set(seen)), 11)
+        finally:
+            config_get('PRODUCT', 'SEARCH_PAGE_SIZE').update(20)
+            config_get('PRODUCT', 'SEARCH_COUNT_LIMIT').update(1000)
+
 class AdminTest(TestCase):
     fixtures = ['initial_data.yaml', 'l10n-data.yaml', 'sample-store-data.yaml', 'products.yaml']
 
@@ -625,6 +690,31 @@ class CartTest(TestCase):
         self.assertEqual(item2.unit_price, Decimal("23.00"))
         self.assertEqual(cart.total, Decimal("43.00"))
 
+    def test_pricing_snapshot(self):
+        cart = Cart(site=Site.objects.get_current())
+        cart.save()
+        for slug in ('dj-rocks-s-b', 'dj-rocks-l-bl', 'PY-Rocks', 'neat-book-hard'):
+            cart.add_item(Product.objects.get(slug=slug), 2)
+
+        cart = Cart.objects.get(pk=cart.pk)
+        total = cart.total
+        with self.assertNumQueries(0):
+            self.assertEqual(cart.numItems, 8)
+            self.assertEqual(cart.total, total)
+            self.assertEqual(cart.undiscounted_total, total)
+            self.assertTrue(cart.is_shippable)
+            lines = [item.line_total for item in cart]
+
+        # the same as pricing each item on its own
+        self.assertEqual(lines, [item.unit_price * item.quantity for item in CartItem.objects.filter(cart=cart)])
+        self.assertEqual(total, sum(lines))
+
+        item = list(cart)[0]
+        item.quantity = Decimal('1')
+        item.save()
+        self.assertEqual(cart.numItems, 7)
+        self.assertEqual(cart.total, sum([item.unit_price * item.quantity for item in CartItem.objects.filter(cart=cart)]))
+
 class ConfigTest(TestCase):
     fixtures = ['initial_data.yaml', 'l10n-data.yaml', 'sample-store-data.yaml', 'test-config.yaml']
 
@@ -1016,6 +1106,22 @@ class OrderTest(TestCase):
         self.assertEqual(order.is_partially_paid, False)
         self.assert_(order.paid_in_full)
 
+    def testSalesRanked(self):
+        order = make_test_order(self.US, '', include_non_taxed=True)
+        self.assertEqual(bestsellers(5), [])
+        order.order_success()
+        self.assertEqual([p.slug for p in bestsellers(5)], ['dj-rocks-s-b', 'neat-book-hard'])
+
+    def testSalesCountedOnce(self):
+        order = make_test_order(self.US, '', include_non_taxed=True)
+        order.order_success()
+        units = dict(ProductRanking.objects.values_list('product__slug', 'units_sold'))
+        order.order_success()
+        self.assertEqual(dict(ProductRanking.objects.values_list('product__slug', 'units_sold')), units)
+
+        self.assertTrue(order.order_cancel())
+        self.assertEqual(ProductRanking.objects.bestsellers(5), [])
+
     def testSmallPayment(self):
         order = make_test_order(self.US, '', include_non_taxed=True)
         order.recalculate_total(save=False)
@@ -1028,6 +1134,133 @@ class OrderTest(TestCase):
 
         self.assert_(order.is_partially_paid)
 
+def legacy_recalculate_total(order):
+    """Order.force_recalculate_total as it was before prices were fetched
+    in bulk, kept as the reference for the parity tests.  Each line is taxed
+    by its own save, then the order by a separate tax processor."""
+    zero = Decimal("0.0000000000")
+    total_discount = Decimal("0.0000000000")
+    discount = Discount.objects.by_code(order.discount_code)
+    discount.calc(order)
+    discounts = discount.item_discounts
+    itemprices = []
+    fullprices = []
+    qty_override = config_value('SHOP', 'CART_QTY')
+    if qty_override:
+        itemct = order.numItems
+    for lineitem in order.orderitem_set.all():
+        if lineitem.id in discounts:
+            lineitem.discount = discounts[lineitem.id]
+            total_discount += lineitem.discount
+        else:
+            lineitem.discount = zero
+        if qty_override:
+            qty = itemct
+        else:
+            qty = lineitem.quantity
+        adjustment = get_product_quantity_adjustments(lineitem.product, qty=qty)
+        if adjustment and adjustment.price:
+            baseprice = adjustment.price.price
+            finalprice = adjustment.final_price()
+            baseprice += lineitem.get_detail_price()
+            finalprice += lineitem.get_detail_price()
+            if baseprice > finalprice or baseprice != lineitem.unit_price:
+                unitdiscount = (lineitem.discount / lineitem.quantity) + baseprice - finalprice
+                unitdiscount = trunc_decimal(unitdiscount, 2)
+                linediscount = unitdiscount * lineitem.quantity
+                total_discount += linediscount
+                lineitem.unit_price = baseprice
+                lineitem.discount = linediscount
+                lineitem.line_item_price = baseprice * lineitem.quantity
+        lineitem.save()
+        itemprices.append(lineitem.sub_total)
+        fullprices.append(lineitem.line_item_price)
+    item_sub_total = sum(itemprices, zero)
+    order.sub_total = sum(fullprices, zero)
+
+    shipprice = Price()
+    shipprice.price = order.shipping_cost
+    shipadjust = PriceAdjustmentCalc(shipprice)
+    if 'Shipping' in discounts:
+        shipadjust += PriceAdjustment('discount', 'Discount', discounts['Shipping'])
+    signals.satchmo_shipping_price_query.send(order, adjustment=shipadjust, item_discount=total_discount)
+    order.shipping_discount = shipadjust.total_adjustment()
+    order.discount = total_discount + order.shipping_discount
+
+    processor = get_tax_processor(order)
+    order.tax, taxrates = processor.process()
+    for taxdetl in order.taxes.all():
+        taxdetl.delete()
+    for taxdesc, taxamt in taxrates.items():
+        OrderTaxDetail(order=order, tax=taxamt, description=taxdesc, method=processor.method).save()
+
+    order.total = Decimal(item_sub_total + order.shipping_sub_total + order.tax)
+    order.save()
+    return item_sub_total
+
+class RecalculateParityTest(TestCase):
+    """Order.force_recalculate_total must match the line by line algorithm exactly."""
+    fixtures = ['l10n-data.yaml', 'test_multishop.yaml', 'products.yaml', 'initial_data.yaml']
+
+    def setUp(self):
+        keyedcache.cache_delete()
+        self.US = Country.objects.get(iso2_code__iexact='US')
+        # a quantity break, so that line quantities matter
+        Price.objects.create(product=Product.objects.get(slug='dj-rocks-s-b'), quantity=Decimal('10'), price=Decimal('15.00'))
+
+    def tearDown(self):
+        config_get('SHOP', 'CART_QTY').update(False)
+        cache_delete()
+
+    def make_order(self):
+        order = make_test_order(self.US, '', include_non_taxed=True, price=Decimal('1.00'), quantity=12)
+        for slug, qty in (('dj-rocks-l-bl', 3), ('PY-Rocks', 1), ('dj-rocks-s-b', 2)):
+            product = Product.objects.get(slug=slug)
+            price = product.unit_price
+            item = OrderItem(order=order, product=product, quantity=qty, unit_price=price, line_item_price=price * qty)
+            item.save()
+        OrderItemDetail.objects.create(item=item, name='Monogram', value='ABC', price_change=Decimal('2.50'), sort_order=1)
+        return order
+
+    def assertParity(self):
+        legacy = self.make_order()
+        item_sub_total = legacy_recalculate_total(legacy)
+        legacy = Order.objects.get(pk=legacy.pk)
+
+        order = self.make_order()
+        order.force_recalculate_total(save=True)
+        order = Order.objects.get(pk=order.pk)
+
+        self.assertEqual(order.sub_total, legacy.sub_total)
+        self.assertEqual(sum([item.sub_total for item in order.orderitem_set.all()], Decimal('0')), item_sub_total)
+        fields = ('quantity', 'unit_price', 'unit_tax', 'line_item_price', 'tax', 'discount')
+        self.assertEqual([[getattr(item, f) for f in fields] for item in order.orderitem_set.all()],
+                         [[getattr(item, f) for f in fields] for item in legacy.orderitem_set.all()])
+
+        for field in ('discount', 'shipping_discount', 'tax', 'total'):
+            self.assertEqual(getattr(order, field), getattr(legacy, field))
+        self.assertEqual(sorted(order.taxes.values_list('description', 'tax')),
+                         sorted(legacy.taxes.values_list('description', 'tax')))
+
+    def test_line_quantities(self):
+        self.assertParity()
+
+    def test_cart_quantity(self):
+        config_get('SHOP', 'CART_QTY').update(True)
+        self.assertParity()
+
+    def test_query_count_is_flat(self):
+        order = self.make_order()
+        order.force_recalculate_total(save=True)
+        with CaptureQueriesContext(connection) as few:
+            order.force_recalculate_total(save=True)
+        for i in range(10):
+            OrderItem(order=order, product=Product.objects.get(slug='PY-Rocks'), quantity=1,
+                      unit_price=Decimal('19.50'), line_item_price=Decimal('19.50')).save()
+        with CaptureQueriesContext(connection) as many:
+            order.force_recalculate_total(save=True)
+        self.assertEqual(len(many.captured_queries), len(few.captured_queries))
+
 class QuickOrderTest(TestCase):
     """Test quickorder sheet."""
     fixtures = ['l10n-data.yaml', 'sample-store-data.yaml', 'products.yaml', 'test-config.yaml', 'initial_data.yaml']
@@ -94,6 +94,8 @@ def _set_quantity(request, force_delete=False):
         cartitem = CartItem.objects.get(pk=itemid, cart=cart)
     except CartItem.DoesNotExist:
         return (False, cart, None, _("No such item in your cart."))
+    # so that saving the item refreshes the cart totals
+    cartitem.cart = cart
 
     if qty == Decimal('0'):
         cartitem.delete()
@@ -125,7 +127,7 @@ class DisplayView(DetailView):
     def get_context_data(self, **kwargs):
         context = super(DisplayView, self).get_context_data(**kwargs)
         if self.object.numItems > 0:
-            products = [item.product for item in self.object.cartitem_set.all()]
+            products = [item.product for item in self.object]
             context['sale'] = find_best_auto_discount(products)
         context['error_message'] = self.get_error_message()
         context['default_view_tax'] = self.get_default_view_tax()
@@ -409,7 +411,7 @@ def product_from_post(productslug, formdata):
         # This happens when productname cannot be updated by javascript.
         cp = product.configurableproduct
         # catching a nasty bug where ConfigurableProducts with no option_groups can't be ordered
-        if cp.option_group.count() > 0:
+        if cp.variation_matrix.groups:
             chosenOptions = optionids_from_post(cp, formdata)
             optproduct = cp.get_product_from_options(chosenOptions)
             if not optproduct:
@@ -1,42 +1,20 @@
 from django.shortcuts import render
 from django.views.generic import TemplateView
 
+from livesettings.functions import config_value
 from product.models import Product
 from satchmo_store.shop import signals
+from satchmo_utils.keyset import paginate_keyset
 from satchmo_utils.signals import application_search
 
 
-class SearchView(TemplateView):
-    template_name = "shop/search.html"
-
-    def get_context_data(self, **kwargs):
-        context = super(SearchView, self).get_context_data(**kwargs)
-
-        if self.request.method=="GET":
-            data = self.request.GET
-        else:
-            data = self.request.POST
-
-        keywords = data.get('keywords', '').split(' ')
-        category = data.get('category', None)
-
-        keywords = filter(None, keywords)
+def search_context(request):
+    """Run the search listeners and page their product results.
 
-        results = {}
-
-        # this signal will usually call listeners.default_product_search_listener
-        application_search.send(Product, request=self.request,
-            category=category, keywords=keywords, results=results)
-
-        context['results'] = results
-        context['category'] = category
-        context['keywords'] = keywords
-
-        return context
-
-
-def search_view(request, template="shop/search.html"):
-    """Perform a search based on keywords and categories in the form submission"""
+    Only one page of products is loaded, starting after the `after` cursor,
+    and counting stops at PRODUCT.SEARCH_COUNT_LIMIT results.  The next page
+    is linked through `page.next_url`.  Matching categories are not paged.
+    """
     if request.method=="GET":
         data = request.GET
     else:
@@ -45,17 +23,46 @@ def search_view(request, template="shop/search.html"):
     keywords = data.get('keywords', '').split(' ')
     category = data.get('category', None)
 
-    keywords = filter(None, keywords)
+    keywords = [keyword for keyword in keywords if keyword]
 
     results = {}
-    
+
     # this signal will usually call listeners.default_product_search_listener
-    application_search.send(Product, request=request, 
+    application_search.send(Product, request=request,
         category=category, keywords=keywords, results=results)
 
-    context = {
-            'results': results,
-            'category' : category,
-            'keywords' : keywords
+    page_size = config_value('PRODUCT', 'SEARCH_PAGE_SIZE')
+    page = paginate_keyset(results.get('products', []),
+        results.get('products_ordering', ('ordering', 'name', 'pk')),
+        cursor=data.get('after', None),
+        page_size=page_size,
+        count_limit=config_value('PRODUCT', 'SEARCH_COUNT_LIMIT'))
+
+    page.next_url = None
+    if page.has_next():
+        query = data.copy()
+        query['after'] = page.next_cursor
+        page.next_url = '?' + query.urlencode()
+
+    results['products'] = page.object_list
+
+    return {
+        'results': results,
+        'page': page,
+        'category': category,
+        'keywords': keywords,
     }
-    return render(request, template, context)
+
+
+class SearchView(TemplateView):
+    template_name = "shop/search.html"
+
+    def get_context_data(self, **kwargs):
+        context = super(SearchView, self).get_context_data(**kwargs)
+        context.update(search_context(self.request))
+        return context
+
+
+def search_view(request, template="shop/search.html"):
+    """Perform a search based on keywords and categories in the form submission"""
+    return render(request, template, search_context(request))
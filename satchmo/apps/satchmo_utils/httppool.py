@@ -0,0 +1,337 @@
+"""
+A shared pool of keep-alive HTTP(S) connections, used for the requests made
+to shipping carriers and payment gateways.
+
+Opening a new TLS connection for every rate quote or transaction makes the
+handshake the slowest part of a checkout, and uses up ephemeral ports under
+load.  The pool keeps idle connections to each host and reuses them, and it
+limits how many connections are open to one host at a time.
+
+    from satchmo_utils.httppool import http_request
+    content = http_request(url, data=body, timeout=10).read()
+
+Failures are raised as urllib's URLError and HTTPError, as urlopen does.
+Redirects are followed as urlopen follows them.  Requests to a host which is
+to be reached through a proxy, set by the http_proxy/https_proxy environment
+variables, are sent with urlopen instead, which honours the proxy settings.
+The limits can be changed with SATCHMO_SETTINGS['HTTP_POOL'], a dictionary of
+HTTPPool arguments.
+"""
+from django.conf import settings
+from six.moves import http_client, urllib
+import errno
+import io
+import logging
+import select
+import socket
+import threading
+import time
+
+log = logging.getLogger('satchmo_utils.httppool')
+
+IDEMPOTENT_METHODS = ('GET', 'HEAD', 'OPTIONS', 'PUT', 'DELETE')
+REDIRECT_CODES = (301, 302, 303, 307, 308)
+MAX_REDIRECTS = 10
+
+
+def _dropped(conn):
+    """True if the server closed the idle connection, which makes its socket
+    readable."""
+    if conn.sock is None:
+        return True
+    try:
+        return bool(select.select([conn.sock], [], [], 0)[0])
+    except (ValueError, socket.error):
+        return True
+
+
+def _closed_by_server(error):
+    """True for the errors of a request sent over a connection which the
+    server had closed, before any of the response was read."""
+    # RemoteDisconnected is a BadStatusLine
+    if isinstance(error, http_client.BadStatusLine):
+        return True
+    return isinstance(error, socket.error) and getattr(error, 'errno', None) in (errno.ECONNRESET, errno.EPIPE)
+
+
+def _proxied(parts):
+    """True if the environment sets a proxy for the url."""
+    proxies = urllib.request.getproxies()
+    return parts.scheme in proxies and not urllib.request.proxy_bypass(parts.hostname)
+
+
+def _header(headers, name):
+    name = name.lower()
+    for key, value in headers.items():
+        if key.lower() == name:
+            return value
+    return None
+
+
+class PooledResponse(object):
+    """A response which has been read completely, so that its connection
+    could be reused.  Has the parts of the urlopen response in use here."""
+
+    def __init__(self, url, status, reason, headers, body):
+        self.url = url
+        self.status = status
+        self.reason = reason
+        self.headers = headers
+        self.body = body
+
+    def read(self):
+        return self.body
+
+    def getcode(self):
+        return self.status
+
+    def geturl(self):
+        return self.url
+
+    def info(self):
+        return self.headers
+
+
+class HostPool(object):
+    """The connections to one scheme, host and port."""
+
+    def __init__(self, scheme, host, port, limit):
+        self.scheme = scheme
+        self.host = host
+        self.port = port
+        self.slots = threading.BoundedSemaphore(limit)
+        self.lock = threading.Lock()
+        self.idle = []
+        self.counts = dict.fromkeys(('created', 'reused', 'requests', 'retries', 'errors', 'in_use'), 0)
+
+    def count(self, stat, value=1):
+        with self.lock:
+            self.counts[stat] += value
+
+    def checkout(self, timeout, idle_timeout, fresh=False):
+        """Return a connection and whether it has been used before.  A new
+        connection is made when `fresh` is set."""
+        now = time.time()
+        with self.lock:
+            while self.idle and not fresh:
+                conn, last_used = self.idle.pop()
+                if now - last_used < idle_timeout and not _dropped(conn):
+                    self.counts['reused'] += 1
+                    conn.timeout = timeout
+                    if conn.sock is not None:
+                        conn.sock.settimeout(timeout)
+                    return conn, True
+                conn.close()
+            self.counts['created'] += 1
+
+        if self.scheme == 'https':
+            conn = http_client.HTTPSConnection(self.host, self.port, timeout=timeout)
+        else:
+            conn = http_client.HTTPConnection(self.host, self.port, timeout=timeout)
+        return conn, False
+
+    def checkin(self, conn, max_idle):
+        with self.lock:
+            if len(self.idle) < max_idle:
+                self.idle.append((conn, time.time()))
+                return
+        conn.close()
+
+    def stats(self):
+        with self.lock:
+            stats = dict(self.counts)
+            stats['idle'] = len(self.idle)
+        return stats
+
+    def close(self):
+        with self.lock:
+            idle, self.idle = self.idle, []
+        for conn, last_used in idle:
+            conn.close()
+
+
+class HTTPPool(object):
+    """
+    A thread safe pool of keep-alive connections.
+
+    - max_per_host: connections open to one host at the same time, further
+      requests wait for one to be free
+    - max_idle: idle connections kept for each host
+    - idle_timeout: seconds after which an idle connection is not reused
+    - timeout: default seconds for connecting, waiting for a free connection
+      and reading the response
+    - retries, backoff: a failed idempotent request is tried again up to
+      `retries` times, waiting backoff, 2*backoff, ... seconds in between.
+
+    Requests which are not idempotent, such as payment transactions, are
+    only resent when a reused connection failed before they were sent.
+    Idle connections which the server closed are left out before sending,
+    any error after that is raised, as the server may have handled the
+    request already.
+    """
+
+    def __init__(self, max_per_host=10, max_idle=4, idle_timeout=30, timeout=30, retries=2, backoff=0.5):
+        self.max_per_host = max_per_host
+        self.max_idle = max_idle
+        self.idle_timeout = idle_timeout
+        self.timeout = timeout
+        self.retries = retries
+        self.backoff = backoff
+        self._hosts = {}
+        self._lock = threading.Lock()
+
+    def _host(self, scheme, host, port):
+        key = (scheme, host, port)
+        with self._lock:
+            pool = self._hosts.get(key, None)
+            if pool is None:
+                pool = self._hosts[key] = HostPool(scheme, host, port, self.max_per_host)
+            return pool
+
+    def request(self, url, data=None, headers=None, method=None, timeout=None, idempotent=None):
+        """
+        Send a request and return the completely read PooledResponse.
+
+        `data` may be bytes or text, which is sent as utf-8.  Rate quotes and
+        other lookups should pass idempotent=True so that they are retried.
+        """
+        if data is not None and not isinstance(data, bytes):
+            data = data.encode('utf-8')
+        if method is None:
+            method = data is None and 'GET' or 'POST'
+        headers = dict(headers or {})
+        if data is not None and not any(key.lower() == 'content-type' for key in headers):
+            headers['Content-Type'] = 'application/x-www-form-urlencoded'
+        if timeout is None:
+            timeout = self.timeout
+        if idempotent is None:
+            idempotent = method in IDEMPOTENT_METHODS
+
+        for redirects in range(MAX_REDIRECTS + 1):
+            parts = urllib.parse.urlsplit(url)
+            if parts.scheme not in ('http', 'https'):
+                raise urllib.error.URLError('unsupported scheme: %s' % parts.scheme)
+            if _proxied(parts):
+                return self._urlopen(url, data, headers, method, timeout)
+
+            response = self._send(url, parts, data, headers, method, timeout, idempotent)
+            location = _header(response.headers, 'Location')
+            if response.status not in REDIRECT_CODES or not location:
+                return response
+
+            # as urlopen does, POSTs are only redirected by 301, 302 and 303,
+            # which make them GETs
+            if method == 'POST' and response.status in (301, 302, 303):
+                method = 'GET'
+                data = None
+                idempotent = True
+                headers = dict((key, value) for key, value in headers.items()
+                               if key.lower() not in ('content-type', 'content-length'))
+            elif method not in ('GET', 'HEAD'):
+                raise urllib.error.HTTPError(url, response.status, response.reason, response.headers,
+                                             io.BytesIO(response.body))
+            url = urllib.parse.urljoin(url, location)
+
+        raise urllib.error.HTTPError(url, response.status, 'too many redirects', response.headers,
+                                     io.BytesIO(response.body))
+
+    def _urlopen(self, url, data, headers, method, timeout):
+        request = urllib.request.Request(url, data=data, headers=headers, method=method)
+        response = urllib.request.urlopen(request, timeout=timeout)
+        try:
+            return PooledResponse(response.geturl(), response.getcode(), getattr(response, 'reason', ''),
+                                  dict(response.info().items()), response.read())
+        finally:
+            response.close()
+
+    def _send(self, url, parts, data, headers, method, timeout, idempotent):
+        host = self._host(parts.scheme, parts.hostname, parts.port)
+        path = parts.path or '/'
+        if parts.query:
+            path = '%s?%s' % (path, parts.query)
+        retries = idempotent and self.retries or 0
+
+        attempt = 0
+        fresh = False
+        while True:
+            if not host.slots.acquire(timeout=timeout):
+                raise urllib.error.URLError('timed out waiting for a connection to %s' % parts.netloc)
+            host.count('in_use')
+            sent = False
+            responded = False
+            try:
+                conn, reused = host.checkout(timeout, self.idle_timeout, fresh)
+                try:
+                    host.count('requests')
+                    conn.request(method, path, body=data, headers=headers)
+                    sent = True
+                    response = conn.getresponse()
+                    responded = True
+                    body = response.read()
+                except (http_client.HTTPException, socket.error) as e:
+                    conn.close()
+                    host.count('errors')
+                    error = e
+                else:
+                    error = None
+                    if response.will_close:
+                        conn.close()
+                    else:
+                        host.checkin(conn, self.max_idle)
+            finally:
+                host.count('in_use', -1)
+                host.slots.release()
+
+            if error is None:
+                break
+
+            if reused and not fresh and not responded and not isinstance(error, socket.timeout) \
+                    and (not sent or (idempotent and _closed_by_server(error))):
+                # the server had closed the idle connection.  A request which
+                # was sent may have been handled before that, so only
+                # idempotent ones are sent once more on a new connection
+                log.debug('Retrying %s on a new connection: %s', url, error)
+                fresh = True
+            elif attempt < retries:
+                delay = self.backoff * (2 ** attempt)
+                attempt += 1
+                log.debug('Retrying %s in %.2fs: %s', url, delay, error)
+                time.sleep(delay)
+            else:
+                raise urllib.error.URLError(error)
+            host.count('retries')
+
+        headers = dict(response.getheaders())
+        if response.status >= 400:
+            raise urllib.error.HTTPError(url, response.status, response.reason, headers, io.BytesIO(body))
+        return PooledResponse(url, response.status, response.reason, headers, body)
+
+    def stats(self):
+        """The connection counts for each host, keyed by 'scheme://host:port'."""
+        with self._lock:
+            hosts = list(self._hosts.values())
+        return dict(('%s://%s:%s' % (pool.scheme, pool.host, pool.port), pool.stats()) for pool in hosts)
+
+    def close(self):
+        """Close all idle connections."""
+        with self._lock:
+            hosts = list(self._hosts.values())
+        for pool in hosts:
+            pool.close()
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+def get_http_pool():
+    """The pool shared by the whole process."""
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = HTTPPool(**getattr(settings, 'SATCHMO_SETTINGS', {}).get('HTTP_POOL', {}))
+        return _pool
+
+def http_request(url, data=None, headers=None, method=None, timeout=None, idempotent=None):
+    """Send a request through the shared pool, see HTTPPool.request."""
+    return get_http_pool().request(url, data=data, headers=headers, method=method,
+        timeout=timeout, idempotent=idempotent)
@@ -0,0 +1,131 @@
+"""Keyset (seek) pagination.
+
+Rather than an OFFSET, which makes the database walk every skipped row, each
+page continues after the sort key of the last row of the previous page.  The
+key is handed back to the client as an opaque cursor.
+"""
+from django.db.models import Q
+from django.db.models.query import QuerySet
+import base64
+import json
+import logging
+
+log = logging.getLogger('satchmo_utils.keyset')
+
+
+class KeysetPage(object):
+    """A page of results, with the cursor of the next page if there is one."""
+
+    def __init__(self, object_list, next_cursor=None, count=None, count_is_estimate=False):
+        self.object_list = object_list
+        self.next_cursor = next_cursor
+        self.count = count
+        self.count_is_estimate = count_is_estimate
+
+    def has_next(self):
+        return self.next_cursor is not None
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+
+def encode_cursor(values):
+    data = json.dumps(values, default=str).encode('utf-8')
+    return base64.urlsafe_b64encode(data).decode('ascii').rstrip('=')
+
+
+def decode_cursor(cursor):
+    """Decode a cursor, returning None if it is not valid."""
+    try:
+        data = base64.urlsafe_b64decode(str(cursor) + '=' * (-len(cursor) % 4))
+        values = json.loads(data.decode('utf-8'))
+    except (TypeError, ValueError, UnicodeError):
+        log.debug('Ignoring invalid cursor: %s', cursor)
+        return None
+    if not isinstance(values, list):
+        return None
+    return values
+
+
+def _after(ordering, values):
+    """Build the filter for rows sorting after `values` on `ordering`."""
+    q = None
+    equal = Q()
+    for key, value in zip(ordering, values):
+        name = key.lstrip('-')
+        if key.startswith('-'):
+            step = equal & Q(**{'%s__lt' % name: value})
+        else:
+            step = equal & Q(**{'%s__gt' % name: value})
+        q = step if q is None else q | step
+        equal = equal & Q(**{name: value})
+    return q
+
+
+def count_results(queryset, limit=0):
+    """Count the results, stopping at `limit` when it is set.  Returns the
+    count and whether it was cut short, so that a huge result set is not
+    scanned to the end just to print its size."""
+    if not isinstance(queryset, QuerySet):
+        return len(queryset), False
+    if limit:
+        ct = queryset[:limit + 1].count()
+        if ct > limit:
+            return limit, True
+        return ct, False
+    return queryset.count(), False
+
+
+def paginate_keyset(queryset, ordering, cursor=None, page_size=20, count_limit=None):
+    """Get the page of `queryset` following `cursor`, sorted by the field
+    names in `ordering`, which must end with a unique field such as 'pk'.
+
+    Plain lists, such as the results of search listeners which filter in
+    python, are paged by offset instead.  If `count_limit` is not None, the
+    results are also counted, see `count_results`.
+    """
+    values = decode_cursor(cursor) if cursor else None
+    count = None
+    count_is_estimate = False
+    if count_limit is not None:
+        count, count_is_estimate = count_results(queryset, count_limit)
+
+    if not isinstance(queryset, QuerySet):
+        start = values[0] if values and isinstance(values[0], int) else 0
+        rows = list(queryset[start:start + page_size + 1])
+        next_values = [start + page_size]
+    else:
+        if values and len(values) == len(ordering):
+            queryset = queryset.filter(_after(ordering, values))
+        rows = list(queryset.order_by(*ordering)[:page_size + 1])
+        next_values = None
+        if rows:
+            last = rows[min(len(rows), page_size) - 1]
+            next_values = [getattr(last, key.lstrip('-')) for key in ordering]
+
+    next_cursor = None
+    if len(rows) > page_size:
+        rows = rows[:page_size]
+        next_cursor = encode_cursor(next_values)
+    return KeysetPage(rows, next_cursor=next_cursor, count=count, count_is_estimate=count_is_estimate)
+
+
+def iterate_keyset(queryset, ordering=('pk',), chunk_size=500):
+    """Yield all of `queryset` in lists of `chunk_size` rows, each loaded with
+    one keyset query, so that exports do not hold the whole result set in
+    memory.  Any prefetch_related lookups run once per chunk."""
+    values = None
+    while True:
+        chunk = queryset
+        if values is not None:
+            chunk = chunk.filter(_after(ordering, values))
+        rows = list(chunk.order_by(*ordering)[:chunk_size])
+        if not rows:
+            return
+        yield rows
+        if len(rows) < chunk_size:
+            return
+        values = [getattr(rows[-1], key.lstrip('-')) for key in ordering]
@@ -1,5 +1,5 @@
 from livesettings.functions import config_register_list
-from livesettings.values import ConfigurationGroup, IntegerValue, BooleanValue
+from livesettings.values import ConfigurationGroup, IntegerValue, BooleanValue, StringValue
 from django.utils.translation import gettext_lazy as _
 
 THUMB_GROUP = ConfigurationGroup('THUMBNAIL', _('Thumbnail Settings'))
@@ -16,5 +16,19 @@ config_register_list(
         'RENAME_IMAGES',
         description=_("Rename product images?"),
         help_text=_("Automatically rename product images on upload?"),
-        default=True)
+        default=True),
+
+    StringValue(THUMB_GROUP,
+        'PREGENERATE_SIZES',
+        description=_("Thumbnail sizes made on upload"),
+        help_text=_("Sizes made as soon as an image is saved, separated by spaces, such as '85x85 120x'. Leave out the width or the height to keep the proportions."),
+        default="85x85 120x",
+        ordering=10),
+
+    IntegerValue(THUMB_GROUP,
+        'WORKERS',
+        description=_("Thumbnail worker processes"),
+        help_text=_("Thumbnails are made by this many background processes, while pages show the original image until they are ready. Use 0 to make them while rendering the page."),
+        default=2,
+        ordering=20)
 )
@@ -2,7 +2,8 @@ from django.db.models import signals
 from sorl.thumbnail import ImageField
 from livesettings.functions import config_value
 from livesettings.models import SettingNotSet
-from satchmo_utils.satchmo_thumbnail.utils import rename_by_field
+from satchmo_utils.satchmo_thumbnail.manifest import manifest
+from satchmo_utils.satchmo_thumbnail.utils import pregenerate_thumbnails, rename_by_field
 from satchmo_utils import normalize_dir
 import logging
 import os
@@ -87,9 +88,18 @@ class ImageWithThumbnailField(ImageField):
             instance.save()
             self._renaming = False
 
+    def _pregenerate(self, instance, **kwargs):
+        if getattr(self, '_renaming', False):
+            return
+        image = getattr(instance, self.attname)
+        if image:
+            pregenerate_thumbnails(image.name)
+
     def _delete_thumbnail(self, sender, instance=None, delete_file=True,
             **kwargs):
         image = getattr(instance, self.attname)
+        if image:
+            manifest.forget(image.name)
         if hasattr(image, 'path'):
             # Use sorl.thumbnail.delete to delete thumbnail
             # Key Value Store references, cached files and optionally
@@ -100,6 +110,7 @@ class ImageWithThumbnailField(ImageField):
         super(ImageWithThumbnailField, self).contribute_to_class(cls, name)
         signals.pre_delete.connect(self._delete_thumbnail, sender=cls)
         signals.post_save.connect(self._save_rename, sender=cls)
+        signals.post_save.connect(self._pregenerate, sender=cls)
 
 try:
     # South introspection rules for our custom field.
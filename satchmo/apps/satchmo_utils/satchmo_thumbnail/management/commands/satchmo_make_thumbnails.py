@@ -0,0 +1,54 @@
+from concurrent.futures import ProcessPoolExecutor
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from livesettings.functions import config_value
+from satchmo_utils.satchmo_thumbnail.utils import _generate_thumbnail, _get_thumbnail_path, \
+    _photo_name, parse_sizes, record_thumbnail
+import os
+import re
+import time
+
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.gif')
+# <basename>_t<width>, _t_w<width>_h<height> or _t_h<height>
+THUMBNAIL_NAME = re.compile(r'_t(\d+|_w\d+_h\d+|_h\d+)$')
+
+class Command(BaseCommand):
+    help = "Makes the thumbnails of every image in the media directory, on several processes, and records them in the thumbnail manifest."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', dest='sizes', default=None,
+            help="Sizes such as '85x85 120x', by default THUMBNAIL.PREGENERATE_SIZES.")
+        parser.add_argument('--workers', type=int, dest='workers', default=None,
+            help="Number of processes, by default the number of CPUs.")
+        parser.add_argument('--dir', dest='dir', default=settings.MEDIA_ROOT,
+            help="Directory searched for images, by default MEDIA_ROOT.")
+
+    def handle(self, **options):
+        verbosity = int(options.get('verbosity', 1))
+        sizes = parse_sizes(options['sizes'] or config_value('THUMBNAIL', 'PREGENERATE_SIZES'))
+        quality = config_value('THUMBNAIL', 'IMAGE_QUALITY')
+        started = time.time()
+
+        photos = []
+        for dirpath, dirnames, filenames in os.walk(options['dir']):
+            for filename in filenames:
+                base, ext = os.path.splitext(filename)
+                if ext.lower() in IMAGE_EXTENSIONS and not THUMBNAIL_NAME.search(base):
+                    photos.append(os.path.join(dirpath, filename))
+
+        ready = 0
+        with ProcessPoolExecutor(max_workers=options['workers']) as pool:
+            futures = []
+            for photo_path in photos:
+                for width, height in sizes:
+                    th_path = _get_thumbnail_path(photo_path, width, height)
+                    future = pool.submit(_generate_thumbnail, photo_path, th_path, width, height, quality)
+                    futures.append((_photo_name(photo_path), width, height, future))
+            for name, width, height, future in futures:
+                result = future.result()
+                record_thumbnail(name, width, height, result)
+                if result[0]:
+                    ready += 1
+
+        if verbosity > 0:
+            print("%i thumbnails of %i images up to date in %.2fs" % (ready, len(photos), time.time() - started))
@@ -0,0 +1,96 @@
+"""
+The thumbnail manifest: for every image, its modification time and size and
+the thumbnails made of it.  Templates resolve thumbnail URLs and image sizes
+from it in memory, instead of looking at the filesystem on every render.
+
+The manifest is stored in the ImageManifest table.  Each process loads an
+image's entry with one query the first time it shows the image, and keeps
+the entries of the images it shows most often.  The thumbnail workers record
+the thumbnails as they are made, and saving a changed image or deleting it
+forgets its entry.  Both go to the database and drop that image's entry, in
+every process through TableCache.discard.
+"""
+from django.db import transaction
+from satchmo_utils.tablecache import TableCache
+import json
+
+# entries kept in each process, the least recently used are loaded again
+MANIFEST_ENTRIES = 5000
+
+
+def variant_key(width=None, height=None):
+    """ the manifest key of a thumbnail size, such as 'w85_h85' """
+
+    if (width is not None) and (height is not None):
+        return 'w%d_h%d' % (width, height)
+    elif width is not None:
+        return 'w%d' % width
+    return 'h%d' % height
+
+def _load_entry(name):
+    from satchmo_utils.satchmo_thumbnail.models import ImageManifest
+    row = ImageManifest.objects.filter(name=name).first()
+    if row is None:
+        # kept too, so that unknown images are not looked up on every render
+        return {}
+    return row.entry()
+
+
+class ThumbnailManifest(object):
+
+    def __init__(self):
+        self.tables = TableCache('satchmo-thumbnail-manifest', _load_entry,
+            max_tables=MANIFEST_ENTRIES)
+
+    def entry(self, name):
+        """ the image's entry, {} if it is not in the manifest """
+
+        return self.tables.get(name)
+
+    def variant(self, name, width=None, height=None):
+        """ the thumbnail URL, '' if the image itself is used, or None if
+            the thumbnail has not been made """
+
+        variants = self.entry(name).get('variants', {})
+        return variants.get(variant_key(width, height), None)
+
+    def size(self, name):
+        """ the (width, height) of the image, or None if it is not known """
+
+        return self.entry(name).get('size', None)
+
+    def mtime(self, name):
+        """ the modification time the entry was made for, or None """
+
+        return self.entry(name).get('mtime', None)
+
+    def record(self, name, mtime, size, width=None, height=None, th_url=''):
+        """ remember a thumbnail made of the image, '' when it could not be
+            made or the image itself has the size """
+
+        from satchmo_utils.satchmo_thumbnail.models import ImageManifest
+
+        with transaction.atomic():
+            row = ImageManifest.objects.select_for_update().filter(name=name).first()
+            variants = {}
+            if row is not None and row.mtime == mtime:
+                variants = row.entry()['variants']
+            variants[variant_key(width, height)] = th_url or ''
+
+            ImageManifest.objects.update_or_create(name=name, defaults={
+                'mtime': mtime,
+                'width': size and size[0] or None,
+                'height': size and size[1] or None,
+                'variants': json.dumps(variants, sort_keys=True),
+            })
+        self.tables.discard(name)
+
+    def forget(self, name):
+        """ drop the entry of an image which was replaced or deleted """
+
+        from satchmo_utils.satchmo_thumbnail.models import ImageManifest
+
+        ImageManifest.objects.filter(name=name).delete()
+        self.tables.discard(name)
+
+manifest = ThumbnailManifest()
@@ -0,0 +1,28 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ImageManifest',
+            fields=[
+                ('id', models.AutoField(verbose_name='ID', serialize=False, auto_created=True, primary_key=True)),
+                ('name', models.CharField(unique=True, max_length=200, verbose_name='Image')),
+                ('mtime', models.FloatField(null=True, verbose_name='Modification time', blank=True)),
+                ('width', models.IntegerField(null=True, verbose_name='Width', blank=True)),
+                ('height', models.IntegerField(null=True, verbose_name='Height', blank=True)),
+                ('variants', models.TextField(default='{}', verbose_name='Thumbnails', blank=True)),
+            ],
+            options={
+                'verbose_name': 'Image Manifest',
+                'verbose_name_plural': 'Image Manifests',
+            },
+        ),
+    ]
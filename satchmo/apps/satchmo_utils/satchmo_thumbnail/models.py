@@ -0,0 +1,33 @@
+from django.db import models
+from django.utils.encoding import python_2_unicode_compatible
+from django.utils.translation import gettext_lazy as _
+import json
+
+
+@python_2_unicode_compatible
+class ImageManifest(models.Model):
+    """
+    An image's entry in the thumbnail manifest: its modification time and
+    size, and the thumbnails made of it, so that templates do not have to
+    look at the filesystem.
+    """
+    name = models.CharField(_('Image'), max_length=200, unique=True)
+    mtime = models.FloatField(_('Modification time'), null=True, blank=True)
+    width = models.IntegerField(_('Width'), null=True, blank=True)
+    height = models.IntegerField(_('Height'), null=True, blank=True)
+    # JSON, the thumbnail URL of each size such as 'w85_h85', or '' when the
+    # image itself is shown
+    variants = models.TextField(_('Thumbnails'), blank=True, default='{}')
+
+    class Meta:
+        verbose_name = _('Image Manifest')
+        verbose_name_plural = _('Image Manifests')
+
+    def __str__(self):
+        return self.name
+
+    def entry(self):
+        size = None
+        if self.width is not None:
+            size = (self.width, self.height)
+        return {'mtime': self.mtime, 'size': size, 'variants': json.loads(self.variants or '{}')}
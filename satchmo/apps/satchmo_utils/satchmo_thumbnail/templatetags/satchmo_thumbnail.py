@@ -6,7 +6,7 @@
 from django import template
 from django.conf import settings
 from django.template import TemplateSyntaxError
-from satchmo_utils.satchmo_thumbnail.utils import make_thumbnail, get_image_size
+from satchmo_utils.satchmo_thumbnail.utils import get_thumbnail_url, get_image_size
 from django.utils.safestring import mark_safe
 import six
 register = template.Library()
@@ -41,7 +41,8 @@ register.filter('js_thumbnail_array', js_thumbnail_array)
 js_thumbnail_array.needs_autoescape=False
 
 def thumbnail(url, args=''):
-    """ Returns thumbnail URL and create it if not already exists.
+    """ Returns thumbnail URL, or the original URL while the thumbnail is
+    being made in the background.
 
 .. note:: requires PIL_,
     if PIL_ is not found or thumbnail can not be created returns original URL.
@@ -84,7 +85,7 @@ or if only a width is requested (to be compatibile with admin interface)::
             arg = arg.strip()
             if arg == '': continue
             kw, val = arg.split('=', 1)
-            kw = kw.lower().encode('ascii')
+            kw = str(kw.lower())
             try:
                 val = int(val) # convert all ints
             except ValueError:
@@ -94,7 +95,7 @@ or if only a width is requested (to be compatibile with admin interface)::
     if ('width' not in kwargs) and ('height' not in kwargs):
         raise template.TemplateSyntaxError("thumbnail filter requires arguments (width and/or height)")
     
-    ret = make_thumbnail(url, **kwargs)
+    ret = get_thumbnail_url(url, **kwargs)
     if ret is None:
         ret = url
 
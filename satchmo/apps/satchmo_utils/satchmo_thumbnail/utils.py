@@ -1,15 +1,21 @@
 from __future__ import print_function
 
+from concurrent.futures import ProcessPoolExecutor
 import fnmatch
 import logging
 import os
 import shutil
+import sys
+import tempfile
+import threading
 from six.moves import urllib
 
 from django.conf import settings
+from django.db import connection
 from django.db.models.fields.files import ImageField
 
 from livesettings.functions import config_value
+from satchmo_utils.satchmo_thumbnail.manifest import manifest
 from satchmo_utils.satchmo_thumbnail.text import URLify
 import satchmo_utils.satchmo_thumbnail.config
 
@@ -108,38 +114,232 @@ def make_thumbnail(photo_url, width=None, height=None, root=settings.MEDIA_ROOT,
         # something is wrong with image
         return photo_url
 
-    # make proper size
+    size = _thumbnail_size((orig_w, orig_h), width, height)
+    if size is None:
+        # same dimensions
+        return None
+
+    try:
+        _resize(photo_path, th_path, size, config_value('THUMBNAIL', 'IMAGE_QUALITY'))
+    except Exception as err:
+        # this goes to webserver error log
+        print('[MAKE THUMBNAIL] error %s for file %r' % (err, photo_url), file=sys.stderr)
+        return photo_url
+
+    return th_url
+
+def _thumbnail_size(orig_size, width=None, height=None):
+    """ the size to resize an image of orig_size to, or None if it already has it """
+
+    orig_w, orig_h = orig_size
     if (width is not None) and (height is not None):
         if (orig_w == width) and (orig_h == height):
-            # same dimensions
             return None
-        size = (width, height)
+        return (width, height)
     elif width is not None:
         if orig_w == width:
-            # same dimensions
             return None
-        size = (width, orig_h)
-    elif height is not None:
+        return (width, orig_h)
+    else:
         if orig_h == height:
-            # same dimensions
             return None
-        size = (orig_w, height)
+        return (orig_w, height)
 
+def _resize(photo_path, th_path, size, quality):
+    """ write the thumbnail to a temporary file next to th_path and move it
+        into place, so that a half written thumbnail is never served """
+
+    img = Image.open(photo_path).copy()
+    img.thumbnail(size, Image.ANTIALIAS)
+    fd, tmp_path = tempfile.mkstemp(suffix=os.path.splitext(th_path)[1], prefix='.',
+        dir=os.path.dirname(th_path))
+    os.close(fd)
+    try:
+        # mkstemp makes the file private, give it the image's permissions
+        shutil.copymode(photo_path, tmp_path)
+        img.save(tmp_path, quality=quality)
+        os.replace(tmp_path, th_path)
+    except Exception:
+        try:
+            os.remove(tmp_path)
+        except OSError:
+            pass
+        raise
+
+def _generate_thumbnail(photo_path, th_path, width, height, quality):
+    """ make a thumbnail in a worker process, using only PIL
+
+        returns (made, mtime, size): made is True if th_path is up to date,
+        and False if the image has the requested size already or could not
+        be resized.  mtime and size are the image's, for the manifest.
+    """
     try:
-        img = Image.open(photo_path).copy()
-        img.thumbnail(size, Image.ANTIALIAS)
-        img.save(th_path, quality=config_value('THUMBNAIL', 'IMAGE_QUALITY'))
+        mtime = os.path.getmtime(photo_path)
+        orig_size = Image.open(photo_path).size
+        if os.path.isfile(th_path) and not (mtime > os.path.getmtime(th_path)):
+            return True, mtime, orig_size
+        size = _thumbnail_size(orig_size, width, height)
+        if size is None:
+            return False, mtime, orig_size
+        _resize(photo_path, th_path, size, quality)
+        return True, mtime, orig_size
     except Exception as err:
-        # this goes to webserver error log
-        import sys
-        print('[MAKE THUMBNAIL] error %s for file %r' % (err, photo_url), file=sys.stderr)
-        return photo_url
+        print('[MAKE THUMBNAIL] error %s for file %r' % (err, photo_path), file=sys.stderr)
+        return False, None, None
 
-    return th_url
+def _photo_name(photo_url, root=settings.MEDIA_ROOT, url_root=settings.MEDIA_URL):
+    """ the image's name relative to the media root, which keys the manifest """
+
+    if photo_url.startswith(url_root):
+        photo_url = photo_url[len(url_root):]
+    elif photo_url.startswith(root):
+        photo_url = photo_url[len(root):]
+    return photo_url.replace('\\', '/').lstrip('/')
+
+##################################################
+## WORKER POOL ##
+
+_pool = None
+_pool_size = 0
+_pool_lock = threading.Lock()
+# thumbnails queued and not made yet
+_pending = set()
+
+def _get_pool(size):
+    global _pool, _pool_size
+    if _pool is None or _pool_size != size:
+        if _pool is not None:
+            _pool.shutdown(wait=False)
+        _pool = ProcessPoolExecutor(max_workers=size)
+        _pool_size = size
+    return _pool
+
+def _reset_pool():
+    global _pool
+    with _pool_lock:
+        _pool = None
+
+def parse_sizes(value):
+    """ the (width, height) pairs of a size list such as '85x85 120x x60' """
+
+    sizes = []
+    for size in (value or '').split():
+        width, sep, height = size.lower().partition('x')
+        try:
+            width = width and int(width) or None
+            height = height and int(height) or None
+        except ValueError:
+            log.warn("Invalid thumbnail size: %s", size)
+            continue
+        if (width is not None) or (height is not None):
+            sizes.append((width, height))
+    return sizes
+
+def record_thumbnail(name, width, height, result):
+    """ add a _generate_thumbnail result to the manifest """
+
+    made, mtime, size = result
+    th_url = ''
+    if made:
+        th_url = _get_thumbnail_path(name, width, height)
+    manifest.record(name, mtime, size, width, height, th_url)
+
+def queue_thumbnail(photo_url, width=None, height=None, root=settings.MEDIA_ROOT, url_root=settings.MEDIA_URL):
+    """ make the thumbnail on the worker pool, without waiting for it
+
+        with THUMBNAIL.WORKERS set to 0 the thumbnail is made at once
+    """
+
+    # one of width/height is required
+    assert (width is not None) or (height is not None)
+
+    if not photo_url: return
+
+    workers = config_value('THUMBNAIL', 'WORKERS')
+    if workers < 1:
+        make_thumbnail(photo_url, width, height, root, url_root)
+        return
+
+    name = _photo_name(photo_url, root, url_root)
+    th_path = _get_path_from_url(_get_thumbnail_path(name, width, height), root, url_root)
+    photo_path = _get_path_from_url(name, root, url_root)
+
+    with _pool_lock:
+        if th_path in _pending:
+            return
+        _pending.add(th_path)
+        pool = _get_pool(workers)
+
+    caller = threading.current_thread()
+
+    def done(future):
+        try:
+            if not future.cancelled() and future.exception() is None:
+                record_thumbnail(name, width, height, future.result())
+        except Exception as err:
+            log.warn("Could not record thumbnail %s: %s", th_path, err)
+        finally:
+            if threading.current_thread() is not caller:
+                # the pool's thread keeps no connection open
+                connection.close()
+            with _pool_lock:
+                _pending.discard(th_path)
+
+    try:
+        future = pool.submit(_generate_thumbnail, photo_path, th_path, width, height,
+            config_value('THUMBNAIL', 'IMAGE_QUALITY'))
+    except Exception as err:
+        # a worker died, the next thumbnail starts a new pool
+        log.warn("Could not queue thumbnail %s: %s", th_path, err)
+        with _pool_lock:
+            _pending.discard(th_path)
+        _reset_pool()
+        return
+    future.add_done_callback(done)
+
+def pregenerate_thumbnails(photo_url, root=settings.MEDIA_ROOT, url_root=settings.MEDIA_URL):
+    """ queue the thumbnails of THUMBNAIL.PREGENERATE_SIZES for a saved image
+
+        the old thumbnails are forgotten only if the image file changed, so
+        that saving an object with an unchanged image keeps them
+    """
+
+    name = _photo_name(photo_url, root, url_root)
+    try:
+        mtime = os.path.getmtime(_get_path_from_url(name, root, url_root))
+    except OSError:
+        mtime = None
+    if manifest.mtime(name) != mtime:
+        manifest.forget(name)
+    for width, height in parse_sizes(config_value('THUMBNAIL', 'PREGENERATE_SIZES')):
+        if manifest.variant(name, width, height) is None:
+            queue_thumbnail(photo_url, width, height, root, url_root)
+
+def get_thumbnail_url(photo_url, width=None, height=None, root=settings.MEDIA_ROOT, url_root=settings.MEDIA_URL):
+    """ return the thumbnail URL if the manifest has it
+
+        otherwise the thumbnail is queued and the original URL returned, so
+        that rendering a page does not wait for images to be resized
+    """
+
+    # one of width/height is required
+    assert (width is not None) or (height is not None)
+
+    if not photo_url: return None
+
+    if config_value('THUMBNAIL', 'WORKERS') < 1:
+        return make_thumbnail(photo_url, width, height, root, url_root)
+
+    th_url = manifest.variant(_photo_name(photo_url, root, url_root), width, height)
+    if th_url:
+        return th_url
+    if th_url is None:
+        queue_thumbnail(photo_url, width, height, root, url_root)
+    return photo_url
 
 def remove_file_thumbnails(file_name_path):
     if not file_name_path: return # empty path
-    import fnmatch, os
+    manifest.forget(_photo_name(file_name_path))
     base, ext = os.path.splitext(os.path.basename(file_name_path))
     basedir = os.path.dirname(file_name_path)
     for file in fnmatch.filter(os.listdir(basedir), _THUMBNAIL_GLOB % (base, ext)):
@@ -210,9 +410,14 @@ def _get_cached_file(path, default=None):
 def get_image_size(photo_url, root=settings.MEDIA_ROOT, url_root=settings.MEDIA_URL):
     """ returns image size.
 
-        image sizes are cached (using separate locmem:/// cache instance)
+        image sizes are taken from the thumbnail manifest, or cached (using
+        separate locmem:/// cache instance)
     """
 
+    size = manifest.size(_photo_name(photo_url, root, url_root))
+    if size is not None:
+        return size
+
     path = _get_path_from_url(photo_url, root, url_root)
 
     size = _get_cached_file(path)
@@ -221,7 +426,6 @@ def get_image_size(photo_url, root=settings.MEDIA_ROOT, url_root=settings.MEDIA_
             size = Image.open(path).size
         except Exception as err:
             # this goes to webserver error log
-            import sys
             print('[GET IMAGE SIZE] error %s for file %r' % (err, photo_url), file=sys.stderr)
             return None, None
 
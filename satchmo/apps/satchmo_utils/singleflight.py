@@ -0,0 +1,194 @@
+"""
+Single flight population of keyedcache values.
+
+Hot lookups such as the shop config, the current sale or the product counts
+used to follow cache_get -> NotCachedError -> query -> cache_set, so when a
+popular key expired under load every worker ran the same query at once.
+Here only the worker holding a short lock in the cache computes the value:
+
+    from satchmo_utils.singleflight import cache_lookup
+    sale = cache_lookup(('discount', 'sale', site, today), find_sale)
+
+- Others asking for a missing value wait for that worker, up to `wait`
+  seconds, and compute it themselves after that.
+- An expired value is still served for `stale` seconds while one worker
+  refreshes it.
+- Before it expires, a value is refreshed early with a probability rising
+  as its expiry gets near, and the longer it takes to compute (the "XFetch"
+  method), so most refreshes happen before anyone would have to wait.
+
+Values are stored with keyedcache, so keyedcache.cache_delete invalidates
+them as before.  The defaults can be changed with
+SATCHMO_SETTINGS['SINGLE_FLIGHT'], a dictionary of SingleFlight arguments.
+"""
+from django.conf import settings
+import keyedcache
+import logging
+import math
+import random
+import threading
+import time
+
+log = logging.getLogger('satchmo_utils.singleflight')
+
+
+def wait_for(read, timeout, interval=0.05):
+    """Call `read()` until it returns something other than None, or until
+    `timeout` seconds have passed.  Returns the last result."""
+    deadline = time.time() + timeout
+    while True:
+        value = read()
+        if value is not None or time.time() >= deadline:
+            return value
+        time.sleep(min(interval, max(0, deadline - time.time())))
+
+
+class SingleFlight(object):
+    """
+    Computes cached values one worker at a time.
+
+    - stale: seconds an expired value is still served while it is refreshed
+    - beta: how eagerly values are refreshed before they expire, 0 turns
+      early refreshes off
+    - wait: seconds to wait for another worker computing a missing value
+    - lock_timeout: seconds after which the lock of a worker which died
+      while computing is given up
+    """
+
+    STATS = ('hit', 'early', 'stale', 'miss', 'wait', 'recompute', 'error')
+
+    def __init__(self, stale=60, beta=1.0, wait=5, lock_timeout=30):
+        self.stale = stale
+        self.beta = beta
+        self.wait = wait
+        self.lock_timeout = lock_timeout
+        self._lock = threading.Lock()
+        self.reset_stats()
+
+    def reset_stats(self):
+        with self._lock:
+            self._stats = {}
+
+    def stats(self):
+        """The counts and the seconds spent waiting of this process, for
+        each kind of value, keyed by the first part of its key."""
+        with self._lock:
+            return dict((name, dict(stats)) for name, stats in self._stats.items())
+
+    def _count(self, name, stat, waited=0):
+        with self._lock:
+            stats = self._stats.get(name, None)
+            if stats is None:
+                stats = self._stats[name] = dict.fromkeys(self.STATS, 0)
+                stats['wait_time'] = 0.0
+            stats[stat] += 1
+            stats['wait_time'] += waited
+
+    def _read(self, key):
+        try:
+            entry = keyedcache.cache_get(key)
+        except keyedcache.NotCachedError:
+            return None
+        # values cached by a plain cache_set are treated as missing
+        if isinstance(entry, tuple) and len(entry) == 3:
+            return entry
+        return None
+
+    def set(self, keys, value, length=None):
+        """Store a value which is known already, such as a saved object."""
+        self._store(keyedcache.cache_key(keys), value, length, 0)
+
+    def _store(self, key, value, length, delta):
+        if length is None:
+            length = keyedcache.CACHE_TIMEOUT
+        if length is None:
+            expires = None
+        else:
+            expires = time.time() + length
+            length += self.stale
+        keyedcache.cache_set(key, value=(value, expires, delta), length=length)
+
+    def _compute(self, name, key, compute, length, claimed=True):
+        """Compute and store the value, releasing the lock when `claimed`,
+        the caller holding it."""
+        self._count(name, 'recompute')
+        started = time.time()
+        try:
+            value = compute()
+            self._store(key, value, length, time.time() - started)
+            return value
+        except Exception:
+            self._count(name, 'error')
+            raise
+        finally:
+            if claimed:
+                keyedcache.cache.delete(key + '-flight')
+
+    def _claim(self, key):
+        return keyedcache.cache.add(key + '-flight', True, self.lock_timeout)
+
+    def get(self, keys, compute, length=None):
+        """
+        The value cached under the keyedcache `keys`, calling `compute()` to
+        make it when needed.  `length` is the number of seconds it is fresh,
+        keyedcache's default when None.  Exceptions raised by `compute` are
+        not cached.
+        """
+        if not keyedcache.cache_enabled():
+            return compute()
+
+        key = keyedcache.cache_key(keys)
+        name = key.split(keyedcache.KEY_DELIM, 1)[0]
+        entry = self._read(key)
+
+        if entry is not None:
+            value, expires, delta = entry
+            now = time.time()
+            if expires is None:
+                self._count(name, 'hit')
+                return value
+            if now < expires:
+                # 1 - random() is never 0, the log of which is undefined
+                early = now - delta * self.beta * math.log(1.0 - random.random()) >= expires
+                if not early:
+                    self._count(name, 'hit')
+                    return value
+            if self._claim(key):
+                self._count(name, now < expires and 'early' or 'stale')
+                return self._compute(name, key, compute, length)
+            self._count(name, 'stale')
+            return value
+
+        self._count(name, 'miss')
+        claimed = self._claim(key)
+        if not claimed:
+            started = time.time()
+            entry = wait_for(lambda: self._read(key), self.wait)
+            self._count(name, 'wait', time.time() - started)
+            if entry is not None:
+                return entry[0]
+            log.debug('Gave up waiting for %s', key)
+            # the lock expired or its worker is slow, compute it here too,
+            # leaving the lock to whoever holds it now
+            claimed = self._claim(key)
+        return self._compute(name, key, compute, length, claimed)
+
+
+_flight = None
+_flight_lock = threading.Lock()
+
+def get_single_flight():
+    """The SingleFlight shared by the whole process."""
+    global _flight
+    with _flight_lock:
+        if _flight is None:
+            _flight = SingleFlight(**getattr(settings, 'SATCHMO_SETTINGS', {}).get('SINGLE_FLIGHT', {}))
+        return _flight
+
+def cache_lookup(keys, compute, length=None):
+    """The value cached under `keys`, computed once at a time, see SingleFlight.get."""
+    return get_single_flight().get(keys, compute, length=length)
+
+def cache_store(keys, value, length=None):
+    """Store a value for `cache_lookup`, see SingleFlight.set."""
+    get_single_flight().set(keys, value, length=length)
@@ -0,0 +1,112 @@
+"""
+Tables compiled from database rows and kept in memory in each process, for
+lookups which run on every cart or checkout page, such as shipping rate
+tiers and sales tax boundaries.
+"""
+from collections import OrderedDict
+from django.core.cache import cache
+import threading
+import time
+
+# changes kept for the other processes, which drop all of their tables when
+# they missed more
+MAX_CHANGES = 1000
+
+
+class TableCache(object):
+    """
+    Tables compiled from the database and kept in this process.
+
+    `build(key)` makes the table for a key.  `clear()` drops the tables, in
+    this process at once, and in the others within `check_interval` seconds
+    through a version number in the shared cache.  `discard(key)` drops the
+    table of one key the same way, through a numbered list of changed keys.
+    With `max_tables`, the least recently used tables are dropped beyond
+    that number.
+    """
+
+    def __init__(self, name, build, check_interval=30, max_tables=None):
+        self.version_key = '%s-version' % name
+        self.changes_key = '%s-changes' % name
+        self.build = build
+        self.check_interval = check_interval
+        self.max_tables = max_tables
+        self._lock = threading.Lock()
+        self._tables = OrderedDict()
+        self._version = None
+        self._change = None
+        self._checked = 0
+
+    def _check(self, now):
+        found = cache.get_many([self.version_key, self.changes_key])
+        version = found.get(self.version_key, None)
+        if version is None:
+            cache.add(self.version_key, now, None)
+            version = cache.get(self.version_key)
+        change = found.get(self.changes_key, None)
+
+        discarded = None
+        if version == self._version and change != self._change:
+            # the counter starts at 0 when there was none
+            start = self._change or 0
+            missed = (change or 0) - start
+            if change is not None and 0 < missed <= MAX_CHANGES:
+                keys = ['%s-%i' % (self.changes_key, i) for i in range(start + 1, change + 1)]
+                discarded = cache.get_many(keys)
+                if len(discarded) < missed:
+                    # some changes expired, which ones is not known
+                    discarded = None
+
+        with self._lock:
+            if version != self._version or (change != self._change and discarded is None):
+                self._tables = OrderedDict()
+                self._version = version
+            elif discarded:
+                for key in discarded.values():
+                    self._tables.pop(key, None)
+            self._change = change
+            self._checked = now
+
+    def get(self, key):
+        now = time.time()
+        if now - self._checked > self.check_interval:
+            self._check(now)
+
+        tables = self._tables
+        table = tables.get(key, None)
+        if table is None:
+            # a clear() while building replaces the dictionary, so a table
+            # built from old rows is not kept
+            table = self.build(key)
+            with self._lock:
+                tables[key] = table
+                while self.max_tables and len(tables) > self.max_tables:
+                    tables.popitem(last=False)
+        elif self.max_tables:
+            with self._lock:
+                if key in tables:
+                    tables.move_to_end(key)
+        return table
+
+    def clear(self, **kwargs):
+        """Drop all tables, can be connected to model signals directly."""
+        version = time.time()
+        cache.set(self.version_key, version, None)
+        with self._lock:
+            self._tables = OrderedDict()
+            self._version = version
+            self._checked = version
+
+    def discard(self, key):
+        """Drop the table of one key, in this process at once and in the
+        others within `check_interval` seconds."""
+        cache.add(self.changes_key, 0, None)
+        try:
+            change = cache.incr(self.changes_key)
+        except ValueError:
+            # the counter was evicted just now
+            self.clear()
+            return
+        cache.set('%s-%i' % (self.changes_key, change), key, max(self.check_interval * 10, 300))
+        with self._lock:
+            self._tables.pop(key, None)
@@ -1,7 +1,15 @@
 from decimal import Decimal
 from django.test import TestCase
+from satchmo_utils.httppool import HTTPPool, _dropped
 from satchmo_utils.numbers import round_decimal, trunc_decimal
+from satchmo_utils.satchmo_thumbnail.manifest import manifest
+from satchmo_utils.satchmo_thumbnail.utils import _thumbnail_size, parse_sizes
+from satchmo_utils.singleflight import SingleFlight, wait_for
+from satchmo_utils.tablecache import TableCache
 from satchmo_utils.unique_id import slugify
+from six.moves import BaseHTTPServer, socketserver, urllib
+import keyedcache
+import threading
 
 class TestRoundedDecimals(TestCase):
 
@@ -80,3 +88,236 @@ class TestSlugify(TestCase):
         self.assertEqual(val, '')
         # arguments instance, slug_field and filter_dict can be better tested in 'product' tests
 
+
+class TestThumbnailSizes(TestCase):
+
+    def testParseSizes(self):
+        self.assertEqual(parse_sizes('85x85 120x x60'), [(85, 85), (120, None), (None, 60)])
+        self.assertEqual(parse_sizes('x 85xab'), [])
+        self.assertEqual(parse_sizes(''), [])
+
+    def testThumbnailSize(self):
+        self.assertEqual(_thumbnail_size((200, 100), 85, 85), (85, 85))
+        self.assertEqual(_thumbnail_size((200, 100), width=120), (120, 100))
+        self.assertEqual(_thumbnail_size((200, 100), height=60), (200, 60))
+        self.assertEqual(_thumbnail_size((200, 100), width=200), None)
+
+class TestThumbnailManifest(TestCase):
+
+    def setUp(self):
+        manifest.tables.clear()
+
+    def testRecordAndForget(self):
+        self.assertEqual(manifest.variant('images/a.jpg', 85, 85), None)
+
+        manifest.record('images/a.jpg', 100.0, (200, 100), 85, 85, 'images/a_t_w85_h85.jpg')
+        manifest.record('images/a.jpg', 100.0, (200, 100), width=200)
+        with self.assertNumQueries(1):
+            self.assertEqual(manifest.variant('images/a.jpg', 85, 85), 'images/a_t_w85_h85.jpg')
+            self.assertEqual(manifest.variant('images/a.jpg', width=200), '')
+            self.assertEqual(manifest.size('images/a.jpg'), (200, 100))
+            self.assertEqual(manifest.mtime('images/a.jpg'), 100.0)
+        # unknown images are kept too
+        self.assertEqual(manifest.variant('images/b.jpg', width=200), None)
+        with self.assertNumQueries(0):
+            self.assertEqual(manifest.variant('images/b.jpg', width=200), None)
+
+        # recording drops only that image's entry, here and in the other
+        # processes
+        manifest.record('images/a.jpg', 100.0, (200, 100), height=60, th_url='images/a_t_h60.jpg')
+        with self.assertNumQueries(1):
+            self.assertEqual(manifest.variant('images/a.jpg', height=60), 'images/a_t_h60.jpg')
+            self.assertEqual(manifest.variant('images/a.jpg', 85, 85), 'images/a_t_w85_h85.jpg')
+            self.assertEqual(manifest.variant('images/b.jpg', width=200), None)
+
+        # a changed image starts over
+        manifest.record('images/a.jpg', 200.0, (300, 150), width=120, th_url='images/a_t120.jpg')
+        self.assertEqual(manifest.variant('images/a.jpg', 85, 85), None)
+
+        manifest.forget('images/a.jpg')
+        self.assertEqual(manifest.variant('images/a.jpg', width=120), None)
+
+class TestSingleFlight(TestCase):
+
+    def setUp(self):
+        keyedcache.cache_delete()
+        self.flight = SingleFlight(stale=60, beta=0, wait=0.1)
+        self.calls = []
+
+    def tearDown(self):
+        keyedcache.cache_delete()
+
+    def compute(self):
+        self.calls.append(1)
+        return len(self.calls)
+
+    def lock(self, *keys):
+        keyedcache.cache.add(keyedcache.cache_key(*keys) + '-flight', True, 30)
+
+    def testMissAndHit(self):
+        self.assertEqual(self.flight.get(('flight-test', 1), self.compute), 1)
+        self.assertEqual(self.flight.get(('flight-test', 1), self.compute), 1)
+        stats = self.flight.stats()['flight-test']
+        self.assertEqual((stats['miss'], stats['hit'], stats['recompute']), (1, 1, 1))
+
+    def testStale(self):
+        # expired a second ago, but still within the stale window
+        self.flight.set(('flight-test', 2), 'old', length=-1)
+        self.lock('flight-test', 2)
+        self.assertEqual(self.flight.get(('flight-test', 2), self.compute), 'old')
+        self.assertEqual(self.calls, [])
+
+        keyedcache.cache.delete(keyedcache.cache_key('flight-test', 2) + '-flight')
+        self.assertEqual(self.flight.get(('flight-test', 2), self.compute), 1)
+        self.assertEqual(self.flight.get(('flight-test', 2), self.compute), 1)
+
+    def testWaitGivesUp(self):
+        self.lock('flight-test', 3)
+        self.assertEqual(self.flight.get(('flight-test', 3), self.compute), 1)
+        stats = self.flight.stats()['flight-test']
+        self.assertEqual(stats['wait'], 1)
+        self.assertTrue(stats['wait_time'] >= 0.1)
+        # the lock of the other worker is left alone
+        self.assertTrue(keyedcache.cache.get(keyedcache.cache_key('flight-test', 3) + '-flight'))
+
+    def testErrorsNotCached(self):
+        def fail():
+            raise ValueError('no')
+        self.assertRaises(ValueError, self.flight.get, ('flight-test', 4), fail)
+        self.assertEqual(self.flight.get(('flight-test', 4), self.compute), 1)
+        self.assertEqual(self.flight.stats()['flight-test']['error'], 1)
+
+class TestTableCache(TestCase):
+    def setUp(self):
+        self.built = []
+        self.tables = TableCache('tablecache-test', self.build, max_tables=2)
+        self.tables.clear()
+
+    def build(self, key):
+        self.built.append(key)
+        return key * 2
+
+    def testLeastRecentlyUsedDropped(self):
+        for key in (1, 2, 1, 3, 1, 2):
+            self.assertEqual(self.tables.get(key), key * 2)
+        # 2 was dropped for 3, as 1 had been used since
+        self.assertEqual(self.built, [1, 2, 3, 2])
+
+    def testDiscard(self):
+        # another process, which checks for changes on every lookup
+        other = TableCache('tablecache-test', self.build, check_interval=-1)
+        for tables in (self.tables, other):
+            tables.get(1)
+            tables.get(2)
+        self.tables.discard(1)
+        self.assertEqual(self.built, [1, 2, 1, 2])
+        for tables in (self.tables, other):
+            tables.get(1)
+            tables.get(2)
+        # only 1 is built again, once in each process
+        self.assertEqual(self.built, [1, 2, 1, 2, 1, 1])
+
+class PoolTestHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    failures = []
+
+    def do_GET(self):
+        self.send_response(200)
+        self.send_header('Content-Length', str(len(self.path)))
+        self.end_headers()
+        self.wfile.write(self.path.encode('ascii'))
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        # one handler serves all the requests of a connection
+        self.handled = getattr(self, 'handled', 0) + 1
+        if self.path == '/stale' and self.handled > 1:
+            # as a server which closed the idle connection
+            self.close_connection = True
+            return
+        if self.path == '/once':
+            # answered as if the connection was kept, then closed as a
+            # server does with idle connections
+            self.close_connection = True
+        if self.path == '/moved':
+            self.send_response(302)
+            self.send_header('Location', '/echo')
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+        if self.path == '/flaky' and self.failures:
+            self.failures.pop()
+            # drop the connection without answering
+            self.close_connection = True
+            return
+        status = self.path == '/error' and 500 or 200
+        self.send_response(status)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class PoolTestServer(socketserver.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+    daemon_threads = True
+
+
+class TestHTTPPool(TestCase):
+    def setUp(self):
+        self.server = PoolTestServer(('127.0.0.1', 0), PoolTestHandler)
+        thread = threading.Thread(target=self.server.serve_forever)
+        thread.daemon = True
+        thread.start()
+        self.url = 'http://127.0.0.1:%i' % self.server.server_address[1]
+        self.pool = HTTPPool(max_per_host=2, timeout=5, backoff=0)
+
+    def tearDown(self):
+        self.pool.close()
+        self.server.shutdown()
+        self.server.server_close()
+
+    def testReuse(self):
+        for i in range(3):
+            response = self.pool.request(self.url + '/echo', data=u'ping %i' % i)
+            self.assertEqual(response.read(), b'ping %i' % i)
+        stats = self.pool.stats()['http://127.0.0.1:%i' % self.server.server_address[1]]
+        self.assertEqual(stats['created'], 1)
+        self.assertEqual(stats['reused'], 2)
+        self.assertEqual(stats['idle'], 1)
+
+    def testHTTPError(self):
+        self.assertRaises(urllib.error.HTTPError, self.pool.request, self.url + '/error', data=b'x')
+
+    def testRetries(self):
+        PoolTestHandler.failures[:] = [1]
+        self.assertRaises(urllib.error.URLError, self.pool.request, self.url + '/flaky', data=b'x')
+        PoolTestHandler.failures[:] = [1, 1]
+        response = self.pool.request(self.url + '/flaky', data=b'x', idempotent=True)
+        self.assertEqual(response.read(), b'x')
+
+    def testClosedIdleConnection(self):
+        self.assertEqual(self.pool.request(self.url + '/once', data=b'one').read(), b'one')
+        host = self.pool._hosts[('http', '127.0.0.1', self.server.server_address[1])]
+        conn = host.idle[0][0]
+        self.assertTrue(wait_for(lambda: _dropped(conn) or None, 5))
+        # not idempotent, the closed connection is left out before sending
+        self.assertEqual(self.pool.request(self.url + '/once', data=b'two').read(), b'two')
+        stats = host.stats()
+        self.assertEqual(stats['created'], 2)
+        self.assertEqual(stats['retries'], 0)
+
+    def testDroppedAfterSending(self):
+        self.assertEqual(self.pool.request(self.url + '/stale', data=b'one').read(), b'one')
+        # the server may have handled it, so it is not sent again
+        self.assertRaises(urllib.error.URLError, self.pool.request, self.url + '/stale', data=b'two')
+
+        self.assertEqual(self.pool.request(self.url + '/stale', data=b'three').read(), b'three')
+        response = self.pool.request(self.url + '/stale', data=b'four', idempotent=True)
+        self.assertEqual(response.read(), b'four')
+
+    def testRedirect(self):
+        response = self.pool.request(self.url + '/moved', data=b'x')
+        self.assertEqual(response.status, 200)
+        self.assertEqual(response.read(), b'/echo')
@@ -1,5 +1,5 @@
 from django.utils.translation import gettext_lazy as _
-from livesettings.values import StringValue,ConfigurationGroup, BooleanValue, MultipleStringValue
+from livesettings.values import StringValue,ConfigurationGroup, BooleanValue, MultipleStringValue, IntegerValue
 from livesettings.functions import config_register, config_value
 from satchmo_store.shop import get_satchmo_setting
 from satchmo_utils import load_module
@@ -47,6 +47,51 @@ config_register(
         ordering=15
         ))
 
+config_register(
+    IntegerValue(SHIPPING_GROUP,
+        'QUOTE_WORKERS',
+        description = _("Concurrent carrier quotes"),
+        help_text = _("Number of carriers (such as UPS or USPS) which are asked for rates at the same time. Set to 0 to ask them one after another."),
+        default=4,
+        ordering=20
+        ))
+
+config_register(
+    IntegerValue(SHIPPING_GROUP,
+        'QUOTE_TIMEOUT',
+        description = _("Carrier quote timeout"),
+        help_text = _("Seconds to wait for a carrier's rates before leaving it out of the shipping choices."),
+        default=5,
+        ordering=25
+        ))
+
+config_register(
+    IntegerValue(SHIPPING_GROUP,
+        'RATE_CACHE_TTL',
+        description = _("Carrier rate cache time"),
+        help_text = _("Seconds a carrier's rates for a shipment are reused before asking the carrier again."),
+        default=600,
+        ordering=30
+        ))
+
+config_register(
+    IntegerValue(SHIPPING_GROUP,
+        'RATE_CACHE_STALE',
+        description = _("Carrier rate stale time"),
+        help_text = _("Seconds after the cache time during which the old rates are still shown while new ones are requested in the background."),
+        default=3600,
+        ordering=35
+        ))
+
+config_register(
+    IntegerValue(SHIPPING_GROUP,
+        'RATE_CACHE_ERROR_TTL',
+        description = _("Carrier error cache time"),
+        help_text = _("Seconds a carrier is left out after failing to answer."),
+        default=60,
+        ordering=40
+        ))
+
 
 # --- Load default shipping modules.  Ignore import errors, user may have deleted them. ---
 # DO NOT ADD 'tiered' or 'no' to this list.
@@ -0,0 +1,92 @@
+from decimal import Decimal
+from django.core.management.base import BaseCommand
+from satchmo_store.shop.models import NullCart
+from shipping.modules.base import BaseShipper, rate_cache, shipment_signature
+from shipping.quotes import quote_methods
+from satchmo_utils.httppool import get_http_pool, http_request
+from six.moves import BaseHTTPServer, socketserver
+import threading
+import time
+
+class FakeCarrierHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+    """Answers every rate request with a fixed rate, after sleeping for the
+    number of milliseconds given in the path."""
+
+    protocol_version = 'HTTP/1.1'
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        time.sleep(int(self.path.strip('/')) / 1000.0)
+        body = b'<Rate>10.00</Rate>'
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/xml')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+class FakeCarrierServer(socketserver.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+    daemon_threads = True
+
+class FakeCarrier(BaseShipper):
+    remote = True
+
+    def __init__(self, url, index, cached=False):
+        super(FakeCarrier, self).__init__()
+        self.url = url
+        self.id = "Fake-%i" % index
+        self.cached = cached
+
+    def _process_request(self):
+        return http_request(self.url, data=b'<RateRequest/>', timeout=self.quote_timeout(), idempotent=True).read()
+
+    def calculate(self, cart, contact):
+        if self.cached:
+            signature = shipment_signature('fake', self.id, ('US', '00000'), ('US', '99999'), [], url=self.url)
+            raw = rate_cache.fetch(signature, self._process_request)
+        else:
+            raw = self._process_request()
+        self.charges = Decimal(raw[6:-7].decode('ascii'))
+        super(FakeCarrier, self).calculate(cart, contact)
+
+class Command(BaseCommand):
+    help = "Compares sequential and concurrent shipping quotes against a local fake carrier server."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--carriers', type=int, dest='carriers', default=4,
+            help="Number of carriers quoted.")
+        parser.add_argument('--latency', type=int, dest='latency', default=300,
+            help="Milliseconds the fake carrier takes to answer.")
+        parser.add_argument('--workers', type=int, dest='workers', default=4,
+            help="Size of the quote thread pool.")
+        parser.add_argument('--repeat', type=int, dest='repeat', default=3,
+            help="Number of quotes timed for each mode.")
+
+    def handle(self, **options):
+        server = FakeCarrierServer(('127.0.0.1', 0), FakeCarrierHandler)
+        thread = threading.Thread(target=server.serve_forever)
+        thread.daemon = True
+        thread.start()
+        url = 'http://127.0.0.1:%i/%i' % (server.server_address[1], options['latency'])
+        cart = NullCart()
+
+        try:
+            rate_cache.reset_stats()
+            modes = (('sequential', 0, False), ('concurrent', options['workers'], False),
+                ('cached', options['workers'], True))
+            for label, workers, cached in modes:
+                started = time.time()
+                for i in range(options['repeat']):
+                    methods = [FakeCarrier(url, n, cached=cached) for n in range(options['carriers'])]
+                    quoted = quote_methods(methods, cart, None, workers=workers)
+                elapsed = (time.time() - started) / options['repeat']
+                print("%s: %i of %i carriers quoted, %.0fms per quote" % (
+                    label, len(quoted), options['carriers'], elapsed * 1000))
+            print("rate cache: %s" % ", ".join("%s %i" % (stat, ct) for stat, ct in sorted(rate_cache.stats().items())))
+            for host, stats in get_http_pool().stats().items():
+                print("connections to %s: %s" % (host, ", ".join("%s %i" % (stat, ct) for stat, ct in sorted(stats.items()))))
+        finally:
+            server.shutdown()
+            server.server_close()
@@ -1,4 +1,23 @@
+from bisect import bisect_left, bisect_right
+from datetime import date
+from decimal import Decimal
+from django.core.cache import cache
+from django.utils.encoding import force_str
+from livesettings.functions import config_value
+from satchmo_utils.asynchronous import AsynchronousRunner
+from satchmo_utils.singleflight import wait_for
+import hashlib
+import logging
+import threading
+import time
+
+log = logging.getLogger('shipping.modules.base')
+
 class BaseShipper(object):
+    # True for shippers which ask a carrier over the network, these are
+    # quoted concurrently by shipping.quotes
+    remote = False
+
     def __init__(self, cart=None, contact=None):
         self._calculated = False
         self.cart = cart
@@ -15,4 +34,178 @@ class BaseShipper(object):
         """
         self.cart = cart
         self.contact = contact
-        self._calculated = True
\ No newline at end of file
+        self._calculated = True
+
+    def quote_timeout(self):
+        """
+        Seconds to wait for a remote quote before leaving this method out.
+        """
+        return config_value('SHIPPING', 'QUOTE_TIMEOUT')
+
+
+class CarrierError(Exception):
+    """A carrier could not be asked for rates, or failed recently."""
+    pass
+
+
+PACKAGE_ATTRS = ('weight', 'weight_units', 'length', 'width', 'height', 'length_units')
+
+def _canonical(value):
+    if value is None:
+        return ''
+    if isinstance(value, Decimal):
+        # 2.50 and 2.5 are the same weight
+        return '{0:f}'.format(value.normalize())
+    return force_str(value).strip().upper()
+
+def shipment_packages(cart):
+    """
+    The weight and dimensions of every item in the cart's shipment, sorted so
+    that the order of the cart lines does not matter.
+    """
+    packages = []
+    for product in cart.get_shipment_list():
+        packages.append(tuple(_canonical(product.smart_attr(attr)) for attr in PACKAGE_ATTRS))
+    return tuple(sorted(packages))
+
+def shipment_signature(carrier, service, origin, destination, packages, **options):
+    """
+    A cache key for a rate request, built from everything the carrier's
+    answer depends on: the service asked for, the origin and destination
+    addresses (as tuples such as (country, postal code)), the packages from
+    `shipment_packages`, and any carrier specific options.
+    """
+    parts = (
+        _canonical(service),
+        tuple(_canonical(part) for part in origin),
+        tuple(_canonical(part) for part in destination),
+        tuple(packages),
+        tuple(sorted((key, _canonical(value)) for key, value in options.items())),
+    )
+    digest = hashlib.sha1(repr(parts).encode('utf-8')).hexdigest()
+    return 'shiprate-%s-%s' % (carrier, digest)
+
+
+class RateCache(object):
+    """
+    Caches carrier responses by shipment signature.
+
+    A response is fresh for SHIPPING.RATE_CACHE_TTL seconds.  For
+    SHIPPING.RATE_CACHE_STALE seconds after that it is still returned, while a
+    single background request refreshes it, so a repeat checkout view does not
+    wait on the carrier.  Views asking for the same missing response wait for
+    the one request made for it.  A failed request is remembered for
+    SHIPPING.RATE_CACHE_ERROR_TTL seconds, raising CarrierError until then.
+    """
+
+    STATS = ('hit', 'stale', 'miss', 'wait', 'error')
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset_stats()
+
+    def reset_stats(self):
+        with self._lock:
+            self._stats = dict.fromkeys(self.STATS, 0)
+
+    def stats(self):
+        """The hit, stale, miss, wait and error counts of this process."""
+        with self._lock:
+            return dict(self._stats)
+
+    def _count(self, stat):
+        with self._lock:
+            self._stats[stat] += 1
+
+    def fetch(self, signature, request):
+        """
+        Return the carrier's response for the signature, calling `request()`
+        to ask the carrier for it when it is not cached.
+        """
+        ttl = config_value('SHIPPING', 'RATE_CACHE_TTL')
+        stale = config_value('SHIPPING', 'RATE_CACHE_STALE')
+        error_ttl = config_value('SHIPPING', 'RATE_CACHE_ERROR_TTL')
+
+        entry = cache.get(signature)
+        if entry is None and not cache.add(signature + '-refresh', True, error_ttl):
+            # another view is asking the carrier for the same shipment
+            self._count('wait')
+            entry = wait_for(lambda: cache.get(signature), config_value('SHIPPING', 'QUOTE_TIMEOUT'))
+        if entry is None:
+            self._count('miss')
+            return self._refresh(signature, request, ttl, stale, error_ttl, background=False)
+
+        fresh_until, response, error = entry
+        if error is not None:
+            self._count('error')
+            raise CarrierError(error)
+
+        if time.time() < fresh_until:
+            self._count('hit')
+        else:
+            self._count('stale')
+            if cache.add(signature + '-refresh', True, error_ttl):
+                AsynchronousRunner(self._refresh, signature, request, ttl, stale, error_ttl, background=True).start()
+        return response
+
+    def _refresh(self, signature, request, ttl, stale, error_ttl, background):
+        try:
+            response = request()
+        except Exception as e:
+            if background:
+                # keep serving the stale response, the refresh lock expires
+                # after error_ttl and the next view tries again
+                log.warning('Could not refresh carrier rates [%s]: %s', signature, e)
+                return None
+            log.warning('Could not get carrier rates [%s]: %s', signature, e)
+            cache.set(signature, (0, None, force_str(e)), error_ttl)
+            raise CarrierError(e)
+
+        cache.set(signature, (time.time() + ttl, response, None), ttl + stale)
+        cache.delete(signature + '-refresh')
+        return response
+
+rate_cache = RateCache()
+
+
+class TierTable(object):
+    """
+    The tiers of a shipping rate table, sorted for bisect lookups.
+
+    `tiers` are (bound, expires, value) tuples.  Tiers with an expiry date are
+    special offers, which are used instead of the regular tiers while they
+    have not expired.
+    """
+
+    def __init__(self, tiers):
+        tiers = sorted(tiers, key=lambda tier: tier[0])
+        self._special = [tier for tier in tiers if tier[1] is not None]
+        regular = [tier for tier in tiers if tier[1] is None]
+        self._regular = (regular, [tier[0] for tier in regular])
+        self._day = None
+
+    def _candidates(self, today):
+        if today is None:
+            today = date.today()
+        if self._day != today:
+            live = [tier for tier in self._special if tier[1] >= today]
+            self._live = (live, [tier[0] for tier in live])
+            self._day = today
+        return (self._live, self._regular)
+
+    def floor(self, amount, today=None):
+        """The value of the tier with the highest bound at or below amount."""
+        for tiers, bounds in self._candidates(today):
+            i = bisect_right(bounds, amount)
+            if i:
+                return tiers[i - 1][2]
+        return None
+
+    def ceiling(self, amount, today=None):
+        """The value of the tier with the lowest bound at or above amount."""
+        for tiers, bounds in self._candidates(today):
+            i = bisect_left(bounds, amount)
+            if i < len(bounds):
+                return tiers[i][2]
+        return None
+
@@ -6,15 +6,14 @@ v0.1.1
 # Note, make sure you use decimal math everywhere!
 import re
 from decimal import Decimal
-from django.core.cache import cache
 from django.template import loader
 from django.utils.safestring import mark_safe 
 from django.utils.translation import gettext as _
 from livesettings.functions import config_get_group, config_value
-from shipping.modules.base import BaseShipper
+from shipping.modules.base import BaseShipper, rate_cache, shipment_packages, shipment_signature
 import datetime
 import logging
-from six.moves import urllib
+from satchmo_utils.httppool import http_request
 try:
     from xml.etree.ElementTree import fromstring, tostring
 except ImportError:
@@ -24,6 +23,8 @@ except ImportError:
 log = logging.getLogger('canadapost.shipper')
 
 class Shipper(BaseShipper):
+
+    remote = True
     
     def __init__(self, cart=None, contact=None, service_type=None):
 
@@ -94,13 +95,9 @@ class Shipper(BaseShipper):
 
     def _process_request(self, connection, request):
         '''
-          Post the data and return the XML response
+          Post the data and return the raw XML response
         '''
-        conn = urllib.request.Request(url=connection, data=request.encode("utf-8"))
-        f = urllib.request.urlopen(conn)
-        all_results = f.read()
-        self.raw = all_results
-        return(fromstring(all_results))
+        return http_request(connection, data=request, timeout=self.quote_timeout(), idempotent=True).read()
     
     def calculate(self, cart, contact):
         '''
@@ -148,21 +145,22 @@ class Shipper(BaseShipper):
         request = t.render(c)
         self.is_valid = False
         
-        cache_key_response = "canadapost-cart-%s-response" % int(cart.id)
-        cache_key_request = "canadapost-cart-%s-request" % int(cart.id)
-        last_request = cache.get(cache_key_request)
-        tree = cache.get(cache_key_response)
-        
-        if (last_request != request) or tree is None:
-            self.verbose_log("Requesting from Canada Post [%s]\n%s", cache_key_request, request)
-            cache.set(cache_key_request, request, 60)
-            tree = self._process_request(connection, request)
-            self.verbose_log("Got from Canada Post [%s]:\n%s", cache_key_response, self.raw)
-            needs_cache = True
-            cache.set(cache_key_response, tree, 60)
-        else:
-            needs_cache = False
-            
+        # one response rates every product, so the service is not part of the key
+        address = contact.shipping_address
+        signature = shipment_signature('canadapost', 'rates',
+            (shop_details.country.iso2_code, shop_details.postal_code),
+            (address.country.iso2_code, address.state, address.city, address.postal_code),
+            shipment_packages(cart),
+            cpcid=settings.CPCID.value,
+            turn_around_time=settings.TURN_AROUND_TIME.value,
+            items_price=cart.total,
+            live=settings.LIVE.value)
+
+        self.verbose_log("Canada Post rate request [%s]\n%s", signature, request)
+        self.raw = rate_cache.fetch(signature, lambda: self._process_request(connection, request))
+        self.verbose_log("Canada Post rate response [%s]:\n%s", signature, self.raw)
+        tree = fromstring(self.raw)
+
         try:
             status_code = tree.getiterator('statusCode')
             status_val = status_code[0].text
@@ -44,6 +44,8 @@ def convert_weight(value, src_unit, dst_unit):
 
 class Shipper(BaseShipper):
 
+    remote = True
+
     id = "fedex_web_services"
     
     def __init__(self,
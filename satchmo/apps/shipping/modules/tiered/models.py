@@ -2,7 +2,6 @@
 Tiered shipping models
 """
 from __future__ import unicode_literals
-import datetime
 import logging
 import operator
 from six.moves import reduce
@@ -11,9 +10,11 @@ from decimal import Decimal
 
 from django.conf import settings
 from django.db import models
+from django.db.models.signals import post_delete, post_save
 from django.utils.translation import get_language, gettext_lazy as _
 
-from shipping.modules.base import BaseShipper
+from shipping.modules.base import BaseShipper, TierTable
+from satchmo_utils.tablecache import TableCache
 from livesettings.functions import config_value
 
 log = logging.getLogger('shipping.Tiered')
@@ -52,7 +53,7 @@ class Shipper(BaseShipper):
             total = self.cart.undiscounted_total
         else:
             total = Decimal("0.00")
-            for cartitem in self.cart.cartitem_set.all():
+            for cartitem in self.cart:
                 if cartitem.product.is_shippable:
                     total += cartitem.line_total
         return self.carrier.price(total)
@@ -193,19 +194,13 @@ class Carrier(models.Model):
         if total == 0:
             total = Decimal('0.00')  # total was "0E-8", which breaks mysql
 
-        # first check for special discounts
-        prices = self.tiers.filter(expires__isnull=False, min_total__lte=total).exclude(expires__lt=datetime.date.today())
-
-        if not prices.count() > 0:
-            prices = self.tiers.filter(expires__isnull=True, min_total__lte=total)
-
-        if prices.count() > 0:
-            # Get the price with the quantity closest to the one specified without going over
-            return Decimal(prices.order_by('-min_total')[0].price)
-
-        else:
+        # special discounts are used first, then the price for the
+        # highest minimum total not above this total
+        price = carrier_tiers.get(self.pk).floor(total)
+        if price is None:
             log.debug("No tiered price found for %s: total=%s", self, total)
             raise TieredPriceException('No price available')
+        return Decimal(price)
 
     def __str__(self):
         return "Carrier: %s" % self.name
@@ -241,4 +236,14 @@ class ShippingTier(models.Model):
         ordering = ('carrier', 'price')
 
 
+def _build_tiers(carrier_id):
+    return TierTable([(tier.min_total, tier.expires, tier.price)
+        for tier in ShippingTier.objects.filter(carrier=carrier_id)])
+
+carrier_tiers = TableCache('tiered-tiers', _build_tiers)
+
+for model in (Carrier, ShippingTier):
+    post_save.connect(carrier_tiers.clear, sender=model)
+    post_delete.connect(carrier_tiers.clear, sender=model)
+
 from . import config
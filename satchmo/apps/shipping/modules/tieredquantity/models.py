@@ -6,9 +6,10 @@ from django.utils.encoding import python_2_unicode_compatible
 from decimal import Decimal
 from django.conf import settings
 from django.db import models
+from django.db.models.signals import post_delete, post_save
 from django.utils.translation import get_language, gettext_lazy as _
-from shipping.modules.base import BaseShipper
-import datetime
+from shipping.modules.base import BaseShipper, TierTable
+from satchmo_utils.tablecache import TableCache
 import logging
 import operator
 from six.moves import reduce
@@ -46,7 +47,7 @@ class Shipper(BaseShipper):
         """
         assert(self._calculated)
         qty = Decimal('0')
-        for cartitem in self.cart.cartitem_set.all():
+        for cartitem in self.cart:
             if cartitem.product.is_shippable:
                 qty += cartitem.quantity
         return self.carrier.price(qty)
@@ -176,19 +177,13 @@ class Carrier(models.Model):
     
     def price(self, qty):
         """Get a price for this qty."""
-        # first check for special discounts
-        prices = self.tiers.filter(expires__isnull=False, quantity__lte=qty).exclude(expires__lt=datetime.date.today())
-        
-        if not prices.count() > 0:
-            prices = self.tiers.filter(expires__isnull=True, quantity__lte=qty)
-
-        if prices.count() > 0:
-            # Get the price with the quantity closest to the one specified without going over
-            return Decimal(prices.order_by('-quantity')[0].calculate_price(qty))
-
-        else:
+        # special discounts are used first, then the tier with the
+        # quantity closest to the one specified without going over
+        tier = carrier_tiers.get(self.pk).floor(qty)
+        if tier is None:
             log.debug("No quantity tier found for %s: qty=%d", self.id, qty)
             raise TieredPriceException('No price available')
+        return Decimal(tier.calculate_price(qty))
             
             
     def __str__(self):
@@ -233,4 +228,14 @@ class QuantityTier(models.Model):
     class Meta:
         pass
 
+def _build_tiers(carrier_id):
+    return TierTable([(tier.quantity, tier.expires, tier)
+        for tier in QuantityTier.objects.filter(carrier=carrier_id)])
+
+carrier_tiers = TableCache('tieredquantity-tiers', _build_tiers)
+
+for model in (Carrier, QuantityTier):
+    post_save.connect(carrier_tiers.clear, sender=model)
+    post_delete.connect(carrier_tiers.clear, sender=model)
+
 from . import config
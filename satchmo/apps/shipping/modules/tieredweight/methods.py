@@ -4,4 +4,4 @@ from satchmo_utils import load_once
 load_once('tiered', 'shipping.modules.tieredweight')
 
 def get_methods():
-    return [Shipper(carrier) for carrier in Carrier.objects.filter(active=True)]
+    return [Shipper(carrier) for carrier in Carrier.objects.filter(active=True).select_related('default_zone')]
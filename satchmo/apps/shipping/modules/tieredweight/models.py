@@ -5,12 +5,13 @@ from __future__ import unicode_literals
 from django.utils.encoding import python_2_unicode_compatible
 import logging
 
-from datetime import date
 from django.db import models
+from django.db.models.signals import m2m_changed, post_delete, post_save
 from django.conf import settings
 from django.utils.translation import get_language, gettext_lazy as _
 from l10n.models import Country
-from shipping.modules.base import BaseShipper
+from shipping.modules.base import BaseShipper, TierTable
+from satchmo_utils.tablecache import TableCache
 
 try:
     from decimal import Decimal
@@ -26,13 +27,35 @@ class TieredWeightException(Exception):
 
 
 def _get_cart_weight(cart):
+    # the cart's items, products and subtypes are loaded once by its pricing snapshot
     weight = Decimal('0.0')
-    for item in cart.cartitem_set.all():
-        if item.is_shippable and item.product.smart_attr('weight'):
-            weight = weight + (item.product.smart_attr('weight') * item.quantity)
+    for item in cart:
+        if item.is_shippable:
+            item_weight = item.product.smart_attr('weight')
+            if item_weight:
+                weight = weight + (item_weight * item.quantity)
     return weight
 
 
+class CarrierRates(object):
+    """
+    The zones and weight tiers of a carrier, loaded with three queries, and
+    kept in `carrier_rates` until one of them is changed.
+    """
+
+    def __init__(self, carrier_id):
+        self.zones = {}
+        self.tiers = {}
+        zones = Zone.objects.filter(carrier=carrier_id).prefetch_related('countries', 'tiers')
+        for zone in zones:
+            for country in zone.countries.all():
+                self.zones[country.pk] = zone
+            self.tiers[zone.pk] = TierTable([(tier.min_weight, tier.expires, tier.cost)
+                for tier in zone.tiers.all()])
+
+carrier_rates = TableCache('tieredweight-rates', CarrierRates)
+
+
 class Shipper(BaseShipper):
     def __init__(self, carrier):
         self.id = 'tieredweight_%i' % carrier.pk
@@ -133,11 +156,10 @@ class Carrier(models.Model):
 
 
     def get_zone(self, country):
-        try:
-            return self.zones.filter(countries=country).get()
-        except Zone.DoesNotExist:
-            if self.default_zone:
-                return self.default_zone
+        zone = carrier_rates.get(self.pk).zones.get(country.pk, None)
+        if zone is None and self.default_zone:
+            return self.default_zone
+        return zone
 
 
 
@@ -232,15 +254,18 @@ class Zone(models.Model):
         """
         Get a price for this weight
         """
-        tiers_tmp = self.tiers.filter(min_weight__gte=weight).order_by('min_weight')
-        tiers = tiers_tmp.filter(expires__gte=date.today())[:1]
-        if tiers.count() is 0:
-            tiers = tiers_tmp.filter(expires__isnull=True)[:1]
-        if tiers.count() is not 0:
-            return tiers[0].cost
-        else:
+        tiers = carrier_rates.get(self.carrier_id).tiers.get(self.pk, None)
+        if tiers is None:
+            # added by another process since the rates were loaded here
+            carrier_rates.discard(self.carrier_id)
+            tiers = carrier_rates.get(self.carrier_id).tiers.get(self.pk, None)
+        cost = None
+        if tiers is not None:
+            cost = tiers.ceiling(weight)
+        if cost is None:
             log.debug("No tiered price found for %s: weight=%s", self, weight)
             raise TieredWeightException
+        return cost
 
 
 @python_2_unicode_compatible
@@ -292,4 +317,9 @@ class WeightTier(models.Model):
     cost = property(cost)
 
 
+for model in (Carrier, Zone, WeightTier):
+    post_save.connect(carrier_rates.clear, sender=model)
+    post_delete.connect(carrier_rates.clear, sender=model)
+m2m_changed.connect(carrier_rates.clear, sender=Zone.countries.through)
+
 from . import config
@@ -1,7 +1,7 @@
 from django.test import TestCase
 from django.utils import timezone
 from l10n.models import Country
-from shipping.modules.tieredweight.models import Carrier, TieredWeightException
+from shipping.modules.tieredweight.models import Carrier, TieredWeightException, carrier_rates
 
 try:
     from decimal import Decimal
@@ -47,6 +47,33 @@ class TieredWeightTest(TestCase):
         self.assertRaises(TieredWeightException, self.zone.cost, 100)
 
 
+    def testCached(self):
+        self.assertEqual(self.zone.cost(1), Decimal('11.00'))
+        with self.assertNumQueries(0):
+            self.assertEqual(self.zone.cost(1), Decimal('11.00'))
+            self.assertRaises(TieredWeightException, self.zone.cost, 9)
+
+        # a new tier is seen at once
+        self.zone.tiers.create(
+            min_weight=Decimal('10.00'),
+            handling=Decimal('10.00'),
+            price=Decimal('2.00'),
+        )
+        self.assertEqual(self.zone.cost(9), Decimal('12.00'))
+
+    def testZoneAddedElsewhere(self):
+        zone = self.carrier.zones.create(name='zone 2')
+        zone.tiers.create(
+            min_weight=Decimal('1'),
+            handling=Decimal('5.00'),
+            price=Decimal('1.00'),
+        )
+        # the rates as loaded by a process before the zone was added
+        carrier_rates.get(self.carrier.pk).tiers.pop(zone.pk)
+        self.assertEqual(zone.cost(1), Decimal('6.00'))
+        self.assertRaises(TieredWeightException, zone.cost, 4)
+
+
 class TieredWeightExpiringTest(TestCase):
     def setUp(self):
         self.carrier = Carrier.objects.create(name='pricing', active=True)
@@ -17,11 +17,11 @@ from django.template import loader
 from django.utils.translation import gettext as _
 from django.utils import timezone
 from livesettings.functions import config_get_group, config_value
-from keyedcache import cache_key, cache_get, cache_set, NotCachedError
 from shipping import signals
-from shipping.modules.base import BaseShipper
+from shipping.modules.base import BaseShipper, CarrierError, rate_cache, shipment_packages, shipment_signature
 import logging
-from six.moves import urllib
+from satchmo_utils.httppool import http_request
+from satchmo_utils.singleflight import cache_lookup
 try:
     from xml.etree.ElementTree import fromstring, tostring
 except ImportError:
@@ -54,6 +54,8 @@ TRANSIT_CODE_MAP = {
 
 class Shipper(BaseShipper):
 
+    remote = True
+
     def __init__(self, cart=None, contact=None, service_type=None):
         self._calculated = False
         self.cart = cart
@@ -117,13 +119,9 @@ class Shipper(BaseShipper):
 
     def _process_request(self, connection, request):
         """
-        Post the data and return the XML response
+        Post the data and return the raw XML response
         """
-        conn = urllib.request.Request(url=connection, data=request.encode("utf-8"))
-        f = urllib.request.urlopen(conn)
-        all_results = f.read()
-        self.raw = all_results
-        return(fromstring(all_results))
+        return http_request(connection, data=request, timeout=self.quote_timeout(), idempotent=True).read()
 
     def calculate(self, cart, contact):
         """
@@ -184,13 +182,6 @@ class Shipper(BaseShipper):
             shippingdata['box_weight'] = '%.1f' % box_weight
             shippingdata['box_weight_units'] = box_weight_units.upper()
 
-        total_weight = 0
-        for product in cart.get_shipment_list():
-            try:
-                total_weight += product.smart_attr('weight')
-            except TypeError:
-                pass
-
         signals.shipping_data_query.send(Shipper, shipper=self, cart=cart, shippingdata=shippingdata)
         c = Context(shippingdata)
         t = loader.get_template('shipping/ups/request.xml')
@@ -201,26 +192,23 @@ class Shipper(BaseShipper):
         else:
             connection = settings.CONNECTION_TEST.value
 
-        cachekey = cache_key(
-            'UPS_SHIP',
-            #service_type = self.service_type_code,
-            weight = str(total_weight),
-            country = shop_details.country.iso2_code,
-            zipcode = contact.shipping_address.postal_code)
-
-        try:
-            tree = cache_get(cachekey)
-        except NotCachedError:
-            tree = None
-
-        if tree is not None:
-            self.verbose_log('Got UPS info from cache [%s]', cachekey)
-        else:
-            self.verbose_log("Requesting from UPS [%s]\n%s", cachekey, request)
-            cache_set(cachekey, value=request, length=600)
-            tree = self._process_request(connection, request)
-            self.verbose_log("Got from UPS [%s]:\n%s", cachekey, self.raw)
-            cache_set(cachekey, value=tree)
+        # one response rates every service, so the service is not part of the key
+        signature = shipment_signature('ups', 'Shop',
+            (shop_details.country.iso2_code, shop_details.postal_code),
+            (contact.shipping_address.country.iso2_code, contact.shipping_address.postal_code),
+            shipment_packages(cart),
+            account=configuration['account'],
+            container=container,
+            pickup=configuration['pickup'],
+            single_box=shippingdata['single_box'],
+            box_weight=shippingdata.get('box_weight'),
+            box_weight_units=shippingdata.get('box_weight_units'),
+            live=settings.LIVE.value)
+
+        self.verbose_log("UPS rate request [%s]\n%s", signature, request)
+        self.raw = rate_cache.fetch(signature, lambda: self._process_request(connection, request))
+        self.verbose_log("UPS rate response [%s]:\n%s", signature, self.raw)
+        tree = fromstring(self.raw)
 
         try:
             status_code = tree.getiterator('ResponseStatusCode')
@@ -322,38 +310,32 @@ class Shipper(BaseShipper):
         else:
             connection = 'https://onlinetools.ups.com/ups.app/xml/TimeInTransit'
 
-        cachekey = cache_key("UPS-TIT", shipaddr.postal_code, pickup_date.strftime('%Y%m%d'), "%.2f" % price)
-
-        try:
-            ups = cache_get(cachekey)
-        except NotCachedError:
-            ups = None
-
-        if ups is None:
+        def request_transit():
             log.debug('Requesting from UPS: %s\n%s', connection, request)
-            conn = urllib.request.Request(url=connection, data=request.encode("utf-8"))
-            f = urllib.request.urlopen(conn)
-            all_results = f.read()
-
+            all_results = http_request(connection, data=request, timeout=self.quote_timeout(), idempotent=True).read()
             self.verbose_log("Received from UPS:\n%s", all_results)
-            ups = fromstring(all_results)
-            needs_cache = True
-        else:
-            needs_cache = False
-
-        ok = False
-        try:
-            ok = ups.find('Response/ResponseStatusCode').text == '1'
-        except AttributeError:
-            log.warning('Bad response from UPS TimeInTransit')
-            pass
-
-        if not ok:
+            # an error is raised rather than cached for every checkout
             try:
-                response = ups.find('Response/ResponseStatusDescription').text
-                log.warning('Bad response from UPS TimeInTransit: %s', response)
-            except AttributeError:
-                log.warning('Unknown UPS TimeInTransit response')
+                ups = fromstring(all_results)
+            except Exception as e:
+                raise CarrierError('Bad response from UPS TimeInTransit: %s' % e)
+            status = ups.find('Response/ResponseStatusCode')
+            if status is None or status.text != '1':
+                description = ups.find('Response/ResponseStatusDescription')
+                if description is None:
+                    raise CarrierError('Unknown UPS TimeInTransit response')
+                raise CarrierError('Bad response from UPS TimeInTransit: %s' % description.text)
+            return all_results
+
+        # the answer covers every service, so the UPS methods of a checkout share it
+        try:
+            ups = fromstring(cache_lookup(
+                ("UPS-TIT", shipaddr.postal_code, pickup_date.strftime('%Y%m%d'), "%.2f" % price),
+                request_transit, length=600))
+            ok = True
+        except CarrierError as e:
+            log.warning('%s', e)
+            ok = False
 
         if ok:
             services = ups.findall('TransitResponse/ServiceSummary')
@@ -373,9 +355,6 @@ class Shipper(BaseShipper):
 
                     break
 
-            if delivery_days is not None and needs_cache:
-                cache_set(cachekey, value=ups, length=600)
-
         return delivery_days
 
     def verbose_log(self, *args, **kwargs):
@@ -14,14 +14,13 @@ unique needs.
 
 # Note, make sure you use decimal math everywhere!
 from decimal import Decimal
-from django.core.cache import cache
 from django.template import loader
 from django.utils.translation import gettext as _
 from l10n.models import Country
 from livesettings.functions import config_get_group, config_value
-from shipping.modules.base import BaseShipper
+from shipping.modules.base import BaseShipper, rate_cache, shipment_packages, shipment_signature
 import logging
-from six.moves import urllib
+from satchmo_utils.httppool import http_request
 try:
     from xml.etree.ElementTree import fromstring, tostring
 except ImportError:
@@ -100,6 +99,8 @@ APIS = {'PRIORITY': 'PriorityMail',
 log = logging.getLogger('usps.shipper')
 class Shipper(BaseShipper):
 
+    remote = True
+
     def __init__(self, cart=None, contact=None, service_type=None):
         self._calculated = False
         self.cart = cart
@@ -167,7 +168,7 @@ class Shipper(BaseShipper):
 
     def _process_request(self, connection, request, api=None):
         """
-        Post the data and return the XML response
+        Post the data and return the raw XML response
         """
         # determine which API to use
         if api == None:
@@ -176,15 +177,18 @@ class Shipper(BaseShipper):
             else:
                 api = 'RateV4'
 
-        data = 'API=%s&XML=%s' % (api, request.encode('utf-8'))
-
-        conn = urllib.request.Request(url=connection, data=data)
-        f = urllib.request.urlopen(conn)
-        all_results = f.read()
+        data = 'API=%s&XML=%s' % (api, request)
 
-        log.error(all_results)
+        return http_request(connection, data=data, timeout=self.quote_timeout(), idempotent=True).read()
 
-        return (fromstring(all_results))
+    def _fetch(self, signature, connection, request, api=None):
+        """
+        Return the parsed XML response, from the rate cache when possible
+        """
+        self.verbose_log("USPS request [%s]\n%s", signature, request)
+        self.raw = rate_cache.fetch(signature, lambda: self._process_request(connection, request, api))
+        self.verbose_log("USPS response [%s]:\n%s", signature, self.raw)
+        return fromstring(self.raw)
 
     def render_template(self, template, cart=None, contact=None):
         from satchmo_store.shop.models import Config
@@ -268,20 +272,14 @@ class Shipper(BaseShipper):
             #connection = settings.CONNECTION_TEST.value
             connection = settings.CONNECTION.value
 
-        cache_key_response = "usps-cart-%s-response" % int(cart.id)
-        cache_key_request = "usps-cart-%s-request" % int(cart.id)
-        last_request = cache.get(cache_key_request)
-
-        tree = cache.get(cache_key_response)
-
-        if (last_request != request) or tree is None:
-            self.verbose_log("Requesting from USPS [%s]\n%s", cache_key_request, request)
-            cache.set(cache_key_request, request, 60)
-            tree = self._process_request(connection, request)
-            self.verbose_log("Got from USPS [%s]:\n%s", cache_key_response, self.raw)
-            needs_cache = True
-        else:
-            needs_cache = False
+        address = contact.shipping_address
+        origin = (shop_details.country.iso2_code, shop_details.postal_code)
+        destination = (address.country.iso2_code, address.postal_code)
+        packages = shipment_packages(cart)
+        signature = shipment_signature('usps', self.service_type_code, origin, destination, packages,
+            container=settings.SHIPPING_CONTAINER.value,
+            userid=settings.USER_ID.value)
+        tree = self._fetch(signature, connection, request)
 
         errors = tree.getiterator('Error')
 
@@ -305,9 +303,6 @@ class Shipper(BaseShipper):
                             self.is_valid = True
                             self._calculated = True
                             self.exact_date = True
-
-                            #if needs_cache:
-                            #    cache.set(cache_key_response, tree, 60)
             else:
                 for package in all_packages:
                     for postage in package.getiterator('Postage'):
@@ -318,7 +313,9 @@ class Shipper(BaseShipper):
                             # Now try to figure out how long it would take for this delivery
                             if self.api:
                                 delivery = self.render_template('shipping/usps/delivery.xml', cart, contact)
-                                del_tree = self._process_request(connection, delivery, self.api)
+                                del_signature = shipment_signature('usps', self.api, origin, destination, packages,
+                                    userid=settings.USER_ID.value)
+                                del_tree = self._fetch(del_signature, connection, delivery, self.api)
                                 parent = '%sResponse' % self.api
                                 del_iter = del_tree.getiterator(parent)
 
@@ -336,9 +333,6 @@ class Shipper(BaseShipper):
 
                             self.is_valid = True
                             self._calculated = True
-
-                            #if needs_cache:
-                            #    cache.set(cache_key_response, tree, 60)
         else:
             error = errors[0]
             err_num = error.find('.//Number').text
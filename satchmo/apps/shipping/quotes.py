@@ -0,0 +1,105 @@
+"""
+Quotes the shipping methods for a cart.
+
+Carrier modules such as UPS, USPS, FedEx and Canada Post rate a cart with a
+blocking HTTP request.  They are calculated on a small shared thread pool, so
+the pay/ship page waits for the slowest carrier instead of for all of them in
+turn.  A carrier which fails, or does not answer within its timeout, is left
+out of the quote.
+"""
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from django.db import connection
+from livesettings.functions import config_value
+from threaded_multihost import threadlocals
+import logging
+import threading
+import time
+
+log = logging.getLogger('shipping.quotes')
+
+_pool = None
+_pool_size = 0
+_pool_lock = threading.Lock()
+
+def _get_pool(size):
+    global _pool, _pool_size
+    with _pool_lock:
+        if _pool is None or _pool_size != size:
+            if _pool is not None:
+                _pool.shutdown(wait=False)
+            _pool = ThreadPoolExecutor(max_workers=size, thread_name_prefix='shipping-quote')
+            _pool_size = size
+        return _pool
+
+def _calculate(method, cart, contact):
+    """Calculate a remote method, leaving it out when its carrier fails."""
+    try:
+        method.calculate(cart, contact)
+        return True
+    except Exception:
+        log.exception('Could not calculate shipping for %s', method.id)
+        return False
+
+def _calculate_in_worker(method, cart, contact, request, user):
+    # the worker answers for the request which submitted it
+    threadlocals.set_thread_variable('request', request)
+    threadlocals.set_thread_variable('user', user)
+    try:
+        return _calculate(method, cart, contact)
+    finally:
+        threadlocals.set_thread_variable('request', None)
+        threadlocals.set_thread_variable('user', None)
+        connection.close()
+
+def quote_methods(methods, cart, contact, workers=None):
+    """Calculate each of the shipping methods for the cart and contact.
+
+    Remote methods are run on the quote thread pool, each limited to its
+    `quote_timeout()`, and left out when they fail.  The local ones are
+    calculated in this thread, and their exceptions are raised.
+    Returns the methods which were calculated, in their original order.
+    """
+    if workers is None:
+        workers = config_value('SHIPPING', 'QUOTE_WORKERS')
+
+    quoted = [False] * len(methods)
+    remote = [i for i, method in enumerate(methods) if method.remote]
+    if workers < 1 or not remote:
+        remote = []
+
+    deadlines = {}
+    if remote:
+        # build the cart's item snapshot once, before the workers share it
+        list(cart)
+        request = threadlocals.get_current_request()
+        user = threadlocals.get_current_user()
+        pool = _get_pool(workers)
+        started = time.time()
+        for i in remote:
+            method = methods[i]
+            future = pool.submit(_calculate_in_worker, method, cart, contact, request, user)
+            deadlines[future] = (started + method.quote_timeout(), i)
+
+    for i, method in enumerate(methods):
+        if i in remote:
+            continue
+        if method.remote:
+            quoted[i] = _calculate(method, cart, contact)
+        else:
+            # errors of table based methods are not the carrier's, so they propagate
+            method.calculate(cart, contact)
+            quoted[i] = True
+
+    pending = set(deadlines)
+    while pending:
+        timeout = max(0, min(deadlines[future][0] for future in pending) - time.time())
+        done, pending = wait(pending, timeout=timeout, return_when=FIRST_COMPLETED)
+        for future in done:
+            quoted[deadlines[future][1]] = future.result()
+
+        now = time.time()
+        for future in [f for f in pending if deadlines[f][0] <= now]:
+            log.warning('Timed out waiting for shipping quote from %s', methods[deadlines[future][1]].id)
+            pending.discard(future)
+
+    return [method for i, method in enumerate(methods) if quoted[i]]
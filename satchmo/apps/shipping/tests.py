@@ -1,12 +1,18 @@
 from decimal import Decimal
 from django.conf import settings
 from django.contrib.sites.models import Site
+from django.core.cache import cache
 from django.test import TestCase
+from livesettings.functions import config_get
 from product.models import Product
 from satchmo_store.shop.models import Cart
+from shipping.modules.base import BaseShipper, CarrierError, RateCache, shipment_signature
 from shipping.modules.flat.shipper import Shipper as flat
 from shipping.modules.per.shipper import Shipper as per
+from shipping.quotes import quote_methods
 import keyedcache
+import threading
+import time
 
 
 class ShippingBaseTest(TestCase):
@@ -33,6 +39,131 @@ class ShippingBaseTest(TestCase):
         self.assertEqual(per(self.cart1, None).cost(), Decimal("12.00"))
 
 
+class FakeCarrier(BaseShipper):
+    remote = True
+
+    def __init__(self, id, wait=None, fail=False, timeout=5):
+        super(FakeCarrier, self).__init__()
+        self.id = id
+        self.wait = wait
+        self.fail = fail
+        self.timeout = timeout
+
+    def calculate(self, cart, contact):
+        if self.wait is not None:
+            # stands for the carrier's answer
+            self.wait()
+        if self.fail:
+            raise IOError("carrier unavailable")
+        super(FakeCarrier, self).calculate(cart, contact)
+
+    def quote_timeout(self):
+        return self.timeout
+
+
+class QuoteMethodsTest(TestCase):
+
+    fixtures = ['initial_data.yaml', 'l10n-data.yaml', 'test_shop.yaml']
+
+    def setUp(self):
+        site = Site.objects.get_current()
+        product = Product.objects.create(slug='p1', name='p1')
+        product.site.add(site)
+        self.cart1 = Cart.objects.create(site=site)
+        self.cart1.add_item(product, 3)
+
+    def tearDown(self):
+        keyedcache.cache_delete()
+
+    def test_concurrent_quotes(self):
+        # each carrier answers only once all three are asking, which a
+        # carrier rated after the others never sees
+        asking = threading.Barrier(3, timeout=5)
+        methods = [FakeCarrier('a', wait=asking.wait), flat(),
+                   FakeCarrier('b', wait=asking.wait), FakeCarrier('c', wait=asking.wait)]
+        quoted = quote_methods(methods, self.cart1, None, workers=3)
+        self.assertFalse(asking.broken)
+        self.assertEqual([m.id for m in quoted], ['a', 'FlatRate', 'b', 'c'])
+        self.assertEqual(quoted[1].cost(), Decimal("4.00"))
+
+    def test_slow_and_failed_carriers_dropped(self):
+        # the slow carrier answers after the quote is done
+        answer = threading.Event()
+        self.addCleanup(answer.set)
+        methods = [FakeCarrier('slow', wait=lambda: answer.wait(10), timeout=0.1),
+                   FakeCarrier('broken', fail=True), FakeCarrier('ok')]
+        with self.assertLogs('shipping.quotes', 'WARNING') as logs:
+            quoted = quote_methods(methods, self.cart1, None, workers=3)
+        self.assertFalse(answer.is_set())
+        self.assertEqual([m.id for m in quoted], ['ok'])
+        self.assertIn('WARNING:shipping.quotes:Timed out waiting for shipping quote from slow', logs.output)
+
+    def test_sequential(self):
+        methods = [FakeCarrier('broken', fail=True), per()]
+        quoted = quote_methods(methods, self.cart1, None, workers=0)
+        self.assertEqual([m.id for m in quoted], ['PerItem'])
+
+    def test_local_errors_raised(self):
+        table = FakeCarrier('table', fail=True)
+        table.remote = False
+        self.assertRaises(IOError, quote_methods, [FakeCarrier('ok'), table], self.cart1, None, workers=3)
+
+
+class RateCacheTest(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.rates = RateCache()
+        self.calls = []
+        self.signature = shipment_signature('test', '03', ('US', '81122'), ('US', '81123'),
+            [('2.5', 'LB', '', '', '', '')])
+
+    def tearDown(self):
+        cache.clear()
+
+    def request(self, response='<Rates/>'):
+        self.calls.append(response)
+        return response
+
+    def fail(self):
+        self.calls.append('failed')
+        raise IOError("connection refused")
+
+    def test_signature(self):
+        other = shipment_signature('test', '03', ('us', '81122 '), ('US', '81123'),
+            [(Decimal('2.50'), 'lb', None, None, None, None)])
+        self.assertEqual(self.signature, other)
+        other = shipment_signature('test', '03', ('US', '81122'), ('US', '81124'),
+            [('2.5', 'LB', '', '', '', '')])
+        self.assertNotEqual(self.signature, other)
+
+    def test_hit_and_miss(self):
+        self.assertEqual(self.rates.fetch(self.signature, self.request), '<Rates/>')
+        self.assertEqual(self.rates.fetch(self.signature, self.request), '<Rates/>')
+        self.assertEqual(len(self.calls), 1)
+        stats = self.rates.stats()
+        self.assertEqual((stats['miss'], stats['hit']), (1, 1))
+
+    def test_errors_cached(self):
+        self.assertRaises(CarrierError, self.rates.fetch, self.signature, self.fail)
+        self.assertRaises(CarrierError, self.rates.fetch, self.signature, self.request)
+        self.assertEqual(self.calls, ['failed'])
+        self.assertEqual(self.rates.stats()['error'], 1)
+
+    def test_stale_while_revalidate(self):
+        ttl = config_get('SHIPPING', 'RATE_CACHE_TTL')
+        self.addCleanup(ttl.update, ttl.value)
+        ttl.update(0)
+        self.rates.fetch(self.signature, self.request)
+        self.assertEqual(self.rates.fetch(self.signature, lambda: self.request('<New/>')), '<Rates/>')
+        self.assertEqual(self.rates.stats()['stale'], 1)
+        for i in range(50):
+            if cache.get(self.signature)[1] == '<New/>':
+                break
+            time.sleep(0.02)
+        self.assertEqual(self.calls, ['<Rates/>', '<New/>'])
+
+
 class ConverterFactoryTest(TestCase):
 
     def setUp(self):
@@ -8,6 +8,7 @@ from livesettings.functions import config_value
 from product.models import TaxClass
 from satchmo_store.contact.models import Contact
 from satchmo_utils import is_string_like
+from tax.utils import get_tax_context, taxclass_key
 from .models import TaxRate
 import logging
 
@@ -24,7 +25,16 @@ class Processor(object):
         """
         self.order = order
         self.user = user
-        
+        self.context = get_tax_context()
+
+    def _location_key(self):
+        if self.order:
+            return ('order', self.order.ship_country, self.order.ship_state,
+                self.order.bill_country, self.order.bill_state)
+        elif self.user and self.user.is_authenticated:
+            return ('user', self.user.pk)
+        return None
+
     def _get_location(self):
         area=country=None
         calc_by_ship_address = bool(config_value('TAX','TAX_AREA_ADDRESS') == 'ship')
@@ -89,10 +99,24 @@ class Processor(object):
     def get_rate(self, taxclass=None, area=None, country=None, get_object=False, **kwargs):
         if not taxclass:
             taxclass = "Default"
-        rate = None
         if not (area or country):
-            area, country = self._get_location()
-            
+            area, country = self.context.get(('area', 'location', self._location_key()),
+                self._get_location)
+
+        key = ('area', 'rate', area and area.pk, country and country.pk, taxclass_key(taxclass))
+        rate = self.context.get(key, lambda: self._lookup_rate(taxclass, area, country))
+
+        log.debug("Got rate [%s] = %s", taxclass, rate)
+        if get_object:
+            return rate
+        else:
+            if rate:
+                return rate.percentage
+            else:
+                return Decimal("0.00")
+
+    def _lookup_rate(self, taxclass, area, country):
+        rate = None
         if is_string_like(taxclass):
             try:
                 taxclass = TaxClass.objects.get(title__iexact=taxclass)
@@ -113,15 +137,8 @@ class Processor(object):
                 
             except TaxRate.DoesNotExist:
                 rate = None
-        
-        log.debug("Got rate [%s] = %s", taxclass, rate)
-        if get_object:
-            return rate
-        else:
-            if rate:
-                return rate.percentage
-            else:
-                return Decimal("0.00")
+
+        return rate
 
     def by_price(self, taxclass, price):
         rate = self.get_rate(taxclass)
@@ -147,6 +164,11 @@ class Processor(object):
         else:
             return Decimal("0.00")
 
+    def by_orderitems(self, orderitems):
+        """The tax of each order item, resolving the location and each tax
+        class's rate once."""
+        return [self.by_orderitem(orderitem) for orderitem in orderitems]
+
     def shipping(self, subtotal=None):
         if subtotal is None and self.order:
             subtotal = self.order.shipping_sub_total
@@ -19,6 +19,9 @@ class Processor(object):
             return self.by_price(orderitem.product.taxClass, price)
         else:
             return Decimal("0.00")
+
+    def by_orderitems(self, orderitems):
+        return [self.by_orderitem(orderitem) for orderitem in orderitems]
         
     def by_price(self, taxclass, price):
         percent = config_value('TAX','PERCENT')
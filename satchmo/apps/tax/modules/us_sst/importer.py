@@ -0,0 +1,304 @@
+"""
+Loads the SST rate and boundry CSV files.
+
+The files are read in batches.  Each batch is compared with the rows already
+loaded, by their natural key, in one query, and the new rows and changed end
+dates are written with bulk_create and bulk_update in one transaction.  Any
+unchanged entries are left alone, and any changed ones get their end dates
+set properly and the new rows inserted, so re-running on a newer file
+updates the tables.
+
+After each batch the number of lines done is written to a checkpoint file
+next to the CSV file, so that an interrupted import can be resumed.
+"""
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date
+from decimal import Decimal
+from django.db import connection, models, transaction
+from six.moves import range
+import logging
+import os
+import time
+
+from tax.modules.us_sst.models import TaxRate, TaxBoundry, state_rates, zip_boundries
+
+log = logging.getLogger('tax.us_sst.importer')
+
+
+def parse_date(value):
+    return date(int(value[0:4]), int(value[4:6]), int(value[6:8]))
+
+def ash_split(arg, qty):
+    """Unfortunately, states don't alwys publish the full SST fields in the
+    boundry files like they are required to. It's a shame really. So this function
+    will force a string to split to 'qty' fields, adding None values as needed to
+    get there.
+    """
+    l = arg.split(',')
+    if len(l) < qty:
+        l.extend([None for x in range(qty-len(l))])
+    return l
+
+
+class ImportStats(object):
+    def __init__(self, path, skipped=0):
+        self.path = path
+        self.skipped = skipped
+        self.lines = skipped
+        self.new = 0
+        self.updated = 0
+        self.unchanged = 0
+        self.started = time.time()
+
+    def rate(self):
+        elapsed = time.time() - self.started
+        return elapsed and (self.lines - self.skipped) / elapsed or 0
+
+    def __str__(self):
+        return "%s: %d lines, new: %d, end date changed: %d, unchanged: %d, %.0f lines/s" % (
+            os.path.basename(self.path), self.lines, self.new, self.updated,
+            self.unchanged, self.rate())
+
+
+class Importer(object):
+    """
+    Imports one CSV file.  Subclasses give the model, the fields making up
+    its natural key, and parse the lines.
+    """
+    model = None
+    key_fields = ()
+
+    def __init__(self, path, batch_size=5000, resume=False, report=None):
+        self.path = path
+        self.batch_size = batch_size
+        self.resume = resume
+        self.report = report
+        self.checkpoint = path + '.checkpoint'
+
+    def parse(self, line):
+        """A dictionary of the model fields for the line, or None to skip it."""
+        raise NotImplementedError
+
+    def existing(self, rows):
+        """The rows already loaded which the batch could match."""
+        raise NotImplementedError
+
+    def key(self, values):
+        return tuple(values[field] for field in self.key_fields)
+
+    def _read_checkpoint(self):
+        if self.resume and os.path.isfile(self.checkpoint):
+            with open(self.checkpoint) as f:
+                return int(f.read().strip() or 0)
+        return 0
+
+    def _write_checkpoint(self, lines):
+        with open(self.checkpoint, 'w') as f:
+            f.write('%d\n' % lines)
+
+    def run(self):
+        skip = self._read_checkpoint()
+        if skip:
+            log.info('Resuming %s after line %d', self.path, skip)
+        stats = ImportStats(self.path, skip)
+
+        batch = []
+        read = 0
+        with open(self.path) as f:
+            for line in f:
+                read += 1
+                if read <= skip:
+                    continue
+                line = line.strip()
+                if line:
+                    batch.append(line)
+                if len(batch) >= self.batch_size:
+                    self._apply(batch, stats)
+                    stats.lines = read
+                    self._write_checkpoint(read)
+                    batch = []
+                    if self.report:
+                        self.report(stats)
+            if batch:
+                self._apply(batch, stats)
+            stats.lines = max(read, skip)
+
+        if os.path.isfile(self.checkpoint):
+            os.remove(self.checkpoint)
+        return stats
+
+    def _apply(self, lines, stats):
+        rows = {}
+        for line in lines:
+            values = self.parse(line)
+            if values is not None:
+                # a later line for the same key wins, as it did row by row
+                rows[self.key(values)] = values
+        if not rows:
+            return
+
+        with transaction.atomic():
+            loaded = dict((self.key(obj.__dict__), obj) for obj in self.existing(list(rows.values())))
+            new = []
+            changed = []
+            for key, values in rows.items():
+                obj = loaded.get(key, None)
+                if obj is None:
+                    new.append(self.model(**values))
+                elif obj.endDate != values['endDate']:
+                    # Over time, end dates can change. A new row with a new start
+                    # date will also appear.
+                    obj.endDate = values['endDate']
+                    changed.append(obj)
+                else:
+                    stats.unchanged += 1
+            if new:
+                self.model.objects.bulk_create(new)
+            if changed:
+                self.model.objects.bulk_update(changed, ['endDate'])
+        stats.new += len(new)
+        stats.updated += len(changed)
+
+
+class RateImporter(Importer):
+    model = TaxRate
+    key_fields = ('state', 'jurisdictionType', 'jurisdictionFipsCode', 'startDate')
+
+    def parse(self, line):
+        (state, type, code, rate_intra, rate_inter, food_intra, food_inter,
+         start, end) = line.split(',')
+        return {
+            'state': int(state),
+            'jurisdictionType': int(type),
+            'jurisdictionFipsCode': code,
+            'startDate': parse_date(start),
+            'endDate': parse_date(end),
+            'generalRateIntrastate': Decimal(rate_intra),
+            'generalRateInterstate': Decimal(rate_inter),
+            'foodRateIntrastate': Decimal(food_intra),
+            'foodRateInterstate': Decimal(food_inter),
+        }
+
+    def existing(self, rows):
+        return TaxRate.objects.filter(
+            state__in=set(row['state'] for row in rows),
+            jurisdictionFipsCode__in=set(row['jurisdictionFipsCode'] for row in rows))
+
+
+CSV_MAP = (
+    'recordType', 'startDate', 'endDate',
+    'lowAddress', 'highAddress', 'oddEven',
+    'streetPreDirection', 'streetName', 'streetSuffix', 'streetPostDirection',
+    'addressSecondaryAbbr', 'addressSecondaryLow', 'addressSecondaryHigh', 'addressSecondaryOddEven',
+    'cityName', 'zipCode', 'plus4',
+    'zipCodeLow', 'zipExtensionLow', 'zipCodeHigh', 'zipExtensionHigh',
+    'serCode',
+    'fipsStateCode', 'fipsStateIndicator', 'fipsCountyCode', 'fipsPlaceCode', 'fipsPlaceType',
+    'long', 'lat',
+    'special_1_source', 'special_1_code', 'special_1_type',
+    'special_2_source', 'special_2_code', 'special_2_type',
+    'special_3_source', 'special_3_code', 'special_3_type',
+    'special_4_source', 'special_4_code', 'special_4_type',
+    'special_5_source', 'special_5_code', 'special_5_type',
+    'special_6_source', 'special_6_code', 'special_6_type',
+    'special_7_source', 'special_7_code', 'special_7_type',
+    'special_8_source', 'special_8_code', 'special_8_type',
+    'special_9_source', 'special_9_code', 'special_9_type',
+    'special_10_source', 'special_10_code', 'special_10_type',
+    'special_11_source', 'special_11_code', 'special_11_type',
+    'special_12_source', 'special_12_code', 'special_12_type',
+    'special_13_source', 'special_13_code', 'special_13_type',
+    'special_14_source', 'special_14_code', 'special_14_type',
+    'special_15_source', 'special_15_code', 'special_15_type',
+    'special_16_source', 'special_16_code', 'special_16_type',
+    'special_17_source', 'special_17_code', 'special_17_type',
+    'special_18_source', 'special_18_code', 'special_18_type',
+    'special_19_source', 'special_19_code', 'special_19_type',
+    'special_20_source', 'special_20_code', 'special_20_type',
+)
+# Some fields we're not using.
+DELETE_FIELDS = (
+    'long', 'lat',
+    'special_1_source',
+    'special_2_source',
+    'special_3_source',
+    'special_4_source',
+    'special_5_source',
+    'special_6_source',
+    'special_7_source',
+    'special_8_source',
+    'special_9_source',
+    'special_10_source',
+    'special_11_source',
+    'special_12_source',
+    'special_13_source',
+    'special_14_source',
+    'special_15_source',
+    'special_16_source',
+    'special_17_source',
+    'special_18_source',
+    'special_19_source',
+    'special_20_source',
+)
+BOUNDRY_FIELDS = tuple(field for field in CSV_MAP if field not in DELETE_FIELDS)
+INTEGER_FIELDS = tuple(field.name for field in TaxBoundry._meta.fields
+    if isinstance(field, models.IntegerField) and field.name in BOUNDRY_FIELDS)
+
+
+class BoundryImporter(Importer):
+    model = TaxBoundry
+    # every field but the end date, as a boundry has no other natural key
+    key_fields = tuple(field for field in BOUNDRY_FIELDS if field != 'endDate')
+
+    def parse(self, line):
+        #Z,20080701,99991231,,,,,,,,,,,,,,,00073,,00073,,EXTRA
+        d = dict(zip(CSV_MAP, ash_split(line, len(CSV_MAP))))
+        for v in DELETE_FIELDS:
+            del(d[v])
+
+        # Empty strings are nulls.
+        for k in d:
+            if d[k] == '':
+                d[k] = None
+
+        d['recordType'] = d['recordType'].upper()
+        if d['recordType'] == 'A':
+            # For now, skip these, as they barely work.
+            # Zip+4 is the best way always. These are a bad idea in general.
+            return None
+
+        d['startDate'] = parse_date(d['startDate'])
+        d['endDate'] = parse_date(d['endDate'])
+        # Compared with the loaded rows, so the types must match.
+        for k in INTEGER_FIELDS:
+            if d[k] is not None:
+                d[k] = int(d[k])
+        return d
+
+    def existing(self, rows):
+        return TaxBoundry.objects.filter(
+            recordType__in=set(row['recordType'] for row in rows),
+            zipCodeLow__in=set(row['zipCodeLow'] for row in rows))
+
+
+def import_files(importer_class, paths, workers=1, **kwargs):
+    """
+    Import the files, each state's file on its own worker when workers is
+    more than 1.  Returns the ImportStats of each file.
+    """
+    def run(path):
+        try:
+            return importer_class(path, **kwargs).run()
+        finally:
+            connection.close()
+
+    try:
+        if workers > 1 and len(paths) > 1:
+            with ThreadPoolExecutor(max_workers=workers) as pool:
+                return list(pool.map(run, paths))
+        return [importer_class(path, **kwargs).run() for path in paths]
+    finally:
+        # Drop the tables kept in memory by running shops, bulk writes
+        # do not send the model signals which would.
+        state_rates.clear()
+        zip_boundries.clear()
@@ -1,64 +1,42 @@
 from django.core.management.base import BaseCommand, CommandError
 import os
-from datetime import date
-from tax.modules.us_sst.models import TaxRate
-from decimal import Decimal
+from tax.modules.us_sst.importer import RateImporter, import_files
 
 class Command(BaseCommand):
-    '''Manage command to import one of the CSV files from the SST website.
+    '''Manage command to import CSV rate files from the SST website.
 
     To update: Simple re-run on the newer CSV file.
     Any unchanged entries will be left alone, and any changed ones will get
     their end dates set properly and the new rows inserted. You will need to do
-    this quartly or as-needed by your tax jurisdictions.'''
+    this quartly or as-needed by your tax jurisdictions.
 
-    help = "Imports a CSV rate file from the SST website."
-    args = 'file'
+    Several states' files can be given, and loaded in parallel with --workers.
+    An interrupted import is continued with --resume.'''
 
-    def handle(self, *args, **options):
-        new = 0
-        updated = 0
-        unchanged = 0
-        if not args:
-            raise CommandError("No file specified")
-        file = args[0]
-        if not os.path.isfile(file):
-            raise RuntimeError("File: %s is not a normal file or doesn't exist." % file)
-        file = open(file)
-        for line in file:
-            (state, type, code, rate_intra, rate_inter, food_intra, food_inter,
-             start, end) = line.split(',')
-            state = int(state)
-            start = date(int(start[0:4]), int(start[4:6]), int(start[6:9]))
-            end = date(int(end[0:4]), int(end[4:6]), int(end[6:9]))
-            try:
-                tr = TaxRate.objects.get(
-                    state=state,
-                    jurisdictionType=type,
-                    jurisdictionFipsCode=code,
-                    startDate=start,
-                )
-                # Over time, end dates can change. A new row with a new start
-                # date will also appear. This way, loading a new file correctly
-                # updates the map. (I hope.)
-                if tr.endDate != end:
-                    tr.endDate = end
-                    tr.save()
-                    updated += 1
-                else:
-                    unchanged += 1
+    help = "Imports CSV rate files from the SST website."
 
-            except TaxRate.DoesNotExist:
-                TaxRate(
-                    state=state,
-                    jurisdictionType=type,
-                    jurisdictionFipsCode=code,
-                    startDate=start,
-                    endDate=end,
-                    generalRateIntrastate = Decimal(rate_intra),
-                    generalRateInterstate = Decimal(rate_inter),
-                    foodRateIntrastate = Decimal(food_intra),
-                    foodRateInterstate = Decimal(food_inter),
-                ).save()
-                new += 1
-        print("Done: New: %d. End date changed: %d. Unchanged: %d" % (new, updated, unchanged))
+    def add_arguments(self, parser):
+        parser.add_argument('files', nargs='+',
+            help="Rate files, one for each state.")
+        parser.add_argument('--batch-size', type=int, dest='batch_size', default=5000,
+            help="Number of lines loaded per transaction.")
+        parser.add_argument('--workers', type=int, dest='workers', default=1,
+            help="Number of files loaded at the same time.")
+        parser.add_argument('--resume', action='store_true', dest='resume', default=False,
+            help="Continue each file after the last batch loaded by an interrupted import.")
+
+    def handle(self, **options):
+        files = options['files']
+        for file in files:
+            if not os.path.isfile(file):
+                raise CommandError("File: %s is not a normal file or doesn't exist." % file)
+        verbosity = int(options.get('verbosity', 1))
+
+        def report(stats):
+            if verbosity > 1:
+                print(stats)
+
+        for stats in import_files(RateImporter, files, workers=options['workers'],
+                batch_size=options['batch_size'], resume=options['resume'], report=report):
+            if verbosity > 0:
+                print("Done: %s" % stats)
@@ -5,11 +5,14 @@ from django.utils.encoding import python_2_unicode_compatible
 
 from product.models import TaxClass
 from l10n.models import AdminArea, Country
+from satchmo_utils.tablecache import TableCache
 #from satchmo_store.shop.models import Order
 #from satchmo_store.shop.signals import order_success
 #from tax import Processor
 
+from bisect import bisect_right
 from datetime import date as _date
+import copy
 
 try:
     from decimal import Decimal
@@ -304,15 +307,9 @@ class TaxBoundry(models.Model):
             return '%05d -> %05d' % (self.zipCodeLow, self.zipCodeHigh)
     zip_range = property(get_zip_range)
 
-    def rates(self, date=None):
-        l = list()
-        state = self.fipsStateCode
-        
-        if not date:
-            date = _date.today()
-            
-        # Lookup all the applicable codes.
-        for fips in (
+    def fips_codes(self):
+        """The FIPS codes of every jurisdiction taxing this boundry."""
+        return [fips for fips in (
             self.fipsStateIndicator, self.fipsCountyCode, self.fipsPlaceCode,
             self.special_1_code, self.special_2_code, self.special_3_code,
             self.special_4_code, self.special_5_code, self.special_6_code,
@@ -321,19 +318,15 @@ class TaxBoundry(models.Model):
             self.special_13_code, self.special_14_code, self.special_15_code,
             self.special_16_code, self.special_17_code, self.special_18_code,
             self.special_19_code, self.special_20_code
-        ):
-            if not fips:
-                continue
-            
-            rate = TaxRate.objects.get(
-                state=state,
-                jurisdictionFipsCode=fips,
-                startDate__lte=date,
-                endDate__gte=date,
-            )
-            l.append( rate  )
-        
-        return l
+        ) if fips]
+
+    def rates(self, date=None):
+        if not date:
+            date = _date.today()
+
+        # Lookup all the applicable codes, in the state's rate table.
+        table = state_rates.get(int(self.fipsStateCode))
+        return [table.rate(fips, date) for fips in self.fips_codes()]
 
     def get_percentage(self, date=None):
         """
@@ -361,43 +354,107 @@ class TaxBoundry(models.Model):
     @classmethod
     def lookup(cls, zip, ext=None, date=None):
         """Handy function to take a zip code and return the appropriate rates
-        for it."""
+        for it.
+
+        The boundries are looked up in the ZIP code's table in memory, and a
+        copy is returned, so that the caller may set `useIntrastate` and
+        `useFood` on it."""
         if not date:
             date = _date.today()
-        
-        # Try for a ZIP+4 lookup first if we can.
-        if ext:
-            try:
-                return cls.objects.get(
-                    recordType='4',
-                    zipCodeLow__lte=zip,
-                    zipCodeHigh__gte=zip,
-                    zipExtensionLow__lte=ext,
-                    zipExtensionHigh__gte=ext,
-                    startDate__lte=date,
-                    endDate__gte=date,
-                )
-            except cls.DoesNotExist:
-                # Not all zip+4 have entires. That's OK.
-                pass
-        
-        # Try for just the ZIP then.
-        try:
-            return cls.objects.get(
-                recordType='Z',
-                zipCodeLow__lte=zip,
-                zipCodeHigh__gte=zip,
-                startDate__lte=date,
-                endDate__gte=date,
-            )
-        except cls.DoesNotExist:
-            return None
+
+        boundry = zip_boundries.get(zip).find(ext, date)
+        if boundry is not None:
+            boundry = copy.copy(boundry)
+        return boundry
 
     class Meta:
         verbose_name = _("Tax Boundry")
         verbose_name_plural = _("Tax Boundries")
 
 
+class StateRates(object):
+    """The tax rates of one state, by FIPS code."""
+
+    def __init__(self, state):
+        self.state = state
+        self.rates = {}
+        for rate in TaxRate.objects.filter(state=state).order_by('startDate'):
+            self.rates.setdefault(rate.jurisdictionFipsCode, []).append(rate)
+
+    def rate(self, fips, date):
+        """The rate of the jurisdiction in effect on the date."""
+        found = [rate for rate in self.rates.get(fips, ())
+            if rate.startDate <= date <= rate.endDate]
+        if not found:
+            raise TaxRate.DoesNotExist('No tax rate for state %s, jurisdiction %s on %s' % (
+                self.state, fips, date))
+        if len(found) > 1:
+            raise TaxRate.MultipleObjectsReturned('%d tax rates for state %s, jurisdiction %s on %s' % (
+                len(found), self.state, fips, date))
+        return found[0]
+
+
+class ZipBoundries(object):
+    """
+    The Zip+4 and Zip-5 boundries covering one ZIP code.  The Zip+4
+    boundries are sorted by their low extension, for bisect lookups, and
+    `plus4_reach` holds the highest extension covered by any of the
+    boundries up to each one.
+    """
+
+    def __init__(self, zip):
+        plus4 = []
+        self.zip5 = []
+        for boundry in TaxBoundry.objects.filter(recordType__in=('4', 'Z'),
+                zipCodeLow__lte=zip, zipCodeHigh__gte=zip):
+            if boundry.recordType == '4':
+                plus4.append(boundry)
+            else:
+                self.zip5.append(boundry)
+        plus4.sort(key=lambda boundry: boundry.zipExtensionLow)
+        self.plus4 = plus4
+        self.plus4_lows = [boundry.zipExtensionLow for boundry in plus4]
+        self.plus4_reach = []
+        for boundry in plus4:
+            reach = boundry.zipExtensionHigh
+            if self.plus4_reach and self.plus4_reach[-1] > reach:
+                reach = self.plus4_reach[-1]
+            self.plus4_reach.append(reach)
+
+    def find(self, ext, date):
+        """The boundry for the extension in effect on the date, or None."""
+        # Try for a ZIP+4 lookup first if we can.
+        if ext:
+            # Not all zip+4 have entires. That's OK.
+            for i in range(bisect_right(self.plus4_lows, ext) - 1, -1, -1):
+                if self.plus4_reach[i] < ext:
+                    # none of the boundries from here down reaches ext
+                    break
+                boundry = self.plus4[i]
+                if (ext <= boundry.zipExtensionHigh
+                        and boundry.startDate <= date <= boundry.endDate):
+                    return boundry
+
+        # Try for just the ZIP then.
+        for boundry in self.zip5:
+            if boundry.startDate <= date <= boundry.endDate:
+                return boundry
+        return None
+
+
+# the ZIP codes of a shop's customers are many, so only the most recently
+# used ones are kept
+ZIP_TABLES = 5000
+
+state_rates = TableCache('us_sst-rates', StateRates)
+zip_boundries = TableCache('us_sst-boundries', ZipBoundries, max_tables=ZIP_TABLES)
+
+models.signals.post_save.connect(state_rates.clear, sender=TaxRate)
+models.signals.post_delete.connect(state_rates.clear, sender=TaxRate)
+models.signals.post_save.connect(zip_boundries.clear, sender=TaxBoundry)
+models.signals.post_delete.connect(zip_boundries.clear, sender=TaxBoundry)
+
+
 #class TaxCollected(models.Model):
 #    order = models.ForeignKey(Order, verbose_name=_("Order"))
 #    taxRate = models.ForeignKey(TaxRate, verbose_name=_('Tax Rate'))
@@ -9,6 +9,7 @@ from livesettings.functions import config_value
 from satchmo_store.contact.models import Contact
 from l10n.models import AdminArea, Country
 from satchmo_utils import is_string_like
+from tax.utils import get_tax_context, taxclass_key
 from product.models import TaxClass
 from models import TaxBoundry, TaxRate, Taxable
 import logging
@@ -28,6 +29,15 @@ class Processor(object):
         """
         self.order = order
         self.user = user
+        self.context = get_tax_context()
+
+    def _location_key(self):
+        if self.order:
+            return ('order', self.order.ship_country, self.order.ship_state,
+                self.order.ship_postal_code)
+        elif self.user and self.user.is_authenticated:
+            return ('user', self.user.pk)
+        return None
 
     def _get_location(self):
         area=country=postal_code=None
@@ -140,10 +150,25 @@ class Processor(object):
     def get_rate(self, taxclass=None, area=None, country=None, get_object=False, **kwargs):
         if not taxclass:
             taxclass = "Default"
-        rate = None
 
         #if not (area or country):
-        location = self._get_location()
+        location_key = self._location_key()
+        location = self.context.get(('us_sst', 'location', location_key), self._get_location)
+
+        key = ('us_sst', 'rate', location_key, taxclass_key(taxclass), datetime.date.today())
+        rate = self.context.get(key, lambda: self._lookup_rate(taxclass, location))
+
+        log.debug("Got rate [%s] = %s", taxclass, rate)
+        if get_object:
+            return rate
+        else:
+            if rate:
+                return rate.percentage
+            else:
+                return Decimal("0.00")
+
+    def _lookup_rate(self, taxclass, location):
+        rate = None
         state = location['area']
         country = location['country']
 
@@ -170,14 +195,7 @@ class Processor(object):
             except Taxable.DoesNotExist:
                 rate = None
 
-        log.debug("Got rate [%s] = %s", taxclass, rate)
-        if get_object:
-            return rate
-        else:
-            if rate:
-                return rate.percentage
-            else:
-                return Decimal("0.00")
+        return rate
 
     def by_price(self, taxclass, price):
         rate = self.get_rate(taxclass)
@@ -203,6 +221,11 @@ class Processor(object):
         else:
             return Decimal("0.00")
 
+    def by_orderitems(self, orderitems):
+        """The tax of each order item, resolving the location and each tax
+        class's boundry once."""
+        return [self.by_orderitem(orderitem) for orderitem in orderitems]
+
     #def shipping(self, subtotal=None):
     #    if subtotal is None and self.order:
     #        subtotal = self.order.shipping_sub_total
@@ -0,0 +1,222 @@
+from datetime import date
+from decimal import Decimal
+from django.core.management import call_command
+from django.test import TestCase
+from tax.modules.us_sst.importer import CSV_MAP, BoundryImporter, RateImporter
+from tax.modules.us_sst.models import StateRates, TaxBoundry, TaxRate, ZipBoundries
+import os
+import shutil
+import tempfile
+
+
+RATES = [
+    '20,45,20,0.0530000,0.0530000,0.0000000,0.0000000,20080101,99991231',
+    '20,0,045,0.0100000,0.0100000,0.0100000,0.0100000,20080101,99991231',
+    '20,1,38900,0.0100000,0.0100000,0.0100000,0.0100000,20080101,99991231',
+]
+
+def boundry_line(**values):
+    return ','.join(values.get(field, '') for field in CSV_MAP)
+
+BOUNDRIES = [
+    boundry_line(recordType='Z', startDate='20080101', endDate='99991231',
+        zipCodeLow='66044', zipCodeHigh='66044', fipsStateCode='20',
+        fipsStateIndicator='20', fipsCountyCode='045'),
+    boundry_line(recordType='4', startDate='20080101', endDate='99991231',
+        zipCodeLow='66044', zipExtensionLow='0001', zipCodeHigh='66044',
+        zipExtensionHigh='0099', fipsStateCode='20', fipsStateIndicator='20',
+        fipsCountyCode='045', fipsPlaceCode='38900'),
+    # address records are skipped
+    boundry_line(recordType='A', startDate='20080101', endDate='99991231',
+        lowAddress='1', highAddress='99', zipCode='66044'),
+]
+
+
+class Interrupted(Exception):
+    pass
+
+
+class ImporterTest(TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.dir)
+
+    def write(self, name, lines):
+        path = os.path.join(self.dir, name)
+        with open(path, 'w') as f:
+            f.write('\n'.join(lines) + '\n')
+        return path
+
+    def testRatesReimported(self):
+        path = self.write('rates.csv', RATES[:2])
+        stats = RateImporter(path).run()
+        self.assertEqual((stats.lines, stats.new, stats.updated, stats.unchanged), (2, 2, 0, 0))
+
+        # the county's rate ends, and a city is added
+        changed = RATES[1].replace('99991231', '20111231')
+        path = self.write('rates.csv', [RATES[0], changed, RATES[2]])
+        stats = RateImporter(path, batch_size=2).run()
+        self.assertEqual((stats.lines, stats.new, stats.updated, stats.unchanged), (3, 1, 1, 1))
+
+        self.assertEqual(TaxRate.objects.count(), 3)
+        self.assertEqual(TaxRate.objects.get(jurisdictionFipsCode='045').endDate, date(2011, 12, 31))
+        self.assertEqual(TaxRate.objects.get(jurisdictionFipsCode='20').endDate, date(9999, 12, 31))
+        self.assertFalse(os.path.exists(path + '.checkpoint'))
+
+    def testBoundriesReimported(self):
+        path = self.write('boundries.csv', BOUNDRIES)
+        stats = BoundryImporter(path).run()
+        self.assertEqual((stats.lines, stats.new, stats.updated, stats.unchanged), (3, 2, 0, 0))
+
+        changed = BOUNDRIES[1].replace('99991231', '20111231')
+        path = self.write('boundries.csv', [BOUNDRIES[0], changed, BOUNDRIES[2]])
+        stats = BoundryImporter(path).run()
+        self.assertEqual((stats.lines, stats.new, stats.updated, stats.unchanged), (3, 0, 1, 1))
+
+        self.assertEqual(TaxBoundry.objects.count(), 2)
+        boundry = TaxBoundry.objects.get(recordType='4')
+        self.assertEqual(boundry.endDate, date(2011, 12, 31))
+        self.assertEqual((boundry.zipExtensionLow, boundry.zipExtensionHigh), (1, 99))
+        self.assertEqual(boundry.fipsPlaceCode, '38900')
+        self.assertEqual(boundry.cityName, None)
+
+    def testResume(self):
+        path = self.write('rates.csv', RATES)
+
+        def interrupt(stats):
+            raise Interrupted()
+
+        # the first batch is loaded and checkpointed before the interruption
+        self.assertRaises(Interrupted, RateImporter(path, batch_size=1, report=interrupt).run)
+        with open(path + '.checkpoint') as f:
+            self.assertEqual(f.read(), '1\n')
+        self.assertEqual(TaxRate.objects.count(), 1)
+
+        # the rates already loaded are not read again
+        TaxRate.objects.all().delete()
+        call_command('sst_import_rate', path, resume=True, verbosity=0)
+        self.assertEqual(
+            sorted(TaxRate.objects.values_list('jurisdictionFipsCode', flat=True)),
+            ['045', '38900'])
+        self.assertFalse(os.path.exists(path + '.checkpoint'))
+
+        # without --resume a checkpoint is ignored
+        with open(path + '.checkpoint', 'w') as f:
+            f.write('2\n')
+        stats = RateImporter(path).run()
+        self.assertEqual((stats.lines, stats.new, stats.unchanged), (3, 1, 2))
+        self.assertFalse(os.path.exists(path + '.checkpoint'))
+
+
+def old_lookup(zip, ext, date):
+    """TaxBoundry.lookup as it was, one query for each kind of boundry."""
+    if ext:
+        try:
+            return TaxBoundry.objects.get(recordType='4',
+                zipCodeLow__lte=zip, zipCodeHigh__gte=zip,
+                zipExtensionLow__lte=ext, zipExtensionHigh__gte=ext,
+                startDate__lte=date, endDate__gte=date)
+        except TaxBoundry.DoesNotExist:
+            pass
+    try:
+        return TaxBoundry.objects.get(recordType='Z',
+            zipCodeLow__lte=zip, zipCodeHigh__gte=zip,
+            startDate__lte=date, endDate__gte=date)
+    except TaxBoundry.DoesNotExist:
+        return None
+
+
+class LookupTest(TestCase):
+
+    def setUp(self):
+        def boundry(recordType, start, end, low=None, high=None):
+            return TaxBoundry.objects.create(recordType=recordType,
+                startDate=start, endDate=end,
+                zipCodeLow=66044, zipExtensionLow=low,
+                zipCodeHigh=66044, zipExtensionHigh=high,
+                fipsStateCode='20', fipsStateIndicator='20', fipsCountyCode='045')
+
+        self.old = date(2000, 1, 1)
+        self.expiry = date(2007, 12, 31)
+        self.current = date(2008, 1, 1)
+        self.forever = date(9999, 12, 31)
+        self.zip5 = boundry('Z', self.current, self.forever)
+        self.old_zip5 = boundry('Z', self.old, self.expiry)
+        self.wide = boundry('4', self.current, self.forever, 1, 500)
+        # inside the wide range, and expired
+        self.expired = boundry('4', self.old, self.expiry, 100, 199)
+        self.high = boundry('4', self.current, self.forever, 600, 699)
+
+        for fips, start, end, rate in (
+                ('20', self.old, self.forever, '0.0530000'),
+                ('045', self.old, self.expiry, '0.0100000'),
+                ('045', self.current, self.forever, '0.0125000')):
+            TaxRate.objects.create(state=20, jurisdictionType=0,
+                jurisdictionFipsCode=fips, startDate=start, endDate=end,
+                generalRateIntrastate=Decimal(rate), generalRateInterstate=Decimal(rate),
+                foodRateIntrastate=Decimal(rate), foodRateInterstate=Decimal(rate))
+
+    def testFind(self):
+        boundries = ZipBoundries(66044)
+        self.assertEqual(boundries.plus4_reach, [500, 500, 699])
+        today = date(2010, 6, 1)
+        then = date(2005, 6, 1)
+
+        self.assertEqual(boundries.find(50, today), self.wide)
+        # the expired range is passed over for the one around it
+        self.assertEqual(boundries.find(150, today), self.wide)
+        self.assertEqual(boundries.find(150, then), self.expired)
+        self.assertEqual(boundries.find(250, then), self.old_zip5)
+        self.assertEqual(boundries.find(650, today), self.high)
+        # covered by no Zip+4 range, the walk stops at the first one not
+        # reaching so far
+        self.assertEqual(boundries.find(550, today), self.zip5)
+        self.assertEqual(boundries.find(700, today), self.zip5)
+        # no extension
+        self.assertEqual(boundries.find(None, today), self.zip5)
+        self.assertEqual(boundries.find(None, then), self.old_zip5)
+        # before any boundry
+        self.assertEqual(boundries.find(150, date(1999, 1, 1)), None)
+
+        self.assertEqual(ZipBoundries(66045).find(150, today), None)
+
+    def testSameAsQueries(self):
+        for zip in (66043, 66044):
+            for ext in (None, 1, 99, 100, 150, 199, 200, 500, 501, 550, 600, 699, 700, 9999):
+                for day in (date(1999, 1, 1), self.old, date(2005, 6, 1), self.expiry,
+                        self.current, date(2010, 6, 1), self.forever):
+                    self.assertEqual(TaxBoundry.lookup(zip, ext, day), old_lookup(zip, ext, day),
+                        'zip %s-%s on %s' % (zip, ext, day))
+
+    def testRate(self):
+        rates = StateRates(20)
+        self.assertEqual(rates.rate('045', date(2005, 6, 1)).generalRateIntrastate, Decimal('0.0100000'))
+        self.assertEqual(rates.rate('045', self.expiry).generalRateIntrastate, Decimal('0.0100000'))
+        self.assertEqual(rates.rate('045', self.current).generalRateIntrastate, Decimal('0.0125000'))
+        self.assertRaises(TaxRate.DoesNotExist, rates.rate, '045', date(1999, 1, 1))
+        self.assertRaises(TaxRate.DoesNotExist, rates.rate, '38900', self.current)
+        self.assertRaises(TaxRate.DoesNotExist, StateRates(29).rate, '045', self.current)
+
+        for fips in ('20', '045', '38900'):
+            for day in (date(1999, 1, 1), self.old, self.expiry, self.current, self.forever):
+                try:
+                    expected = TaxRate.objects.get(state=20, jurisdictionFipsCode=fips,
+                        startDate__lte=day, endDate__gte=day)
+                except TaxRate.DoesNotExist:
+                    self.assertRaises(TaxRate.DoesNotExist, rates.rate, fips, day)
+                else:
+                    self.assertEqual(rates.rate(fips, day), expected)
+
+        # overlapping rates are an error, as they were with a query
+        TaxRate.objects.create(state=20, jurisdictionType=0,
+            jurisdictionFipsCode='045', startDate=date(2010, 1, 1), endDate=self.forever,
+            generalRateIntrastate=Decimal('0.02'), generalRateInterstate=Decimal('0.02'),
+            foodRateIntrastate=Decimal('0.02'), foodRateInterstate=Decimal('0.02'))
+        self.assertRaises(TaxRate.MultipleObjectsReturned, StateRates(20).rate, '045', date(2010, 6, 1))
+
+    def testPercentage(self):
+        boundry = TaxBoundry.lookup(66044, 150, date(2010, 6, 1))
+        self.assertEqual(boundry.get_percentage(date(2010, 6, 1)), Decimal('0.0655000'))
+        boundry = TaxBoundry.lookup(66044, 150, date(2005, 6, 1))
+        self.assertEqual(boundry.get_percentage(date(2005, 6, 1)), Decimal('0.0630000'))
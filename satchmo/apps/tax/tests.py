@@ -1,8 +1,10 @@
 from decimal import Decimal
+from django.core.signals import request_finished, request_started
 from django.test import TestCase
 from keyedcache import cache_delete
 from livesettings.functions import config_get
 from satchmo_store.shop.tests import make_test_order, make_order_payment
+from tax.utils import get_tax_context, get_tax_processor
 import logging
 log = logging.getLogger('tax.test')
 
@@ -84,6 +86,32 @@ class TaxTest(TestCase):
         self.assertEqual(tmain.tax, Decimal('16.00'))
         self.assertEqual(tship.tax, Decimal('0.00'))
 
+    def testAreaRatesRemembered(self):
+        """Test that the area tax module looks each rate up once"""
+        cache_delete()
+        tax = config_get('TAX','MODULE')
+        tax.update('tax.modules.area')
+
+        order = make_test_order('DE', '', include_non_taxed=True)
+        items = list(order.orderitem_set.select_related('product', 'product__taxClass'))
+        processor = get_tax_processor(order=order)
+        expected = [processor.by_orderitem(item) for item in items]
+        rate = processor.get_rate()
+
+        with self.assertNumQueries(0):
+            self.assertEqual(processor.by_orderitems(items), expected)
+            self.assertEqual(processor.get_rate(), rate)
+
+    def testTaxContextPerRequest(self):
+        """Test that tax lookups are only shared within a request"""
+        self.assertFalse(get_tax_context() is get_tax_context())
+        request_started.send(sender=self.__class__)
+        try:
+            self.assertTrue(get_tax_context() is get_tax_context())
+        finally:
+            request_finished.send(sender=self.__class__)
+        self.assertFalse(get_tax_context() is get_tax_context())
+
     def testDuplicateAdminAreas(self):
         """Test the situation where we have multiple adminareas with the same name"""
         cache_delete()
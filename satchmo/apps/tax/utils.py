@@ -1,9 +1,59 @@
+from django.core.signals import request_finished, request_started
 from livesettings.functions import config_value
-from satchmo_utils import load_module
+from satchmo_utils import is_string_like, load_module
 import decimal
+import threading
 
 TWOPLACES = decimal.Decimal('0.01')
 
+class TaxContext(object):
+    """
+    Remembers the locations, tax classes and rates which tax processors
+    looked up, so that taxing every line of a cart or order, or every
+    variation of a product, resolves each of them once.
+
+    Keys start with the tax module, and hold the location, tax class and
+    date the value was resolved for.
+    """
+
+    def __init__(self):
+        self._values = {}
+
+    def get(self, key, resolve):
+        """The value remembered for the key, calling `resolve()` the first time."""
+        try:
+            return self._values[key]
+        except KeyError:
+            value = self._values[key] = resolve()
+            return value
+
+_request = threading.local()
+
+def _request_started(**kwargs):
+    _request.context = TaxContext()
+
+def _request_finished(**kwargs):
+    _request.context = None
+
+request_started.connect(_request_started)
+request_finished.connect(_request_finished)
+
+def get_tax_context():
+    """The tax context of the request in progress, or a new one outside of a request."""
+    context = getattr(_request, 'context', None)
+    if context is None:
+        return TaxContext()
+    return context
+
+def taxclass_key(taxclass):
+    """A tax class or its title, as part of a TaxContext key.  Both give the
+    title, as the rates of a tax class are looked up by either."""
+    if taxclass is None:
+        return None
+    if is_string_like(taxclass):
+        return taxclass.lower()
+    return taxclass.title.lower()
+
 def get_tax_processor(order=None, user=None):
     modulename = config_value('TAX', 'MODULE')
     mod = load_module('%s.processor' % modulename)